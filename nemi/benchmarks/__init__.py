@@ -0,0 +1,11 @@
+'''
+Benchmarks for the NEMI export and search code paths. Each module can be run from the nemi directory,
+for example:
+
+    python -m benchmarks.bench_tsv_export --rows 500000
+
+benchmarks.suite times every results, export, summary, choice and sitemap page against a synthetic
+dataset generated by benchmarks.dataset and writes a JSON report which can be compared between commits:
+
+    python -m benchmarks.suite --database /tmp/nemi_bench.db --output report.json
+'''
@@ -0,0 +1,54 @@
+'''
+Measures the time to build an AnalyteIndex from synthetic analyte names and the mean time of prefix and
+substring searches against it.
+
+Usage (from the nemi directory):
+
+    python -m benchmarks.bench_analyte_index [--names N]
+'''
+import argparse
+import json
+import random
+import string
+import time
+import timeit
+
+import django
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(INSTALLED_APPS=['django.contrib.contenttypes', 'django.contrib.auth', 'common', 'reference', 'methods'])
+    django.setup()
+
+from methods.analyte_index import AnalyteIndex
+
+
+def synthetic_names(count, seed=1):
+    rnd = random.Random(seed)
+    words = [''.join(rnd.choice(string.ascii_lowercase) for _ in range(rnd.randint(3, 10))) for _ in range(2000)]
+    return ['%s %s' % (rnd.choice(words).capitalize(), rnd.choice(words)) for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--names', type=int, default=50000)
+    parser.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args()
+
+    names = synthetic_names(args.names)
+    start = time.perf_counter()
+    index = AnalyteIndex([(name, [name, str(i)]) for i, name in enumerate(names)])
+    build_time = time.perf_counter() - start
+
+    results = {'names' : args.names, 'build_time_s' : round(build_time, 3)}
+    for label, terms in (('prefix', [name[:3] for name in names[:200]]),
+                         ('substring', [name[2:6] for name in names[:200]]),
+                         ('two_characters', [name[1:3] for name in names[:200]])):
+        seconds = timeit.timeit(lambda: [index.search(term, args.limit) for term in terms], number=5)
+        results['%s_search_us' % label] = round(seconds / (5 * len(terms)) * 1e6, 1)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+'''
+Compares the analyte name lookups of the analyte results views on a synthetic method_analyte_all_vw held in an
+in-memory sqlite database. For 1, 10 and 100 selected analytes, it reports the mean time to run the query with
+
+    iregex          the (^name$|...) case insensitive regular expression previously used
+    view            the view's column matched with the whitespace insensitive regular expression of analyte_pattern
+    search_table    the indexed key column of the analyte search table matched with IN
+
+The view's analyte_name column is indexed, as the columns of the tables behind it are in Oracle.
+
+Usage (from the nemi directory):
+
+    python -m benchmarks.bench_analyte_lookup [--rows N] [--names N]
+'''
+import argparse
+import json
+import random
+import re
+import timeit
+
+import django
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(INSTALLED_APPS=['django.contrib.contenttypes', 'django.contrib.auth', 'common', 'reference', 'methods'],
+                       DATABASES={'default' : {'ENGINE' : 'django.db.backends.sqlite3', 'NAME' : ':memory:'}})
+    django.setup()
+
+from django.db import connection
+
+from common.models import MethodAnalyteSearch
+from methods.analyte_search import filter_analytes, refresh_analyte_search
+from methods.models import MethodAnalyteAllVW
+
+from .bench_analyte_index import synthetic_names
+
+
+def create_rows(row_count, names):
+    with connection.schema_editor() as editor:
+        editor.create_model(MethodAnalyteAllVW)
+        editor.create_model(MethodAnalyteSearch)
+        editor.execute('CREATE INDEX bench_analyte_name ON method_analyte_all_vw (analyte_name)')
+
+    rnd = random.Random(1)
+    rows = [MethodAnalyteAllVW(analyte_method_id=i, method_id=i // 10, method_source_id=1, source_citation_id=1,
+                               method_subcategory_id=1, analyte_id=i, analyte_name=rnd.choice(names),
+                               analyte_code=str(i), source_method_identifier='M%d' % (i // 10))
+            for i in range(row_count)]
+    MethodAnalyteAllVW.objects.bulk_create(rows)
+    refresh_analyte_search()
+
+
+def iregex(queryset, selected):
+    return queryset.filter(analyte_name__iregex=r'(' + '|'.join(['^' + re.escape(n) + '$' for n in selected]) + ')')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--names', type=int, default=5000)
+    parser.add_argument('--number', type=int, default=5)
+    args = parser.parse_args()
+
+    names = sorted(set(synthetic_names(args.names)))
+    create_rows(args.rows, names)
+
+    lookups = (
+        ('iregex', lambda selected: iregex(MethodAnalyteAllVW.objects.all(), selected)),
+        ('view', lambda selected: filter_analytes(MethodAnalyteAllVW.objects.all(), 'analyte_name', selected)),
+        ('search_table', lambda selected: filter_analytes(MethodAnalyteSearch.objects.all(), 'analyte_name', selected,
+                                                          search_table=True)),
+    )
+    results = {'rows' : args.rows, 'names' : len(names)}
+    rnd = random.Random(2)
+    for count in (1, 10, 100):
+        selected = [name.upper() for name in rnd.sample(names, count)]
+        counts = set()
+        for label, lookup in lookups:
+            counts.add(lookup(selected).count())
+            seconds = timeit.timeit(lambda: list(lookup(selected).values_list('method_id', 'analyte_name')),
+                                    number=args.number)
+            results['%s_%d_ms' % (label, count)] = round(seconds / args.number * 1000, 2)
+        # Every lookup must find the same rows
+        assert len(counts) == 1, counts
+        results['matches_%d' % count] = counts.pop()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
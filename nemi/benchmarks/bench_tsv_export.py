@@ -0,0 +1,118 @@
+'''
+Compares the streaming tsv_response with the previous implementation, which built the whole file in an
+in-memory HttpResponse after evaluating the query set. Each path is run in its own process so that
+the peak resident set size of one does not hide the other. Time to first byte is the time from the call
+until the first chunk of the response body is available.
+
+Usage (from the nemi directory):
+
+    python -m benchmarks.bench_tsv_export [--rows N]
+'''
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+import django
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure()
+    django.setup()
+
+from django.http import HttpResponse
+
+from common.utils.view_utils import tsv_response
+
+HEADINGS = ['Column %d' % i for i in range(28)]
+
+
+def synthetic_rows(count):
+    '''Generator which yields count rows shaped like a row of the analyte results export.'''
+    for i in range(count):
+        yield (i, 'Method descriptive name %d' % i, 'INORGANIC', 'CHEMICAL', 12, 'EPA', '300.%d' % i,
+               'Analyte name %d' % i, '14797-55-8', 'WATER', 'IC', 'Ion chromatography', '0.002', 'mg/L',
+               'MDL', 'Method detection limit', 'milligrams per liter', '98', '%', 'percent recovery',
+               '2.5', '%', 'percent relative standard deviation', None, None, '0.5',
+               'Notes\twith a tab', '$')
+
+
+def legacy_tsv_response(headings, vl_qs, filename):
+    '''The previous implementation of tsv_response.'''
+    response = HttpResponse(content_type='text/tab-separated-values')
+    response['Content-Disposition'] = ('attachment; filename=%s.tsv' % filename)
+
+    response.write('\t'.join(headings))
+    response.write('\n')
+
+    for row in vl_qs:
+        for col in row:
+            response.write('%s\t' % str(col))
+        response.write('\n')
+
+    return response
+
+
+def run_legacy(count):
+    start = time.perf_counter()
+    # The previous export views evaluated the query set before writing the file
+    response = legacy_tsv_response(HEADINGS, list(synthetic_rows(count)), 'legacy')
+    first_byte = time.perf_counter() - start
+    size = len(response.content)
+    return first_byte, time.perf_counter() - start, size
+
+
+def run_streaming(count):
+    start = time.perf_counter()
+    response = tsv_response(HEADINGS, synthetic_rows(count), 'streaming')
+    content = iter(response.streaming_content)
+    size = len(next(content))
+    first_byte = time.perf_counter() - start
+    for chunk in content:
+        size += len(chunk)
+    return first_byte, time.perf_counter() - start, size
+
+
+PATHS = {
+    'legacy': run_legacy,
+    'streaming': run_streaming,
+}
+
+
+def run_path(path, count, paths=PATHS):
+    '''Runs one of paths in this process and returns the measurements as a dictionary.'''
+    first_byte, total, size = paths[path](count)
+    return {
+        'path': path,
+        'rows': count,
+        'bytes': size,
+        'time_to_first_byte_s': round(first_byte, 4),
+        'total_time_s': round(total, 4),
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--path', choices=sorted(PATHS), help='Run a single path in this process')
+    args = parser.parse_args()
+
+    if args.path:
+        print(json.dumps(run_path(args.path, args.rows)))
+        return
+
+    results = []
+    for path in sorted(PATHS):
+        output = subprocess.check_output([sys.executable, '-m', 'benchmarks.bench_tsv_export',
+                                          '--rows', str(args.rows), '--path', path])
+        results.append(json.loads(output.decode('utf-8')))
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+'''
+Compares the streaming xlsx_response with the in-memory xlwt xls_response. The xls path is limited to
+65,535 data rows, so it is only run when --rows is within that limit. Each path is run in its own process.
+
+Usage (from the nemi directory):
+
+    python -m benchmarks.bench_xlsx_export [--rows N]
+'''
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+from benchmarks.bench_tsv_export import HEADINGS, run_path, synthetic_rows
+
+from common.utils.view_utils import xls_response, xlsx_response
+
+XLS_MAX_ROWS = 65535
+
+
+def run_xls(count):
+    start = time.perf_counter()
+    response = xls_response(HEADINGS, list(synthetic_rows(count)), 'xls')
+    first_byte = time.perf_counter() - start
+    return first_byte, time.perf_counter() - start, len(response.content)
+
+
+def run_xlsx(count):
+    start = time.perf_counter()
+    response = xlsx_response(HEADINGS, synthetic_rows(count), 'xlsx', numeric_columns=[12, 17, 20])
+    content = iter(response.streaming_content)
+    size = len(next(content))
+    first_byte = time.perf_counter() - start
+    for chunk in content:
+        size += len(chunk)
+    return first_byte, time.perf_counter() - start, size
+
+
+PATHS = {
+    'xls': run_xls,
+    'xlsx': run_xlsx,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=60000)
+    parser.add_argument('--path', choices=sorted(PATHS), help='Run a single path in this process')
+    args = parser.parse_args()
+
+    if args.path:
+        print(json.dumps(run_path(args.path, args.rows, PATHS)))
+        return
+
+    results = []
+    for path in sorted(PATHS):
+        if path == 'xls' and args.rows > XLS_MAX_ROWS:
+            continue
+        output = subprocess.check_output([sys.executable, '-m', 'benchmarks.bench_xlsx_export',
+                                          '--rows', str(args.rows), '--path', path])
+        results.append(json.loads(output.decode('utf-8')))
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
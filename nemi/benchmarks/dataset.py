@@ -0,0 +1,443 @@
+'''
+Generates a synthetic NEMI dataset for the benchmark suite. The tables are created from the models in the same
+way as ManagedModelTestRunner creates the test database, the reference tables are loaded from the common
+fixtures and the method tables and views are filled with generated rows whose shared columns agree with each
+other, so that every results, export and summary page finds consistent data.
+
+The generated data is determined by the seed. The number of analytes of each method and the number of methods
+of each source follow skewed distributions as they do in NEMI, so a few methods have hundreds of analytes.
+'''
+from collections import namedtuple
+import datetime
+import math
+import random
+
+from django.contrib.sites.models import Site
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import AutoField
+
+from common.models import DlRef, DlUnitsDom, InstrumentationRef, MediaNameDOM, Method, MethodSourceRef, \
+    MethodSubcategoryRef, MethodTypeRef, PublicationSourceRel, RelativeCostRef, SourceCitationRef, StatAnalysisRel, \
+    StatDesignRel, StatMediaRel, StatTopicRel, StatisticalAnalysisType, StatisticalDesignObjective, \
+    StatisticalSourceType, StatisticalTopics, WaterbodyTypeRef, AnalyteSummaryVW
+from methods.analyte_search import refresh_analyte_search
+from methods.models import AnalyteCodeVW, MethodAnalyteAllVW, MethodSummaryVW, MethodVW, RegQueryVW, \
+    RevisionSummaryVw
+from nemi_project.test_runner import table_models
+
+from .bench_analyte_index import synthetic_names
+
+FIXTURES = ('static_data.json', 'method_subcategory_ref.json', 'method_type_ref.json', 'method_source_ref.json',
+            'instrumentation_ref.json')
+
+STATISTICAL_SUBCATEGORY_IDS = (16, 17)
+
+# Columns which are read with raw sql but can't be modelled
+PDF_TABLES = ('method_summary_vw', 'revision_summary_vw')
+
+# The columns of the views which are indexed in the tables behind them
+INDEXES = (
+    ('method_analyte_all_vw', 'method_id'),
+    ('method_analyte_all_vw', 'analyte_name'),
+    ('method_analyte_all_vw', 'analyte_code'),
+    ('analyte_summary_vw', 'method_id'),
+    ('analyte_code_vw', 'analyte_analyte_code'),
+    ('revision_summary_vw', 'method_id'),
+    ('reg_query_vw', 'method_id'),
+    ('reg_query_vw', 'analyte_name'),
+)
+
+DL_TYPES = ((1, 'MDL', 'Method detection limit'),
+            (2, 'LOQ', 'Limit of quantitation'),
+            (3, 'EDL', 'Estimated detection limit'),
+            (4, 'IDL', 'Instrument detection limit'))
+DL_UNITS = (('ug/L', 'micrograms per liter'), ('mg/L', 'milligrams per liter'), ('ng/L', 'nanograms per liter'),
+            ('pCi/L', 'picocuries per liter'))
+RELATIVE_COSTS = ((1, '$', 'Less than $50', '1'),
+                  (2, '$$', '$50 to $200', '2'),
+                  (3, '$$$', '$201 to $400', '3'),
+                  (4, '$$$$', 'Greater than $400', '4'))
+WATERBODY_TYPES = ('Lake', 'River/Stream', 'Wetland', 'Estuary')
+MATRICES = ('', '', 'Freshwater', 'Saltwater', 'Both')
+ANALYTE_TYPES = ('Chemical', 'Microbiological', 'Physical', 'Radiochemical')
+REGULATIONS = (('CWA', 'Clean Water Act', '40 CFR 136'),
+               ('SDWA', 'Safe Drinking Water Act', '40 CFR 141'),
+               ('RCRA', 'Resource Conservation and Recovery Act', 'SW-846'))
+COMPLEXITIES = ('Low', 'Medium', 'High')
+WORDS = ('sample', 'water', 'analysis', 'extraction', 'column', 'detector', 'standard', 'calibration', 'blank',
+         'digestion', 'filtration', 'reagent', 'solvent', 'concentration', 'spike', 'recovery', 'measured',
+         'instrument', 'holding', 'preserved', 'acidified', 'temperature', 'interference', 'method', 'quality')
+
+Analyte = namedtuple('Analyte', 'analyte_id code name synonyms analyte_type')
+
+
+def create_schema():
+    '''Creates a table for each model, the pdf columns and the indexes of the views.'''
+    with connection.schema_editor() as editor:
+        for model in table_models().values():
+            # Many to many tables are created with the model which declares them
+            if not model._meta.auto_created:
+                editor.create_model(model)
+        for table in PDF_TABLES:
+            editor.execute('ALTER TABLE %s ADD COLUMN method_pdf BLOB' % table)
+        for table, column in INDEXES:
+            editor.execute('CREATE INDEX bench_%s_%s ON %s (%s)' % (table, column, table, column))
+
+
+def _instance(model, values):
+    '''Returns an instance of model with the fields named in values set. Other fields which can't be null and have
+    no default are given empty values. Empty strings are saved as null in foreign keys.
+    '''
+    kwargs = {}
+    for field in model._meta.concrete_fields:
+        if field.attname in values:
+            kwargs[field.attname] = values[field.attname]
+        elif field.name in values:
+            kwargs[field.attname] = values[field.name]
+            if field.is_relation and kwargs[field.attname] == '':
+                kwargs[field.attname] = None
+        elif not (field.null or field.has_default() or isinstance(field, AutoField)):
+            kwargs[field.attname] = _EMPTY_VALUES.get(field.get_internal_type(), '')
+    return model(**kwargs)
+
+_EMPTY_VALUES = {
+    'IntegerField' : 0,
+    'FloatField' : 0,
+    'DecimalField' : 0,
+    'BooleanField' : False,
+    'DateField' : datetime.date(2000, 1, 1),
+}
+
+
+class DatasetGenerator(object):
+    '''Fills the schema with methods methods, analyte_rows rows of method_analyte_all_vw and pdfs revision pdfs
+    whose sizes are spread log uniformly over pdf_sizes bytes.
+    '''
+
+    def __init__(self, methods=20000, analyte_rows=500000, pdfs=100, pdf_sizes=(10 * 1024, 4 * 1024 * 1024),
+                 seed=1, batch_size=2000):
+        self.method_count = methods
+        self.analyte_row_count = analyte_rows
+        self.pdf_count = pdfs
+        self.pdf_sizes = pdf_sizes
+        self.seed = seed
+        self.batch_size = batch_size
+        self.rnd = random.Random(seed)
+
+    def _bulk_create(self, model, rows):
+        '''Saves the instances made from the value dictionaries in rows, batch_size at a time.'''
+        batch = []
+        for values in rows:
+            batch.append(_instance(model, values))
+            if len(batch) == self.batch_size:
+                model.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            model.objects.bulk_create(batch)
+
+    def _text(self, min_words, max_words):
+        return ' '.join(self.rnd.choice(WORDS) for _ in range(self.rnd.randint(min_words, max_words))).capitalize()
+
+    def _skewed_choice(self, choices):
+        '''Returns an item of choices, favouring those near the front as NEMI's methods favour a few sources.'''
+        return choices[min(int(self.rnd.paretovariate(1.0)) - 1, len(choices) - 1)]
+
+    def create_references(self):
+        call_command('loaddata', *FIXTURES, verbosity=0)
+        Site.objects.update_or_create(pk=1, defaults={'domain' : 'nemi.test', 'name' : 'NEMI'})
+
+        self._bulk_create(DlRef, ({'dl_type_id' : i, 'dl_type' : t, 'dl_type_description' : d}
+                                  for i, t, d in DL_TYPES))
+        self._bulk_create(DlUnitsDom, ({'dl_units' : u, 'dl_units_description' : d} for u, d in DL_UNITS))
+        self._bulk_create(RelativeCostRef, ({'relative_cost_id' : i, 'relative_cost_symbol' : s, 'relative_cost' : c,
+                                             'cost_effort_key' : k} for i, s, c, k in RELATIVE_COSTS))
+        self._bulk_create(WaterbodyTypeRef, ({'waterbody_type_id' : i, 'waterbody_type_desc' : d}
+                                             for i, d in enumerate(WATERBODY_TYPES)))
+
+        self.subcategories = list(MethodSubcategoryRef.objects.order_by('method_subcategory_id'))
+        self.sources = list(MethodSourceRef.objects.order_by('method_source_id'))
+        self.rnd.shuffle(self.sources)
+        self.instruments = list(InstrumentationRef.objects.order_by('instrumentation_id'))
+        self.rnd.shuffle(self.instruments)
+        self.method_types = list(MethodTypeRef.objects.order_by('method_type_id'))
+        self.media_names = list(MediaNameDOM.objects.order_by('media_name').values_list('media_name', flat=True))
+        self.source_types = list(StatisticalSourceType.objects.values_list('pk', flat=True))
+        self.analysis_types = list(StatisticalAnalysisType.objects.values_list('pk', flat=True))
+        self.objectives = list(StatisticalDesignObjective.objects.values_list('pk', flat=True))
+        self.topics = list(StatisticalTopics.objects.values_list('pk', flat=True))
+
+        # A citation for each source volume, roughly one for every 40 methods
+        self.citations = []
+        for citation_id in range(1, max(self.method_count // 40, 10) + 1):
+            self.citations.append({
+                'source_citation_id' : citation_id,
+                'source_citation' : 'CIT_%d' % citation_id,
+                'source_citation_name' : 'Citation %d' % citation_id,
+                'source_citation_information' : self._text(5, 20),
+                'title' : self._text(3, 10),
+                'author' : 'Author %d' % self.rnd.randint(1, 500),
+                'publication_year' : self.rnd.randint(1970, 2020),
+                # The table's item_type_id is the float column of reference.SourceCitationRef, which sqlite
+                # can't match with the integer key of statistical_item_type, so it is left null
+                'item_type_id' : None,
+                'citation_type' : 'PROTOCOL' if citation_id % 25 == 0 else '',
+                'update_date' : datetime.date(2020, 1, 1),
+            })
+        self._bulk_create(SourceCitationRef, self.citations)
+        self._bulk_create(PublicationSourceRel, ({'source_citation_ref_id' : c['source_citation_id'],
+                                                  'source_id' : self.rnd.choice(self.source_types)}
+                                                 for c in self.citations))
+
+    def create_analytes(self):
+        '''Creates the analytes, each with its preferred name and up to three synonyms.'''
+        names = sorted(set(synthetic_names(max(self.analyte_row_count // 100, 1000), seed=self.seed)))
+        self.rnd.shuffle(names)
+        self.analytes = []
+        position = 0
+        analyte_id = 0
+        while position < len(names):
+            synonym_count = self.rnd.choice((0, 0, 1, 1, 2, 3))
+            analyte_id += 1
+            self.analytes.append(Analyte(analyte_id, 'A%06d' % analyte_id, names[position],
+                                         names[position + 1:position + 1 + synonym_count],
+                                         self.rnd.choice(ANALYTE_TYPES)))
+            position += 1 + synonym_count
+
+        def code_rows():
+            row_id = 0
+            for analyte in self.analytes:
+                for preferred, name in [(-1, analyte.name)] + [(0, s) for s in analyte.synonyms]:
+                    row_id += 1
+                    yield {'analyte_analyte_id' : row_id,
+                           'analyte_analyte_code' : analyte.code,
+                           'ac_analyte_code' : analyte.code,
+                           'ac_analyte_name' : name,
+                           'ac_preferred' : preferred,
+                           'ac_analyte_type' : analyte.analyte_type}
+        self._bulk_create(AnalyteCodeVW, code_rows())
+
+    def _method_values(self, method_id):
+        '''Returns the dictionary of the columns shared by the method tables and views for method_id.'''
+        rnd = self.rnd
+        if rnd.random() < 0.1:
+            subcategory = rnd.choice([s for s in self.subcategories
+                                      if s.method_subcategory_id in STATISTICAL_SUBCATEGORY_IDS])
+        else:
+            subcategory = rnd.choice([s for s in self.subcategories
+                                      if s.method_subcategory_id not in STATISTICAL_SUBCATEGORY_IDS])
+        source = self._skewed_choice(self.sources)
+        instrument = self._skewed_choice(self.instruments)
+        method_type = rnd.choice(self.method_types)
+        citation = self._skewed_choice(self.citations)
+        dl_type = rnd.choice(DL_TYPES)
+        cost = rnd.choice(RELATIVE_COSTS)
+        media_name = rnd.choice(self.media_names)
+        loaded = datetime.date(2000, 1, 1) + datetime.timedelta(days=rnd.randint(0, 7000))
+        is_statistical = subcategory.method_subcategory_id in STATISTICAL_SUBCATEGORY_IDS
+        return {
+            'method_id' : method_id,
+            'source_method_identifier' : '%s %d.%d' % (source.method_source, 100 + method_id // 10, method_id % 10),
+            'method_descriptive_name' : '%s in %s by %s' % (self._text(1, 3), media_name.lower(),
+                                                           instrument.instrumentation),
+            'method_official_name' : self._text(4, 12),
+            'method_source_id' : source.method_source_id,
+            'method_source' : source.method_source,
+            'method_source_name' : source.method_source_name,
+            'method_source_contact' : source.method_source_contact,
+            'method_source_url' : source.method_source_url,
+            'source_citation_id' : citation['source_citation_id'],
+            'source_citation' : citation['source_citation'],
+            'source_citation_name' : citation['source_citation_name'],
+            'source_citation_information' : citation['source_citation_information'],
+            'brief_method_summary' : self._text(20, 120),
+            'scope_and_application' : self._text(5, 40),
+            'media_name' : media_name,
+            'dl_type_id' : dl_type[0],
+            'dl_type' : dl_type[1],
+            'dl_type_description' : dl_type[2],
+            'dl_note' : self._text(3, 20),
+            'applicable_conc_range' : '%d - %d' % (rnd.randint(0, 10), rnd.randint(11, 1000)),
+            'interferences' : self._text(5, 60),
+            'qc_requirements' : self._text(3, 20),
+            'sample_handling' : self._text(3, 20),
+            'max_holding_time' : '%d days' % rnd.randint(1, 180),
+            'relative_cost_id' : cost[0],
+            'relative_cost_symbol' : cost[1],
+            'relative_cost' : cost[2],
+            'cost_effort_key' : cost[3],
+            'instrumentation_id' : instrument.instrumentation_id,
+            'instrumentation' : instrument.instrumentation,
+            'instrumentation_description' : instrument.instrumentation_description,
+            'method_subcategory_id' : subcategory.method_subcategory_id,
+            'method_category' : subcategory.method_category,
+            'method_subcategory' : subcategory.method_subcategory,
+            'method_type_id' : method_type.method_type_id,
+            'method_type_desc' : method_type.method_type_desc,
+            'waterbody_type' : rnd.choice(WATERBODY_TYPES) if subcategory.method_category == 'BIOLOGICAL' else '',
+            'matrix' : rnd.choice(MATRICES),
+            'regs_only' : 'Y' if rnd.random() < 0.02 else 'N',
+            'cbr_only' : 'N',
+            'sam_complexity' : rnd.choice(COMPLEXITIES) if is_statistical else '',
+            'author' : 'Author %d' % rnd.randint(1, 500),
+            'publication_year' : rnd.randint(1970, 2020),
+            'date_loaded' : loaded,
+            'last_update_date' : loaded,
+            'approved' : 'Y',
+            'approved_date' : loaded,
+        }
+
+    def create_methods(self):
+        '''Creates the methods and their revisions. Returns the list of method value dictionaries.'''
+        methods = [self._method_values(method_id) for method_id in range(1, self.method_count + 1)]
+
+        revisions = []
+        for method in methods:
+            for number in range(self.rnd.choice((1, 1, 1, 2, 3))):
+                revision_date = method['date_loaded'] + datetime.timedelta(days=30 * number)
+                revisions.append({'revision_id' : len(revisions) + 1,
+                                  'method_id' : method['method_id'],
+                                  'revision_information' : 'Revision %d' % (number + 1),
+                                  'revision_flag' : 1,
+                                  'mimetype' : 'application/pdf',
+                                  'insert_date' : revision_date,
+                                  'insert_person_name' : 'loader',
+                                  'last_update_date' : revision_date,
+                                  'last_update_person_name' : 'loader',
+                                  'pdf_insert_person' : 'loader',
+                                  'pdf_insert_date' : revision_date,
+                                  'date_loaded' : method['date_loaded']})
+            method['revision_id'] = revisions[-1]['revision_id']
+            method['revision_information'] = revisions[-1]['revision_information']
+            method['mimetype'] = 'application/pdf'
+
+        self._bulk_create(Method, methods)
+        self._bulk_create(MethodVW, methods)
+        self._bulk_create(MethodSummaryVW, methods)
+        self._bulk_create(RevisionSummaryVw, revisions)
+        self.create_statistical_relations([m for m in methods
+                                           if m['method_subcategory_id'] in STATISTICAL_SUBCATEGORY_IDS])
+        return methods
+
+    def create_statistical_relations(self, methods):
+        rnd = self.rnd
+        for model, field, choices in ((StatAnalysisRel, 'analysis_type_id', self.analysis_types),
+                                      (StatDesignRel, 'design_objective_id', self.objectives),
+                                      (StatTopicRel, 'topic_id', self.topics),
+                                      (StatMediaRel, 'media_name_id', self.media_names)):
+            self._bulk_create(model, ({'method_id' : m['method_id'], field : choice}
+                                      for m in methods
+                                      for choice in rnd.sample(choices, rnd.randint(1, min(3, len(choices))))))
+
+    def _analyte_counts(self, methods):
+        '''Returns the number of analyte rows of each method, which sum to analyte_rows.'''
+        weights = [self.rnd.paretovariate(1.2) for _ in methods]
+        total = sum(weights)
+        counts = [max(1, int(w / total * self.analyte_row_count)) for w in weights]
+        # Give the remainder to the first methods so that the total is exact
+        remainder = self.analyte_row_count - sum(counts)
+        i = 0
+        while remainder != 0:
+            step = 1 if remainder > 0 else -1
+            if counts[i % len(counts)] + step >= 1:
+                counts[i % len(counts)] += step
+                remainder -= step
+            i += 1
+        return counts
+
+    def create_analyte_rows(self, methods):
+        '''Creates the rows of method_analyte_all_vw, analyte_summary_vw and reg_query_vw for the methods which
+        are not statistical.
+        '''
+        methods = [m for m in methods if m['method_subcategory_id'] not in STATISTICAL_SUBCATEGORY_IDS]
+        rnd = self.rnd
+        regulated = set(m['method_id'] for m in rnd.sample(methods, len(methods) // 20))
+        reg_rows = []
+
+        def rows():
+            analyte_method_id = 0
+            for method, count in zip(methods, self._analyte_counts(methods)):
+                for _ in range(count):
+                    analyte = self._skewed_choice(self.analytes) if rnd.random() < 0.3 else rnd.choice(self.analytes)
+                    # Some rows are named by a synonym rather than the preferred name
+                    preferred = -1
+                    name = analyte.name
+                    if analyte.synonyms and rnd.random() < 0.1:
+                        preferred = 0
+                        name = rnd.choice(analyte.synonyms)
+                    dl_units = rnd.choice(DL_UNITS)
+                    analyte_method_id += 1
+                    row = dict(method)
+                    row.update({
+                        'analyte_method_id' : analyte_method_id,
+                        'analyte_id' : analyte.analyte_id,
+                        'analyte_code' : analyte.code,
+                        'analyte_name' : name,
+                        'analyte_type' : analyte.analyte_type,
+                        'preferred' : preferred,
+                        'dl_value' : round(rnd.uniform(0.001, 100), 3),
+                        'dl_units' : dl_units[0],
+                        'dl_units_description' : dl_units[1],
+                        'accuracy' : round(rnd.uniform(70, 130), 1),
+                        'accuracy_units' : '% recovery',
+                        'precision' : round(rnd.uniform(0, 30), 1),
+                        'precision_units' : '% RSD',
+                        'prec_acc_conc_used' : round(rnd.uniform(1, 50), 2),
+                        'precision_descriptor_notes' : method['dl_note'],
+                    })
+                    # reg_query_vw's key is the revision, so each regulated method has one row
+                    if method['method_id'] in regulated:
+                        regulated.remove(method['method_id'])
+                        regulation = rnd.choice(REGULATIONS)
+                        reg_row = dict(row)
+                        reg_row.update({'regulation' : regulation[0],
+                                        'regulation_name' : regulation[1],
+                                        'reg_location' : regulation[2],
+                                        'analyte_revision_id' : analyte_method_id})
+                        reg_rows.append(reg_row)
+                    yield row
+
+        batch = []
+        for row in rows():
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                self._bulk_create(MethodAnalyteAllVW, batch)
+                self._bulk_create(AnalyteSummaryVW, batch)
+                batch = []
+        self._bulk_create(MethodAnalyteAllVW, batch)
+        self._bulk_create(AnalyteSummaryVW, batch)
+        self._bulk_create(RegQueryVW, reg_rows)
+        refresh_analyte_search()
+
+    def create_pdfs(self, methods):
+        '''Stores pdfs of varying sizes for the latest revisions of pdf_count methods. Returns the list of
+        (revision_id, size) of the pdfs.
+        '''
+        low, high = (math.log(size) for size in self.pdf_sizes)
+        pdfs = []
+        with connection.cursor() as cursor:
+            for method in self.rnd.sample(methods, min(self.pdf_count, len(methods))):
+                size = int(math.exp(self.rnd.uniform(low, high)))
+                content = b'%PDF-1.4\n' + self.rnd.getrandbits(8 * size).to_bytes(size, 'little')
+                cursor.execute('UPDATE revision_summary_vw SET method_pdf = %s WHERE revision_id = %s',
+                               [content, method['revision_id']])
+                cursor.execute('UPDATE method_summary_vw SET method_pdf = %s WHERE method_id = %s',
+                               [content, method['method_id']])
+                pdfs.append((method['revision_id'], len(content)))
+        return pdfs
+
+    def generate(self):
+        '''Fills the schema. Returns a dictionary describing the dataset.'''
+        with transaction.atomic():
+            self.create_references()
+            self.create_analytes()
+            methods = self.create_methods()
+            self.create_analyte_rows(methods)
+            pdfs = self.create_pdfs(methods)
+
+        return {'methods' : self.method_count,
+                'analyte_rows' : self.analyte_row_count,
+                'analytes' : len(self.analytes),
+                'pdfs' : len(pdfs),
+                'pdf_bytes' : sum(size for _, size in pdfs),
+                'seed' : self.seed}
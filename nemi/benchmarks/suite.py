@@ -0,0 +1,333 @@
+'''
+Times the NEMI pages against a synthetic dataset and writes a JSON report which can be compared with the report
+of another commit. The dataset is generated by benchmarks.dataset into a sqlite database, which is kept between
+runs when --database is given and was generated with the same options.
+
+Each scenario is requested through the django test client, so the middleware, views and templates all run. The
+caches are cleared before the first request of a scenario, which is reported as first_ms. The remaining requests
+give the median_ms, min_ms and max_ms. The number of queries and the size of the response are those of the last
+request.
+
+Usage (from the nemi directory):
+
+    python -m benchmarks.suite [--methods N] [--analyte-rows N] [--pdfs N] [--repeat N] [--only GROUP ...]
+                               [--database PATH] [--output report.json] [--compare previous.json]
+
+With --compare, the median of each scenario is compared with the previous report and scenarios which are more
+than --threshold and --min-ms slower are listed as regressions. The exit status is 1 if there are any regressions.
+'''
+import argparse
+from collections import namedtuple
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+Scenario = namedtuple('Scenario', 'name group method path data')
+
+GROUPS = ('results', 'exports', 'summaries', 'pdfs', 'choices', 'sitemaps', 'api')
+
+# The number of methods exported, which keeps the form below DATA_UPLOAD_MAX_NUMBER_FIELDS
+EXPORT_METHODS = 500
+
+
+def _dataset_options(args):
+    return {'methods' : args.methods,
+            'analyte_rows' : args.analyte_rows,
+            'pdfs' : args.pdfs,
+            'seed' : args.seed}
+
+
+def setup_django(database):
+    '''Configures django to use the sqlite database at path, database. The raw sql of the pdf views reads from the
+    nemi_data schema, so the database is also attached as nemi_data.
+    '''
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nemi_project.settings.dev')
+    os.environ.setdefault('SECRET_KEY', 'benchmarks')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(database)
+
+    import django
+    django.setup()
+
+    from django.db.backends.signals import connection_created
+
+    def attach_nemi_data(sender, connection, **kwargs):
+        connection.cursor().execute('ATTACH DATABASE %s AS nemi_data', [os.path.abspath(database)])
+
+    connection_created.connect(attach_nemi_data, weak=False)
+
+
+def prepare_dataset(database, options):
+    '''Generates the dataset into database unless it already holds a dataset generated with options. Returns the
+    description of the dataset.
+    '''
+    from .dataset import DatasetGenerator, create_schema
+
+    description_path = database + '.json'
+    if os.path.exists(database) and os.path.exists(description_path):
+        with open(description_path) as f:
+            description = json.load(f)
+        if description.get('options') == options:
+            return description
+
+        os.remove(database)
+
+    start = time.perf_counter()
+    create_schema()
+    description = DatasetGenerator(**options).generate()
+    description['options'] = options
+    description['generate_seconds'] = round(time.perf_counter() - start, 1)
+    with open(description_path, 'w') as f:
+        json.dump(description, f, indent=2)
+    return description
+
+
+def get_scenarios():
+    '''Returns the list of scenarios, choosing their parameters from the dataset.'''
+    from django.db import connection
+    from django.db.models import Count
+    from django.urls import reverse
+
+    from common.models import StatAnalysisRel, StatDesignRel
+    from methods.models import MethodAnalyteAllVW, MethodVW, RegQueryVW
+
+    names = list(MethodAnalyteAllVW.objects.values('analyte_name').annotate(rows=Count('analyte_method_id')).order_by(
+        '-rows', 'analyte_name').values_list('analyte_name', flat=True)[:10])
+    instrumentation_id = MethodVW.objects.values('instrumentation_id').annotate(rows=Count('method_id')).order_by(
+        '-rows').values_list('instrumentation_id', flat=True)[0]
+    media_name = MethodVW.objects.order_by('method_id').values_list('media_name', flat=True)[0]
+    method_ids = list(MethodVW.objects.filter(method_category='CHEMICAL').order_by('method_id').values_list(
+        'method_id', flat=True)[:EXPORT_METHODS])
+    analyte_method_ids = list(MethodAnalyteAllVW.objects.filter(analyte_name=names[0]).order_by(
+        'method_id').values_list('method_id', flat=True).distinct()[:EXPORT_METHODS])
+    statistical_ids = list(MethodVW.objects.filter(method_category='STATISTICAL').order_by('method_id').values_list(
+        'method_id', flat=True)[:EXPORT_METHODS])
+    analysis_type = StatAnalysisRel.objects.order_by('pk').values_list('analysis_type_id', flat=True)[0]
+    design_objective = StatDesignRel.objects.order_by('pk').values_list('design_objective_id', flat=True)[0]
+    reg_name = RegQueryVW.objects.order_by('revision_id').values_list('analyte_name', flat=True)[0]
+    reg_method_ids = list(RegQueryVW.objects.filter(analyte_name=reg_name).values_list('method_id', flat=True))
+    analyte_counts = MethodAnalyteAllVW.objects.values('method_id').annotate(rows=Count('analyte_method_id'))
+    largest_method_id = analyte_counts.order_by('-rows', 'method_id')[0]['method_id']
+    smallest_method_id = analyte_counts.order_by('rows', 'method_id')[0]['method_id']
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT revision_id FROM revision_summary_vw WHERE method_pdf IS NOT NULL '
+                       'ORDER BY length(method_pdf), revision_id')
+        pdf_revision_ids = [row[0] for row in cursor.fetchall()]
+
+    results = reverse('methods-results')
+    analyte_results = reverse('methods-analyte_results')
+    statistical_results = reverse('methods-statistical_results')
+    regulatory_query = '?' + urlencode({'analyte_name' : reg_name})
+    analyte_query = '?' + urlencode({'analyte_name' : names[0]})
+    scenarios = [
+        Scenario('results_all', 'results', 'get', results, {}),
+        Scenario('results_category', 'results', 'get', results, {'category' : 'CHEMICAL'}),
+        Scenario('results_media_instrumentation', 'results', 'get', results,
+                 {'media_name' : media_name, 'instrumentation' : instrumentation_id}),
+        Scenario('results_json_page', 'results', 'get', results, {'format' : 'json', 'page_size' : 1000}),
+        Scenario('analyte_results_name', 'results', 'get', analyte_results, {'analyte_name' : names[0]}),
+        Scenario('analyte_results_ten_names', 'results', 'get', analyte_results, {'analyte_name' : names}),
+        Scenario('analyte_results_type', 'results', 'get', analyte_results, {'analyte_type' : 'Chemical'}),
+        Scenario('statistical_results_all', 'results', 'get', statistical_results, {'category' : 'STATISTICAL'}),
+        Scenario('statistical_results_filtered', 'results', 'get', statistical_results,
+                 {'analysis_type' : analysis_type, 'study_objective' : design_objective}),
+        Scenario('regulatory_results', 'results', 'get', reverse('methods-regulatory_results') + regulatory_query,
+                 {}),
+        Scenario('browse_methods', 'results', 'get', reverse('methods-browse'), {}),
+
+        Scenario('export_results_tsv', 'exports', 'post', reverse('methods-export_results'),
+                 {'export' : 'tsv', 'method_id' : method_ids}),
+        Scenario('export_results_xlsx', 'exports', 'post', reverse('methods-export_results'),
+                 {'export' : 'xlsx', 'method_id' : method_ids}),
+        Scenario('export_results_xls', 'exports', 'post', reverse('methods-export_results'),
+                 {'export' : 'xls', 'method_id' : method_ids}),
+        Scenario('export_analyte_results_tsv', 'exports', 'post',
+                 reverse('methods-export_analyte_results') + analyte_query,
+                 {'export' : 'tsv', 'method_id' : analyte_method_ids}),
+        Scenario('export_statistical_results_tsv', 'exports', 'post', reverse('methods-export_statistical_results'),
+                 {'export' : 'tsv', 'method_id' : statistical_ids}),
+        Scenario('export_regulatory_results_tsv', 'exports', 'post',
+                 reverse('methods-export_regulatory_results') + regulatory_query,
+                 {'export' : 'tsv', 'method_id' : reg_method_ids}),
+        Scenario('export_method_analytes', 'exports', 'get',
+                 reverse('methods-method_analyte_export', args=[largest_method_id]), {}),
+
+        Scenario('method_summary_most_analytes', 'summaries', 'get',
+                 reverse('methods-method_summary', args=[largest_method_id]), {}),
+        Scenario('method_summary_one_analyte', 'summaries', 'get',
+                 reverse('methods-method_summary', args=[smallest_method_id]), {}),
+        Scenario('statistical_method_summary', 'summaries', 'get',
+                 reverse('methods-sam_method_summary', args=[statistical_ids[0]]), {}),
+
+        Scenario('choice_analyte_select', 'choices', 'get', reverse('methods-analyte_select'),
+                 {'selection' : names[0][:3]}),
+        Scenario('choice_analyte_category', 'choices', 'get', reverse('methods-analyte_select'),
+                 {'category' : 'CHEMICAL'}),
+        Scenario('choice_method_count', 'choices', 'get', reverse('methods-method_count'), {}),
+    ]
+
+    # The method pdf view's outer join is Oracle only, so only the revision pdfs are timed
+    if pdf_revision_ids:
+        scenarios.append(Scenario('revision_pdf_smallest', 'pdfs', 'get',
+                                  reverse('revision-pdf', args=[pdf_revision_ids[0]]), {}))
+        scenarios.append(Scenario('revision_pdf_largest', 'pdfs', 'get',
+                                  reverse('revision-pdf', args=[pdf_revision_ids[-1]]), {}))
+
+    for url_name in ('media_name', 'source', 'instrumentation', 'method_types', 'subcategories', 'gear_types',
+                     'stat_objectives', 'stat_item_types', 'stat_analysis_types', 'stat_publication_source',
+                     'stat_media_emphasized', 'stat_special_topics'):
+        scenarios.append(Scenario('choice_' + url_name, 'choices', 'get', reverse('methods-' + url_name), {}))
+
+    scenarios.append(Scenario('facet_counts', 'choices', 'get', reverse('methods-facet_counts'),
+                              {'category' : 'CHEMICAL', 'media_name' : 'WATER'}))
+
+    scenarios.extend([
+        Scenario('sitemap_index', 'sitemaps', 'get', reverse('sitemap_index'), {}),
+        Scenario('sitemap_methods_page', 'sitemaps', 'get', reverse('sitemap_page', kwargs={'name' : 'methods-1'}),
+                 {}),
+        Scenario('api_methods', 'api', 'get', reverse('method-list'), {'format' : 'json'}),
+        Scenario('api_method_detail', 'api', 'get', reverse('method-detail', args=[method_ids[0]]),
+                 {'format' : 'json'}),
+        Scenario('api_dump', 'api', 'get', reverse('methods-dump'), {}),
+        Scenario('api_dump_gzip', 'api', 'get', reverse('methods-dump'), {'gzip' : 'true'}),
+    ])
+    return scenarios
+
+
+def _request(client, scenario):
+    '''Makes the request of scenario and reads its content. Returns the response and the content.'''
+    response = getattr(client, scenario.method)(scenario.path, scenario.data)
+    if response.streaming:
+        content = b''.join(response.streaming_content)
+    else:
+        content = response.content
+    return response, content
+
+
+def run_scenario(client, scenario, repeat):
+    '''Returns the timings of scenario requested repeat times after a first request with cleared caches.'''
+    from django.core.cache import caches
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    for cache in caches.all():
+        cache.clear()
+
+    times = []
+    for _ in range(repeat + 1):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response, content = _request(client, scenario)
+            times.append(time.perf_counter() - start)
+
+    return {'group' : scenario.group,
+            'path' : scenario.path,
+            'status' : response.status_code,
+            'first_ms' : round(times[0] * 1000, 2),
+            'median_ms' : round(statistics.median(times[1:]) * 1000, 2),
+            'min_ms' : round(min(times[1:]) * 1000, 2),
+            'max_ms' : round(max(times[1:]) * 1000, 2),
+            'queries' : len(queries),
+            'bytes' : len(content)}
+
+
+def run(scenarios, repeat):
+    from django.test import Client
+
+    client = Client()
+    results = {}
+    for scenario in scenarios:
+        results[scenario.name] = run_scenario(client, scenario, repeat)
+        print('%-40s %10.2f ms' % (scenario.name, results[scenario.name]['median_ms']), file=sys.stderr)
+    return results
+
+
+def compare(previous, current, threshold, min_ms=1.0):
+    '''Returns a list of (name, previous median, current median, ratio, regressed) for each scenario in both
+    reports. A scenario has regressed if its median is more than threshold, a fraction, and min_ms milliseconds
+    slower, so that the noise of the fastest scenarios is ignored.
+    '''
+    rows = []
+    for name, result in sorted(current['scenarios'].items()):
+        before = previous['scenarios'].get(name)
+        if before is None:
+            continue
+        ratio = result['median_ms'] / before['median_ms'] if before['median_ms'] else float('inf')
+        regressed = ratio > 1 + threshold and result['median_ms'] - before['median_ms'] > min_ms
+        rows.append((name, before['median_ms'], result['median_ms'], ratio, regressed))
+    return rows
+
+
+def _commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--methods', type=int, default=20000)
+    parser.add_argument('--analyte-rows', type=int, default=500000)
+    parser.add_argument('--pdfs', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', nargs='+', choices=GROUPS, help='only run the scenarios in these groups')
+    parser.add_argument('--database', help='sqlite database file to generate or reuse')
+    parser.add_argument('--output', help='file to write the report to, rather than stdout')
+    parser.add_argument('--compare', help='report of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='fraction by which a scenario must be slower to be a regression')
+    parser.add_argument('--min-ms', type=float, default=1.0,
+                        help='milliseconds by which a scenario must be slower to be a regression')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='nemi_benchmarks')
+    database = args.database or os.path.join(work_dir, 'nemi.db')
+    try:
+        setup_django(database)
+
+        from django.test.utils import override_settings
+        with override_settings(DEBUG=False, ALLOWED_HOSTS=['*'], ADMINS=[], SITEMAP_DIR=os.path.join(work_dir, 'sitemaps'),
+                               EXPORT_DIR=os.path.join(work_dir, 'exports'), PDF_CACHE_DIR=None):
+            dataset = prepare_dataset(database, _dataset_options(args))
+            scenarios = [s for s in get_scenarios() if not args.only or s.group in args.only]
+
+            import django
+            report = {'commit' : _commit(),
+                      'date' : datetime.datetime.now().isoformat(),
+                      'python' : platform.python_version(),
+                      'django' : django.get_version(),
+                      'dataset' : dataset,
+                      'repeat' : args.repeat,
+                      'scenarios' : run(scenarios, args.repeat)}
+    finally:
+        shutil.rmtree(work_dir)
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        rows = compare(previous, report, args.threshold, args.min_ms)
+        for name, before, after, ratio, regressed in rows:
+            print('%-40s %10.2f %10.2f %7.2fx%s' % (name, before, after, ratio, '  REGRESSION' if regressed else ''),
+                  file=sys.stderr)
+        if any(row[4] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,12 +4,12 @@ from django import forms
 from django.contrib import admin
 from django.contrib import messages
 from django.core.exceptions import PermissionDenied, ValidationError
-from django.db import connection
 from django.db.models import Case, CharField, Count, Q, Value, When
 from django.forms.models import BaseInlineFormSet
 from django.http import HttpResponseRedirect
 from django.template.defaultfilters import slugify
 from django.urls import reverse
+from django.utils.html import format_html
 import PyPDF2
 
 from django_object_actions import (
@@ -17,6 +17,12 @@ from django_object_actions import (
 
 from nemi_project.admin import method_admin
 from common import models
+from common.archive import archive_methods_job
+from common.signals import methods_changed
+from common.utils.cache import bump_data_version
+from common.utils.jobs import submit_job
+from common.utils.pdf_cache import get_pdf_cache
+from sams.approval import approve_stat_methods
 
 
 class ReadOnlyMixin:
@@ -121,8 +127,19 @@ class AbstractRevisionForm(forms.ModelForm):
         if commit:
             instance.save()
 
+        if self.cleaned_data['pdf_file']:
+            self.invalidate_pdf_cache(instance)
+
         return instance
 
+    def invalidate_pdf_cache(self, instance):
+        '''Removes the instance's entry from the pdf cache. The new pdf is cached when it is first served, with
+        the version built from the dates read by the pdf view, as the model's date fields do not hold the time.
+        '''
+        pdf_cache = get_pdf_cache()
+        if pdf_cache is not None and instance.pk is not None:
+            pdf_cache.invalidate((self.STAGE, instance.pk))
+
 
 class RevisionOnlineForm(AbstractRevisionForm):
     STAGE = 'online'
@@ -633,7 +650,7 @@ class MethodStgAdmin(DjangoObjectActions, AbstractEditableMethodAdmin):
         'approved', 'approved_date'
     ) + AbstractEditableMethodAdmin.list_filter
     inlines = (AnalyteMethodStgAdmin, RevisionStgAdmin)
-    actions = ('publish', 'archive')
+    actions = ('publish', 'archive', 'approve_statistical')
     change_actions = actions
     fieldsets = (
         ('Review-Specific Fields', {
@@ -646,7 +663,10 @@ class MethodStgAdmin(DjangoObjectActions, AbstractEditableMethodAdmin):
 
     @takes_instance_or_queryset
     def publish(self, request, queryset):
+        method_ids = list(queryset.values_list('method_id', flat=True))
         rows_updated = queryset.update(approved='Y')
+        bump_data_version()
+        methods_changed.send(sender=self.__class__, method_ids=method_ids)
         self.message_user(request, 'published %d method%s' % (
             rows_updated, 's' if rows_updated > 1 else ''))
 
@@ -655,27 +675,35 @@ class MethodStgAdmin(DjangoObjectActions, AbstractEditableMethodAdmin):
 
     @takes_instance_or_queryset
     def archive(self, request, queryset):
-        method_ids = queryset.values_list('method_id', flat=True)
-        try:
-            cursor = connection.cursor()
-            for method_id in method_ids:
-                cursor.callproc(
-                    'archive_method', [
-                        method_id,
-                        'Y',  # DELETE_FLAG - remove from staging and production
-                        'Y',  # PUBLIC_FLAG - method should be public
-                    ]
-                )
-        finally:
-            cursor.close()
-
-        rows_updated = len(method_ids)
-        self.message_user(request, 'archived %d method%s' % (
-            rows_updated, 's' if rows_updated > 1 else ''))
+        # Archiving many methods takes minutes, so it runs as a background job
+        method_ids = list(queryset.values_list('method_id', flat=True))
+        job = submit_job('archive_methods', archive_methods_job, method_ids,
+                         total=len(method_ids), username=request.user.username)
+
+        self.message_user(request, format_html(
+            'archiving {} method{}. <a href="{}">Follow its progress</a>',
+            len(method_ids), 's' if len(method_ids) > 1 else '', reverse('job_status', args=[job.job_id])))
 
     archive.label = 'Archive'
     archive.short_description = 'Archive the selected methods'
 
+    @takes_instance_or_queryset
+    def approve_statistical(self, request, queryset):
+        method_ids = list(queryset.filter(
+            method_subcategory__method_category__exact='STATISTICAL'
+        ).values_list('method_id', flat=True))
+        try:
+            approved = approve_stat_methods(method_ids, request.user.username)
+        except models.SourceCitationStgRef.DoesNotExist as e:
+            self.message_user(request, 'Not approved: %s' % e, level=messages.ERROR)
+            return
+
+        self.message_user(request, 'approved %d statistical method%s' % (
+            len(approved), 's' if len(approved) != 1 else ''))
+
+    approve_statistical.label = 'Approve statistical'
+    approve_statistical.short_description = 'Copy the selected statistical methods to the published tables'
+
     def has_add_permission(self, request, obj=None):
         # For now, only admins have acesss.
         return request.user.is_superuser
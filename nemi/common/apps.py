@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class CommonAppConfig(AppConfig):
     name = 'common'
     verbose_name = 'NEMI Methods'
+
+    def ready(self):
+        from nemi_project.sitemaps import expire_sitemaps
+        from .signals import methods_changed
+
+        methods_changed.connect(expire_sitemaps, dispatch_uid='nemi_project.expire_sitemaps')
@@ -0,0 +1,86 @@
+'''
+Archives methods with the archive_method stored procedure, which copies a method to the archive tables and
+removes it from the staging and published tables. Methods are sent in batches. On Oracle a batch is one
+executemany of a PL/SQL block, so its method ids are array bound and sent in a single round trip. Other
+backends call the procedure once per method. A batch which fails is rolled back and retried one method at
+a time so that the methods which fail can be reported.
+'''
+from django.db import DatabaseError, connection, transaction
+
+from common.signals import methods_changed
+from common.utils.cache import bump_data_version
+
+ARCHIVE_PROCEDURE = 'archive_method'
+
+# The trailing / is removed by the Oracle backend, leaving the ; which PL/SQL needs
+ARCHIVE_PLSQL = 'BEGIN %s(%%s, %%s, %%s); END;\n/' % ARCHIVE_PROCEDURE
+
+
+def archive_params(method_id):
+    return [
+        method_id,
+        'Y',  # DELETE_FLAG - remove from staging and production
+        'Y',  # PUBLIC_FLAG - method should be public
+    ]
+
+
+class MethodArchiver:
+    '''Archives methods in batches of batch_size.'''
+
+    batch_size = 100
+
+    def __init__(self, batch_size=None):
+        if batch_size is not None:
+            self.batch_size = batch_size
+
+    def archive_batch(self, cursor, method_ids):
+        if connection.vendor == 'oracle':
+            cursor.executemany(ARCHIVE_PLSQL, [archive_params(method_id) for method_id in method_ids])
+        else:
+            for method_id in method_ids:
+                self.archive_one(cursor, method_id)
+
+    def archive_one(self, cursor, method_id):
+        cursor.callproc(ARCHIVE_PROCEDURE, archive_params(method_id))
+
+    def archive(self, method_ids, progress=None):
+        '''Archives the methods with method_ids and returns a dictionary which maps the ids of the methods
+        which could not be archived to their error messages. If progress, a common.utils.jobs.JobProgress,
+        is given it is advanced after each batch.
+        '''
+        method_ids = list(method_ids)
+        errors = {}
+        try:
+            with connection.cursor() as cursor:
+                for i in range(0, len(method_ids), self.batch_size):
+                    batch = method_ids[i:i + self.batch_size]
+                    batch_errors = {}
+                    try:
+                        with transaction.atomic():
+                            self.archive_batch(cursor, batch)
+                    except DatabaseError:
+                        for method_id in batch:
+                            try:
+                                with transaction.atomic():
+                                    self.archive_one(cursor, method_id)
+                            except DatabaseError as e:
+                                batch_errors[method_id] = str(e)
+
+                    errors.update(batch_errors)
+                    if progress is not None:
+                        progress.advance(len(batch), batch_errors)
+        finally:
+            if len(errors) < len(method_ids):
+                bump_data_version()
+                methods_changed.send(sender=self.__class__,
+                                     method_ids=[method_id for method_id in method_ids if method_id not in errors])
+
+        return errors
+
+
+def archive_methods_job(progress, method_ids, batch_size=None):
+    '''A common.utils.jobs job function which archives the methods with method_ids. Returns a summary
+    of the number of methods archived.
+    '''
+    errors = MethodArchiver(batch_size).archive(method_ids, progress)
+    return 'archived %d of %d methods' % (len(method_ids) - len(errors), len(method_ids))
@@ -0,0 +1,23 @@
+"""
+This command rebuilds the static sitemap files served at sitemap.xml. Only
+the pages whose urls have changed are written. The files are also rebuilt by
+the sitemap views when they are SITEMAP_MAX_AGE seconds old, so running this
+command after loading data just gets the changes to crawlers sooner.
+"""
+from django.contrib.sites.models import Site
+from django.core.management.base import BaseCommand
+
+from nemi_project.sitemaps import sitemap_files
+
+
+class Command(BaseCommand):
+    help = 'Writes the sitemap files which have changed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--protocol', default='https',
+            help='The protocol of the urls in the sitemaps. This should be the one used by crawlers.')
+
+    def handle(self, *args, **options):
+        written, unchanged = sitemap_files.build(Site.objects.get_current(), options['protocol'])
+        self.stdout.write('Wrote %d and kept %d sitemap pages' % (written, unchanged))
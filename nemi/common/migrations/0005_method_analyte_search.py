@@ -0,0 +1,71 @@
+# Generated by Django 2.2.15 on 2026-10-18 05:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0004_increase_method_id_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MethodAnalyteSearch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('analyte_method_id', models.IntegerField(db_index=True)),
+                ('method_id', models.IntegerField(db_index=True)),
+                ('method_source_id', models.IntegerField(null=True)),
+                ('source_method_identifier', models.CharField(max_length=45, null=True)),
+                ('method_source', models.CharField(max_length=20, null=True)),
+                ('method_descriptive_name', models.CharField(max_length=250, null=True)),
+                ('method_category', models.CharField(max_length=50, null=True)),
+                ('method_subcategory', models.CharField(max_length=40, null=True)),
+                ('method_source_contact', models.CharField(max_length=450, null=True)),
+                ('method_source_url', models.CharField(max_length=200, null=True)),
+                ('method_type_desc', models.CharField(max_length=100, null=True)),
+                ('media_name', models.CharField(max_length=30, null=True)),
+                ('waterbody_type', models.CharField(max_length=20, null=True)),
+                ('dl_value', models.DecimalField(decimal_places=6, max_digits=21, null=True)),
+                ('sub_dl_value', models.CharField(max_length=40, null=True)),
+                ('dl_units', models.CharField(max_length=20, null=True)),
+                ('dl_units_description', models.CharField(max_length=60, null=True)),
+                ('dl_type', models.CharField(max_length=11, null=True)),
+                ('dl_type_description', models.CharField(max_length=50, null=True)),
+                ('accuracy', models.DecimalField(decimal_places=6, max_digits=21, null=True)),
+                ('sub_accuracy', models.CharField(max_length=40, null=True)),
+                ('accuracy_units', models.CharField(max_length=40, null=True)),
+                ('accuracy_units_description', models.CharField(max_length=50, null=True)),
+                ('precision', models.DecimalField(decimal_places=6, max_digits=21, null=True)),
+                ('sub_precision', models.CharField(max_length=40, null=True)),
+                ('precision_units', models.CharField(max_length=30, null=True)),
+                ('precision_units_description', models.CharField(max_length=100, null=True)),
+                ('precision_descriptor_notes', models.CharField(max_length=3000, null=True)),
+                ('prec_acc_conc_used', models.DecimalField(decimal_places=6, max_digits=21, null=True)),
+                ('false_positive_value', models.IntegerField(null=True)),
+                ('false_negative_value', models.IntegerField(null=True)),
+                ('instrumentation_id', models.IntegerField(null=True)),
+                ('instrumentation', models.CharField(max_length=20, null=True)),
+                ('instrumentation_description', models.CharField(max_length=200, null=True)),
+                ('relative_cost', models.CharField(max_length=40, null=True)),
+                ('relative_cost_symbol', models.CharField(max_length=7, null=True)),
+                ('cost_effort_key', models.CharField(max_length=10, null=True)),
+                ('matrix', models.CharField(max_length=12, null=True)),
+                ('pbt', models.CharField(max_length=1, null=True)),
+                ('toxic', models.CharField(max_length=1, null=True)),
+                ('corrosive', models.CharField(max_length=1, null=True)),
+                ('waste', models.CharField(max_length=1, null=True)),
+                ('assumptions_comments', models.CharField(max_length=2000, null=True)),
+                ('analyte_name', models.CharField(max_length=240, null=True)),
+                ('analyte_code', models.CharField(max_length=20, null=True)),
+                ('preferred', models.IntegerField(null=True)),
+                ('analyte_type', models.CharField(max_length=50, null=True)),
+                ('analyte_name_key', models.CharField(db_index=True, max_length=240, null=True)),
+                ('analyte_code_key', models.CharField(db_index=True, max_length=20, null=True)),
+            ],
+            options={
+                'db_table': 'method_analyte_search',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.15 on 2026-10-18 05:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0006_background_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backgroundjob',
+            name='key',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
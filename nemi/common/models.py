@@ -1,3 +1,5 @@
+import json
+
 from django.contrib.auth.models import User
 from django.db import models
 
@@ -1178,3 +1180,104 @@ class ProtocolMethodStgRel(AbstractProtocolMethodRel):
         managed = False
         db_table = 'protocol_method_stg_rel'
         verbose_name = 'protocol method'
+
+
+class MethodAnalyteSearch(models.Model):
+    '''
+    Denormalized copy of the columns of method_analyte_all_vw used by the analyte results and export views.
+    The table is filled by the refresh_analyte_search management command. The normalized analyte name and
+    code keys (see methods.analyte_search.analyte_key) are indexed so that analyte searches are exact matches
+    on an index. The view can have more than one row for an analyte method, so analyte_method_id is not the key.
+    '''
+
+    analyte_method_id = models.IntegerField(db_index=True)
+    method_id = models.IntegerField(db_index=True)
+    method_source_id = models.IntegerField(null=True)
+    source_method_identifier = models.CharField(max_length=45, null=True)
+    method_source = models.CharField(max_length=20, null=True)
+    method_descriptive_name = models.CharField(max_length=250, null=True)
+    method_category = models.CharField(max_length=50, null=True)
+    method_subcategory = models.CharField(max_length=40, null=True)
+    method_source_contact = models.CharField(max_length=450, null=True)
+    method_source_url = models.CharField(max_length=200, null=True)
+    method_type_desc = models.CharField(max_length=100, null=True)
+    media_name = models.CharField(max_length=30, null=True)
+    waterbody_type = models.CharField(max_length=20, null=True)
+    dl_value = models.DecimalField(max_digits=21, decimal_places=6, null=True)
+    sub_dl_value = models.CharField(max_length=40, null=True)
+    dl_units = models.CharField(max_length=20, null=True)
+    dl_units_description = models.CharField(max_length=60, null=True)
+    dl_type = models.CharField(max_length=11, null=True)
+    dl_type_description = models.CharField(max_length=50, null=True)
+    accuracy = models.DecimalField(max_digits=21, decimal_places=6, null=True)
+    sub_accuracy = models.CharField(max_length=40, null=True)
+    accuracy_units = models.CharField(max_length=40, null=True)
+    accuracy_units_description = models.CharField(max_length=50, null=True)
+    precision = models.DecimalField(max_digits=21, decimal_places=6, null=True)
+    sub_precision = models.CharField(max_length=40, null=True)
+    precision_units = models.CharField(max_length=30, null=True)
+    precision_units_description = models.CharField(max_length=100, null=True)
+    precision_descriptor_notes = models.CharField(max_length=3000, null=True)
+    prec_acc_conc_used = models.DecimalField(max_digits=21, decimal_places=6, null=True)
+    false_positive_value = models.IntegerField(null=True)
+    false_negative_value = models.IntegerField(null=True)
+    instrumentation_id = models.IntegerField(null=True)
+    instrumentation = models.CharField(max_length=20, null=True)
+    instrumentation_description = models.CharField(max_length=200, null=True)
+    relative_cost = models.CharField(max_length=40, null=True)
+    relative_cost_symbol = models.CharField(max_length=7, null=True)
+    cost_effort_key = models.CharField(max_length=10, null=True)
+    matrix = models.CharField(max_length=12, null=True)
+    pbt = models.CharField(max_length=1, null=True)
+    toxic = models.CharField(max_length=1, null=True)
+    corrosive = models.CharField(max_length=1, null=True)
+    waste = models.CharField(max_length=1, null=True)
+    assumptions_comments = models.CharField(max_length=2000, null=True)
+    analyte_name = models.CharField(max_length=240, null=True)
+    analyte_code = models.CharField(max_length=20, null=True)
+    preferred = models.IntegerField(null=True)
+    analyte_type = models.CharField(max_length=50, null=True)
+    analyte_name_key = models.CharField(max_length=240, null=True, db_index=True)
+    analyte_code_key = models.CharField(max_length=20, null=True, db_index=True)
+
+    class Meta:
+        db_table = 'method_analyte_search'
+
+
+class BackgroundJob(models.Model):
+    '''Records the progress of a job run on a worker thread by common.utils.jobs.'''
+
+    PENDING = 'PENDING'
+    RUNNING = 'RUNNING'
+    FINISHED = 'FINISHED'
+    FAILED = 'FAILED'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (FINISHED, 'Finished'),
+        (FAILED, 'Failed'),
+    )
+
+    job_id = models.CharField(max_length=32, primary_key=True)
+    kind = models.CharField(max_length=50)
+    key = models.CharField(max_length=64, blank=True, db_index=True)  # Identifies the input of jobs whose results can be reused
+    username = models.CharField(max_length=50, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    total = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+    errors = models.TextField(blank=True)  # JSON object which maps an item to its error message
+    result = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'background_job'
+
+    def __str__(self):
+        return '%s %s' % (self.kind, self.job_id)
+
+    def get_errors(self):
+        return json.loads(self.errors) if self.errors else {}
+
+    def is_done(self):
+        return self.status in (self.FINISHED, self.FAILED)
@@ -0,0 +1,7 @@
+'''
+Signals sent by the common app.
+'''
+from django.dispatch import Signal
+
+# Sent with method_ids, the ids of the methods changed, after methods are published, archived or approved
+methods_changed = Signal(providing_args=['method_ids'])
@@ -6,6 +6,9 @@ from . import test_utils
 from . import test_views
 from . import test_context_processors
 from . import test_method_admin
+from . import test_archive
+from . import test_sitemaps
+from . import test_metrics
 
 
 def suite():
@@ -16,6 +19,9 @@ def suite():
         unittest.TestLoader().loadTestsFromModule(test_views),
         unittest.TestLoader().loadTestsFromModule(test_context_processors),
         unittest.TestLoader().loadTestsFromModule(test_method_admin),
+        unittest.TestLoader().loadTestsFromModule(test_archive),
+        unittest.TestLoader().loadTestsFromModule(test_sitemaps),
+        unittest.TestLoader().loadTestsFromModule(test_metrics),
     ])
 
 
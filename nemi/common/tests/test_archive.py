@@ -0,0 +1,108 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ..archive import MethodArchiver
+from ..models import BackgroundJob, MethodAnalyteSearch
+from ..utils.jobs import submit_job
+
+
+class DeletingArchiver(MethodArchiver):
+    '''Stands in for the archive_method procedure, which only exists in Oracle, by deleting the method's rows
+    from the analyte search table. Archiving method 13 fails.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super(DeletingArchiver, self).__init__(*args, **kwargs)
+        self.batches = []
+
+    def archive_batch(self, cursor, method_ids):
+        self.batches.append(list(method_ids))
+        super(DeletingArchiver, self).archive_batch(cursor, method_ids)
+
+    def archive_one(self, cursor, method_id):
+        cursor.execute('DELETE FROM method_analyte_search WHERE method_id = %s', [method_id])
+        if method_id == 13:
+            cursor.execute('SELECT * FROM archive_method_error')
+
+
+def _archive_job(progress, method_ids, batch_size):
+    errors = DeletingArchiver(batch_size).archive(method_ids, progress)
+    return '%d errors' % len(errors)
+
+
+class MethodArchiverTestCase(TestCase):
+
+    def setUp(self):
+        for method_id in range(10, 15):
+            MethodAnalyteSearch.objects.create(analyte_method_id=method_id, method_id=method_id)
+
+    def _remaining(self):
+        return sorted(MethodAnalyteSearch.objects.values_list('method_id', flat=True))
+
+    def test_batches(self):
+        archiver = DeletingArchiver(batch_size=2)
+
+        self.assertEqual(archiver.archive([10, 11, 12]), {})
+        self.assertEqual(archiver.batches, [[10, 11], [12]])
+        self.assertEqual(self._remaining(), [13, 14])
+
+    def test_failed_method(self):
+        errors = DeletingArchiver(batch_size=3).archive([12, 13, 14])
+
+        # The failed batch is rolled back and retried one method at a time
+        self.assertEqual(list(errors), [13])
+        self.assertEqual(self._remaining(), [10, 11, 13])
+
+
+@override_settings(JOBS_RUN_EAGERLY=True)
+class ArchiveJobTestCase(TestCase):
+
+    def setUp(self):
+        for method_id in range(10, 15):
+            MethodAnalyteSearch.objects.create(analyte_method_id=method_id, method_id=method_id)
+        self.user = User.objects.create_user('user1', password='test')
+
+    def test_job_progress(self):
+        job = submit_job('archive_methods', _archive_job, [10, 11, 12, 13, 14], 2, total=5, username='user1')
+
+        self.assertEqual(job.status, BackgroundJob.FINISHED)
+        self.assertEqual(job.completed, 5)
+        self.assertEqual(list(job.get_errors()), ['13'])
+        self.assertEqual(job.result, '1 errors')
+
+    def test_failed_job(self):
+        with self.assertLogs('common.utils.jobs', 'ERROR'):
+            job = submit_job('archive_methods', _archive_job, None, 2)
+
+        self.assertEqual(job.status, BackgroundJob.FAILED)
+        self.assertTrue(job.result)
+
+    def test_status_view(self):
+        job = submit_job('archive_methods', _archive_job, [10, 13], 2, total=2, username='user1')
+        url = reverse('job_status', args=[job.job_id])
+
+        # Only the user who started the job can see it
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        self.client.login(username='user1', password='test')
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        status = resp.json()
+        self.assertEqual(status['status'], BackgroundJob.FINISHED)
+        self.assertEqual(status['completed'], 2)
+        self.assertIn('13', status['errors'])
+
+        self.assertEqual(self.client.get(reverse('job_status', args=['0' * 32])).status_code, 404)
+
+    def test_status_view_without_user(self):
+        job = submit_job('archive_methods', _archive_job, [10], 2, total=1)
+        url = reverse('job_status', args=[job.job_id])
+
+        # Jobs which were not started by a user can only be seen by staff
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.login(username='user1', password='test')
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        User.objects.filter(username='user1').update(is_staff=True)
+        self.assertEqual(self.client.get(url).status_code, 200)
@@ -0,0 +1,96 @@
+import tempfile
+
+from django.db import connection
+from django.http import FileResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+
+from nemi_project.middleware import InstrumentationMiddleware
+
+from ..utils.metrics import request_metrics, RequestMetrics
+
+
+class RequestMetricsTestCase(SimpleTestCase):
+
+    def test_render(self):
+        metrics = RequestMetrics()
+        metrics.record('methods-results', 0.2, 3, 0.05, 0.1)
+        metrics.record('methods-results', 2, 5, 1, 0.5)
+        metrics.add_response_bytes('methods-results', 1000)
+
+        lines = metrics.render().splitlines()
+        self.assertIn('# TYPE nemi_requests_total counter', lines)
+        self.assertIn('nemi_requests_total{view="methods-results"} 2.0', lines)
+        self.assertIn('nemi_db_queries_total{view="methods-results"} 8.0', lines)
+        self.assertIn('nemi_response_bytes_total{view="methods-results"} 1000.0', lines)
+        self.assertIn('nemi_python_seconds_total{view="methods-results"} 0.55', lines)
+        self.assertIn('nemi_request_duration_seconds_bucket{view="methods-results",le="0.25"} 1', lines)
+        self.assertIn('nemi_request_duration_seconds_bucket{view="methods-results",le="+Inf"} 2', lines)
+        self.assertIn('nemi_request_duration_seconds_count{view="methods-results"} 2', lines)
+
+
+class InstrumentationMiddlewareTestCase(TestCase):
+
+    def setUp(self):
+        request_metrics.reset()
+
+    def test_query_count(self):
+        self.client.get('/jobs/%s/' % ('0' * 32))
+        self.client.get('/jobs/%s/' % ('0' * 32))
+
+        self.assertEqual(request_metrics.get('nemi_requests_total', 'job_status'), 2)
+        self.assertEqual(request_metrics.get('nemi_db_queries_total', 'job_status'), 2)
+        self.assertGreater(request_metrics.get('nemi_db_seconds_total', 'job_status'), 0)
+
+    def test_template_time_and_size(self):
+        resp = self.client.get('/robots.txt')
+
+        view_name = resp.resolver_match.view_name
+        self.assertGreater(request_metrics.get('nemi_template_seconds_total', view_name), 0)
+        self.assertEqual(request_metrics.get('nemi_response_bytes_total', view_name), len(resp.content))
+        self.assertNotIn('Server-Timing', resp)
+
+    def test_file_response(self):
+        f = tempfile.TemporaryFile()
+        f.write(b'x' * 1000)
+        f.seek(0)
+        middleware = InstrumentationMiddleware(lambda request: FileResponse(f))
+        resp = middleware(RequestFactory().get('/export/'))
+
+        # The file is left to the server to send
+        self.assertIs(resp.file_to_stream, f)
+        self.assertEqual(request_metrics.get('nemi_response_bytes_total', '<unresolved>'), 1000)
+        resp.close()
+
+    def test_streaming_response(self):
+        def content():
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                yield b'%d\n' % cursor.fetchone()[0]
+
+        middleware = InstrumentationMiddleware(lambda request: StreamingHttpResponse(content()))
+        resp = middleware(RequestFactory().get('/export/'))
+        self.assertEqual(request_metrics.get('nemi_requests_total', '<unresolved>'), 0)
+
+        # The queries run while the content is sent are counted once the response is closed
+        self.assertEqual(b''.join(resp.streaming_content), b'1\n')
+        resp.close()
+        self.assertEqual(request_metrics.get('nemi_requests_total', '<unresolved>'), 1)
+        self.assertEqual(request_metrics.get('nemi_db_queries_total', '<unresolved>'), 1)
+        self.assertEqual(request_metrics.get('nemi_response_bytes_total', '<unresolved>'), 2)
+        self.assertEqual(connection.execute_wrappers, [])
+
+    def test_server_timing(self):
+        with self.settings(INSTRUMENTATION_SERVER_TIMING=True):
+            resp = self.client.get('/jobs/%s/' % ('0' * 32))
+
+        self.assertIn('db;dur=', resp['Server-Timing'])
+        self.assertIn('desc="1 queries"', resp['Server-Timing'])
+
+    def test_metrics_view(self):
+        self.client.get('/jobs/%s/' % ('0' * 32))
+
+        resp = self.client.get('/metrics')
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('nemi_requests_total{view="job_status"} 1.0', resp.content.decode('utf-8'))
+
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.1').status_code, 404)
@@ -0,0 +1,137 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+
+from django.contrib.sitemaps import Sitemap
+from django.contrib.sites.models import Site
+from django.test import TestCase
+
+from ..signals import methods_changed
+from ..utils.sitemap_files import SitemapFiles
+
+
+class ListSitemap(Sitemap):
+    limit = 2
+
+    def __init__(self, items):
+        self._items = items
+
+    def items(self):
+        return self._items
+
+    def location(self, item):
+        return '/item/%s/' % item
+
+
+class SitemapFilesTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.items = ['a', 'b', 'c']
+        self.files = SitemapFiles(self.directory, {'items' : ListSitemap(self.items)},
+                                  lambda name: '/sitemap-%s.xml' % name)
+        self.site = Site(domain='nemi.test')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _read(self, name):
+        with gzip.open(os.path.join(self.directory, 'sitemap-%s.xml.gz' % name)) as f:
+            return f.read().decode('utf-8')
+
+    def test_build(self):
+        self.assertEqual(self.files.build(self.site, 'https'), (2, 0))
+
+        self.assertIn('<loc>https://nemi.test/sitemap-items-1.xml</loc>', self._read('index'))
+        self.assertIn('<loc>https://nemi.test/sitemap-items-2.xml</loc>', self._read('index'))
+        self.assertIn('https://nemi.test/item/b/', self._read('items-1'))
+        self.assertIn('https://nemi.test/item/c/', self._read('items-2'))
+
+    def test_incremental_build(self):
+        self.files.build(self.site, 'https')
+
+        # Only the page whose urls changed is written
+        self.items[2] = 'd'
+        self.assertEqual(self.files.build(self.site, 'https'), (1, 1))
+        self.assertIn('https://nemi.test/item/d/', self._read('items-2'))
+
+        del self.items[2]
+        self.assertEqual(self.files.build(self.site, 'https'), (0, 1))
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'sitemap-items-2.xml.gz')))
+        self.assertNotIn('items-2', self._read('index'))
+
+        # A different domain rebuilds every page
+        self.assertEqual(self.files.build(Site(domain='other.test'), 'https'), (1, 0))
+
+    def test_get_rebuilds_when_old(self):
+        path, etag = self.files.get('items-1', self.site, 'https')
+        self.assertTrue(os.path.exists(path))
+
+        # The age is kept in the manifest, so a new process sharing the directory does not rebuild
+        self.items[0] = 'z'
+        files = SitemapFiles(self.directory, self.files.sitemaps, self.files.location)
+        self.assertEqual(files.get('items-1', self.site, 'https')[1], etag)
+        with self.settings(SITEMAP_MAX_AGE=0):
+            self.assertNotEqual(files.get('items-1', self.site, 'https')[1], etag)
+
+        self.assertIsNone(self.files.get('items-3', self.site, 'https'))
+
+    def test_expire(self):
+        etag = self.files.get('items-1', self.site, 'https')[1]
+        self.items[0] = 'z'
+
+        self.files.expire()
+        self.assertNotEqual(self.files.get('items-1', self.site, 'https')[1], etag)
+
+
+class SitemapViewTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.settings_override = self.settings(SITEMAP_DIR=self.directory)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.directory)
+
+    def test_index(self):
+        resp = self.client.get('/sitemap.xml')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'application/xml')
+        content = resp.content.decode('utf-8')
+        self.assertIn('<sitemapindex', content)
+        self.assertIn('/sitemap-methods-1.xml</loc>', content)
+
+        resp = self.client.get('/sitemap.xml', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(resp['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(resp.content).decode('utf-8'), content)
+
+    def test_page(self):
+        resp = self.client.get('/sitemap-staticpages-1.xml')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('/methods/browse_methods/</loc>', resp.content.decode('utf-8'))
+
+        self.assertEqual(self.client.get('/sitemap-staticpages-2.xml').status_code, 404)
+
+    def test_conditional_get(self):
+        resp = self.client.get('/sitemap-staticpages-1.xml')
+
+        resp = self.client.get('/sitemap-staticpages-1.xml', HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual(resp.status_code, 304)
+
+        # The gzipped file has its own ETag
+        resp = self.client.get('/sitemap-staticpages-1.xml', HTTP_IF_NONE_MATCH=resp['ETag'],
+                               HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(resp.status_code, 200)
+
+    def test_expired_when_methods_change(self):
+        self.client.get('/sitemap.xml')
+
+        methods_changed.send(sender=None, method_ids=[1])
+        with open(os.path.join(self.directory, 'manifest.json')) as f:
+            self.assertEqual(json.load(f)['built'], 0)
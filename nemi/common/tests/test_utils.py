@@ -4,13 +4,26 @@ Created on Mar 15, 2012
 @author: mbucknel
 '''
 
+import datetime
+from decimal import Decimal
+from io import BytesIO
+import os
+import shutil
+import tempfile
+from xml.etree import ElementTree
+import zipfile
+
 from django import forms
+from django.db.models import Q
 from django.test import SimpleTestCase, TestCase
 
 from nemi_project.test_settings_mgr import TestSettingsManager
 
+from ..utils.cache import bump_data_version, get_data_cache, version_cached
+from ..utils.pdf_cache import PdfCache, pdf_version
 from ..utils.forms import get_criteria, get_criteria_from_field_data, get_multi_choice
-from ..utils.view_utils import tsv_response, xls_response
+from ..utils.view_utils import decode_cursor, encode_cursor, keyset_filter, tsv_response, tsv_value, xls_response, xlsx_response
+from ..utils.xlsx import write_xlsx, xlsx_cell
 from .models import TestModel
 
 
@@ -162,6 +175,33 @@ class TsvResponseTestCase(SimpleTestCase):
         self.assertEqual(response.status_code, 200)
 
 
+    def test_streaming_in_chunks(self):
+        rows = ([i, 'B%d' % i] for i in range(5))
+        response = tsv_response(['A', 'B'], rows, 'test', chunk_size=2)
+
+        self.assertTrue(response.streaming)
+        chunks = list(response.streaming_content)
+        # The heading line followed by chunks of two, two and one rows
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(b''.join(chunks), b'A\tB\n0\tB0\t\n1\tB1\t\n2\tB2\t\n3\tB3\t\n4\tB4\t\n')
+
+    def test_escaping(self):
+        response = tsv_response(['A', 'B'], [['Tab\there', 'Line\nbreak\r\n']], 'test')
+
+        self.assertEqual(b''.join(response.streaming_content), b'A\tB\nTab\\there\tLine\\nbreak\\r\\n\t\n')
+
+
+class TsvValueTestCase(SimpleTestCase):
+
+    def test_tsv_value(self):
+        self.assertEqual(tsv_value('plain'), 'plain')
+        self.assertEqual(tsv_value(10), '10')
+        self.assertEqual(tsv_value(None), 'None')
+        self.assertEqual(tsv_value('a\tb'), 'a\\tb')
+        self.assertEqual(tsv_value('a\\tb'), 'a\\\\tb')
+        self.assertEqual(tsv_value('a\r\nb'), 'a\\r\\nb')
+
+
 class XlsResponseTestCase(SimpleTestCase):
 
     def test_response(self):
@@ -172,3 +212,178 @@ class XlsResponseTestCase(SimpleTestCase):
 
         self.assertEqual(response['Content-Type'], 'application/vnd.ms-excel')
         self.assertEqual(response['Content-Disposition'], 'attachment; filename=%s.xls' % filename)
+
+
+def _read_sheet(xlsx, name):
+    '''Returns the rows in the worksheet, name, as lists of (cell type, value) tuples.'''
+    ns = {'m' : 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+    root = ElementTree.fromstring(xlsx.read(name))
+    rows = []
+    for row in root.iterfind('m:sheetData/m:row', ns):
+        cells = []
+        for cell in row.iterfind('m:c', ns):
+            if cell.get('t') == 'inlineStr':
+                cells.append(('s', cell.find('m:is/m:t', ns).text))
+            elif cell.find('m:v', ns) is not None:
+                cells.append(('n', cell.find('m:v', ns).text))
+            else:
+                cells.append((None, None))
+        rows.append(cells)
+    return rows
+
+
+class XlsxResponseTestCase(SimpleTestCase):
+
+    def test_response(self):
+        headings = ['A', 'B', 'C']
+        list_of_lists = [['A1,', 'B1', 10], ['A2', '2.5', 20.5], ['A3', None, 30]]
+        filename = 'test'
+        response = xlsx_response(headings, list_of_lists, filename, numeric_columns=[1])
+
+        self.assertEqual(response['Content-Type'], 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename=%s.xlsx' % filename)
+        self.assertEqual(response.status_code, 200)
+
+        content = b''.join(response.streaming_content)
+        self.assertEqual(int(response['Content-Length']), len(content))
+
+        xlsx = zipfile.ZipFile(BytesIO(content))
+        self.assertIn('[Content_Types].xml', xlsx.namelist())
+        self.assertIn('xl/workbook.xml', xlsx.namelist())
+        self.assertEqual(_read_sheet(xlsx, 'xl/worksheets/sheet1.xml'),
+                         [[('s', 'A'), ('s', 'B'), ('s', 'C')],
+                          [('s', 'A1,'), ('s', 'B1'), ('n', '10')],
+                          [('s', 'A2'), ('n', '2.5'), ('n', '20.5')],
+                          [('s', 'A3'), (None, None), ('n', '30')]])
+
+
+class WriteXlsxTestCase(SimpleTestCase):
+
+    def test_continues_on_new_sheets(self):
+        fileobj = BytesIO()
+        sheet_count = write_xlsx(fileobj, ['A'], ([i] for i in range(7)), max_rows=4, chunk_size=2)
+
+        self.assertEqual(sheet_count, 3)
+        xlsx = zipfile.ZipFile(fileobj)
+        self.assertEqual(_read_sheet(xlsx, 'xl/worksheets/sheet1.xml'), [[('s', 'A')], [('n', '0')], [('n', '1')], [('n', '2')]])
+        self.assertEqual(_read_sheet(xlsx, 'xl/worksheets/sheet2.xml'), [[('s', 'A')], [('n', '3')], [('n', '4')], [('n', '5')]])
+        self.assertEqual(_read_sheet(xlsx, 'xl/worksheets/sheet3.xml'), [[('s', 'A')], [('n', '6')]])
+        self.assertEqual(xlsx.read('xl/workbook.xml').count(b'<sheet '), 3)
+
+    def test_no_empty_sheet_when_last_sheet_is_full(self):
+        fileobj = BytesIO()
+        sheet_count = write_xlsx(fileobj, ['A'], ([i] for i in range(6)), max_rows=4)
+
+        self.assertEqual(sheet_count, 2)
+        self.assertEqual(len(_read_sheet(zipfile.ZipFile(fileobj), 'xl/worksheets/sheet2.xml')), 4)
+
+
+class XlsxCellTestCase(SimpleTestCase):
+
+    def test_numbers(self):
+        self.assertEqual(xlsx_cell(12), '<c><v>12</v></c>')
+        self.assertEqual(xlsx_cell(Decimal('0.500000')), '<c><v>0.5</v></c>')
+        self.assertEqual(xlsx_cell(float('nan')), '<c t="inlineStr"><is><t xml:space="preserve">nan</t></is></c>')
+
+    def test_strings(self):
+        self.assertEqual(xlsx_cell('12'), '<c t="inlineStr"><is><t xml:space="preserve">12</t></is></c>')
+        self.assertEqual(xlsx_cell('12', numeric=True), '<c><v>12.0</v></c>')
+        self.assertEqual(xlsx_cell('N/A', numeric=True), '<c t="inlineStr"><is><t xml:space="preserve">N/A</t></is></c>')
+        self.assertEqual(xlsx_cell('a < b & \x01c'), '<c t="inlineStr"><is><t xml:space="preserve">a &lt; b &amp; c</t></is></c>')
+
+    def test_empty_and_boolean(self):
+        self.assertEqual(xlsx_cell(None), '<c/>')
+        self.assertEqual(xlsx_cell(True), '<c t="b"><v>1</v></c>')
+
+
+class CursorTestCase(SimpleTestCase):
+
+    def test_round_trip(self):
+        self.assertEqual(decode_cursor(encode_cursor(['EPA 300.0', 12]), 2), ['EPA 300.0', 12])
+
+    def test_invalid_cursor(self):
+        self.assertRaises(ValueError, decode_cursor, 'not a cursor', 2)
+        self.assertRaises(ValueError, decode_cursor, encode_cursor(['EPA 300.0']), 2)
+        self.assertRaises(ValueError, decode_cursor, encode_cursor({'a' : 1}), 1)
+
+    def test_keyset_filter(self):
+        self.assertEqual(keyset_filter(('a', 'b'), ('x', 1)), Q(a__gt='x') | Q(a='x', b__gt=1))
+
+
+class PdfCacheTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.pdf_cache = PdfCache(self.directory, 100)
+
+    def test_put_and_get(self):
+        self.assertIsNone(self.pdf_cache.get(('live', 1), 'v1'))
+
+        cached = self.pdf_cache.put(('live', 1), 'v1', [b'abc', b'def'])
+        self.assertEqual(cached.size, 6)
+        with open(cached.path, 'rb') as f:
+            self.assertEqual(f.read(), b'abcdef')
+
+        hit = self.pdf_cache.get(('live', 1), 'v1')
+        self.assertEqual(hit.digest, cached.digest)
+        self.assertIsNone(self.pdf_cache.get(('live', 1), 'v2'))
+        self.assertIsNone(self.pdf_cache.get(('online', 1), 'v1'))
+
+    def test_content_addressed(self):
+        first = self.pdf_cache.put(('live', 1), 'v1', [b'same'])
+        second = self.pdf_cache.put(('stg', 1), 'v1', [b'same'])
+
+        self.assertEqual(first.path, second.path)
+        self.assertEqual(len(os.listdir(self.pdf_cache.objects_dir)), 1)
+
+    def test_invalidate(self):
+        self.pdf_cache.put(('stg', 1), 'v1', [b'abc'])
+        self.pdf_cache.invalidate(('stg', 1))
+        self.pdf_cache.invalidate(('stg', 2))
+
+        self.assertIsNone(self.pdf_cache.get(('stg', 1), 'v1'))
+
+    def test_least_recently_used_evicted(self):
+        self.pdf_cache.put(('live', 1), 'v1', [b'1' * 40])
+        self.pdf_cache.put(('live', 2), 'v1', [b'2' * 40])
+        os.utime(self.pdf_cache.get(('live', 1), 'v1').path, (1, 1))
+        os.utime(self.pdf_cache.get(('live', 2), 'v1').path, (2, 2))
+        # Using the first pdf makes the second the least recently used
+        self.pdf_cache.get(('live', 1), 'v1')
+
+        self.pdf_cache.put(('live', 3), 'v1', [b'3' * 40])
+
+        self.assertIsNotNone(self.pdf_cache.get(('live', 1), 'v1'))
+        self.assertIsNone(self.pdf_cache.get(('live', 2), 'v1'))
+        self.assertIsNotNone(self.pdf_cache.get(('live', 3), 'v1'))
+
+    def test_pdf_version(self):
+        self.assertEqual(pdf_version(datetime.date(2020, 1, 2), datetime.datetime(2020, 3, 4, 5, 6), None),
+                         '2020-01-02/2020-03-04T05:06:00/None')
+        # A pdf replaced later on the same day has a new version
+        self.assertNotEqual(pdf_version(datetime.datetime(2020, 3, 4, 5, 6)),
+                            pdf_version(datetime.datetime(2020, 3, 4, 9)))
+
+
+class VersionCachedTestCase(SimpleTestCase):
+
+    def setUp(self):
+        get_data_cache().clear()
+        self.built = []
+
+        @version_cached
+        def build(kind):
+            self.built.append(kind)
+            return [kind]
+        self.build = build
+
+    def test_cached_for_each_version(self):
+        value = self.build('name')
+        self.assertIs(self.build('name'), value)
+        self.assertEqual(self.build('code'), ['code'])
+        self.assertEqual(self.built, ['name', 'code'])
+
+        bump_data_version()
+        self.assertIsNot(self.build('name'), value)
+        self.assertEqual(self.built, ['name', 'code', 'name'])
@@ -1,11 +1,20 @@
-from io import StringIO
+import hashlib
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+import shutil
+import tempfile
+import threading
+import time
 from unittest import mock
 
-from django.http import Http404
+from django.core.cache import caches
+from django.http import FileResponse, Http404
 from django.test import SimpleTestCase
 from django.test.client import RequestFactory
 
-from ..views import ChoiceJsonView, PdfView, SimpleWebProxyView
+from ..utils.cache import bump_data_version, get_data_cache, get_data_version
+from ..views import BatchWebProxyView, ChoiceJsonView, PdfView, SimpleWebProxyView
 
 
 class CommonJsonViewTestCase(SimpleTestCase):
@@ -33,6 +42,69 @@ class CommonJsonViewTestCase(SimpleTestCase):
         self.assertContains(resp, '{"choices" : []}')
 
 
+class CachedChoiceJsonViewTestCase(SimpleTestCase):
+
+    class TestView(ChoiceJsonView):
+        cache_choices = True
+        cache_params = ('category',)
+        call_count = 0
+
+        def get_choices(self, request, *args, **kwargs):
+            self.__class__.call_count += 1
+            return [('value1', 'Value 1 %s' % request.GET.get('category', ''))]
+
+    def setUp(self):
+        get_data_cache().clear()
+        self.TestView.call_count = 0
+        self.factory = RequestFactory()
+
+    def test_cached_response(self):
+        resp1 = self.TestView.as_view()(self.factory.get('/choices/'))
+        resp2 = self.TestView.as_view()(self.factory.get('/choices/'))
+
+        self.assertEqual(self.TestView.call_count, 1)
+        self.assertEqual(resp1.content, resp2.content)
+        self.assertContains(resp2, '{"choices" : [{"value" : "value1", "display_value" : "Value 1 "}]}')
+        self.assertEqual(resp1['ETag'], resp2['ETag'])
+
+    def test_cache_params(self):
+        resp1 = self.TestView.as_view()(self.factory.get('/choices/', {'category' : 'A'}))
+        resp2 = self.TestView.as_view()(self.factory.get('/choices/', {'category' : 'B'}))
+        self.TestView.as_view()(self.factory.get('/choices/', {'category' : 'A', 'other' : 'C'}))
+
+        self.assertEqual(self.TestView.call_count, 2)
+        self.assertContains(resp1, 'Value 1 A')
+        self.assertContains(resp2, 'Value 1 B')
+        self.assertNotEqual(resp1['ETag'], resp2['ETag'])
+
+    def test_data_version_bump(self):
+        self.TestView.as_view()(self.factory.get('/choices/'))
+        bump_data_version()
+        self.TestView.as_view()(self.factory.get('/choices/'))
+
+        self.assertEqual(self.TestView.call_count, 2)
+
+    def test_data_version_expires(self):
+        self.TestView.as_view()(self.factory.get('/choices/'))
+        version = get_data_version()
+        # Past the data cache's timeout another process's bump, or a load made outside the site, is seen
+        with mock.patch('time.time', return_value=time.time() + 3601):
+            self.assertNotEqual(get_data_version(), version)
+            self.TestView.as_view()(self.factory.get('/choices/'))
+
+        self.assertEqual(self.TestView.call_count, 2)
+
+    def test_not_modified(self):
+        resp1 = self.TestView.as_view()(self.factory.get('/choices/'))
+        resp2 = self.TestView.as_view()(self.factory.get('/choices/', HTTP_IF_NONE_MATCH=resp1['ETag']))
+
+        self.assertEqual(resp2.status_code, 304)
+        self.assertEqual(resp2['ETag'], resp1['ETag'])
+
+        resp3 = self.TestView.as_view()(self.factory.get('/choices/', HTTP_IF_NONE_MATCH='"stale"'))
+        self.assertEqual(resp3.status_code, 200)
+
+
 class PdfViewTestCase(SimpleTestCase):
     def test_response_no_data(self):
         test_view = PdfView()
@@ -53,84 +125,363 @@ class PdfViewTestCase(SimpleTestCase):
         self.assertEquals(resp['Content-Type'], 'application/pdf')
         self.assertEquals(resp['content-disposition'], 'attachment;filename=test.pdf')
         self.assertContains(resp, 'Test PDF String')
+        self.assertEquals(resp['Content-Length'], '15')
+        self.assertEquals(resp['Accept-Ranges'], 'bytes')
+
+
+class PdfViewStreamingTestCase(SimpleTestCase):
+
+    class FakeLob(object):
+        '''Mimics the size and one based read methods of a cx_Oracle LOB.'''
+        def __init__(self, data):
+            self.data = data
+            self.reads = []
+
+        def size(self):
+            return len(self.data)
+
+        def read(self, offset, amount):
+            self.reads.append((offset, amount))
+            return self.data[offset - 1:offset - 1 + amount]
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.data = bytes(range(256)) * 4
+
+        class TestPdfView(PdfView):
+            mimetype = 'application/pdf'
+            filename = 'test'
+            chunk_size = 100
+        self.view_class = TestPdfView
+
+    def _get(self, pdf, **headers):
+        test_view = self.view_class()
+        test_view.pdf = pdf
+        return test_view.get(self.factory.get('/pdf/', **headers))
+
+    def test_lob_streamed_in_chunks(self):
+        lob = self.FakeLob(self.data)
+        resp = self._get(lob)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        self.assertEqual(resp['Content-Length'], '1024')
+        self.assertEqual(lob.reads, [])
+        self.assertEqual(b''.join(resp.streaming_content), self.data)
+        self.assertEqual(lob.reads[0], (1, 100))
+        self.assertEqual(lob.reads[-1], (1001, 24))
+        self.assertEqual(len(lob.reads), 11)
+
+    def test_file_object(self):
+        resp = self._get(BytesIO(self.data), HTTP_RANGE='bytes=1000-')
+
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(b''.join(resp.streaming_content), self.data[1000:])
+
+    def test_range(self):
+        lob = self.FakeLob(self.data)
+        resp = self._get(lob, HTTP_RANGE='bytes=100-349')
+
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp['Content-Range'], 'bytes 100-349/1024')
+        self.assertEqual(resp['Content-Length'], '250')
+        self.assertEqual(b''.join(resp.streaming_content), self.data[100:350])
+        self.assertEqual(lob.reads, [(101, 100), (201, 100), (301, 50)])
+
+    def test_open_and_suffix_ranges(self):
+        resp = self._get(self.data, HTTP_RANGE='bytes=1000-')
+        self.assertEqual(resp['Content-Range'], 'bytes 1000-1023/1024')
+        self.assertEqual(b''.join(resp.streaming_content), self.data[1000:])
+
+        resp = self._get(self.data, HTTP_RANGE='bytes=-10')
+        self.assertEqual(resp['Content-Range'], 'bytes 1014-1023/1024')
+        self.assertEqual(b''.join(resp.streaming_content), self.data[-10:])
+
+        resp = self._get(self.data, HTTP_RANGE='bytes=1000-5000')
+        self.assertEqual(resp['Content-Range'], 'bytes 1000-1023/1024')
+
+    def test_unsatisfiable_range(self):
+        resp = self._get(self.data, HTTP_RANGE='bytes=1024-')
+
+        self.assertEqual(resp.status_code, 416)
+        self.assertEqual(resp['Content-Range'], 'bytes */1024')
+
+    def test_ignored_ranges(self):
+        for headers in [{'HTTP_RANGE' : 'bytes=0-1,5-6'},
+                        {'HTTP_RANGE' : 'lines=1-2'},
+                        {'HTTP_RANGE' : 'bytes=10-5'},
+                        {'HTTP_RANGE' : 'bytes=0-9', 'HTTP_IF_RANGE' : '"abc"'}]:
+            resp = self._get(self.data, **headers)
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp['Content-Length'], '1024')
+
+
+
+class PdfViewCacheTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_override = self.settings(PDF_CACHE_DIR=directory, PDF_CACHE_MAX_SIZE=1024 * 1024)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        class TestPdfView(PdfView):
+            mimetype = 'application/pdf'
+            filename = 'test'
+            cache_key = ('live', 1)
+            cache_version = 'v1'
+        self.view_class = TestPdfView
+        self.data = b'Test PDF String' * 100
+
+    def _get(self, pdf, **headers):
+        test_view = self.view_class()
+        test_view.pdf = pdf
+        return test_view.get(self.factory.get('/pdf/', **headers))
+
+    def test_served_from_cache(self):
+        resp = self._get(self.data)
+        etag = resp['ETag']
+        self.assertEqual(etag, '"%s"' % hashlib.sha256(self.data).hexdigest())
+        self.assertEqual(b''.join(resp.streaming_content), self.data)
+        resp.close()
+
+        # The cached copy is served even though the pdf has changed, as neither the version nor the size has
+        resp = self._get(b'X' * len(self.data))
+        self.assertIsInstance(resp, FileResponse)
+        self.assertEqual(resp['ETag'], etag)
+        self.assertEqual(resp['Content-Length'], str(len(self.data)))
+        self.assertEqual(resp['Content-Disposition'], 'attachment;filename=test.pdf')
+        self.assertEqual(b''.join(resp.streaming_content), self.data)
+        resp.close()
+
+        # A pdf of a different size is cached again
+        resp = self._get(b'changed')
+        self.assertEqual(resp['ETag'], '"%s"' % hashlib.sha256(b'changed').hexdigest())
+        self.assertEqual(b''.join(resp.streaming_content), b'changed')
+        resp.close()
+
+    def _etag(self):
+        resp = self._get(self.data)
+        resp.close()
+        return resp['ETag']
+
+    def test_not_modified(self):
+        etag = self._etag()
+
+        resp = self._get(self.data, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+
+    def test_if_range(self):
+        etag = self._etag()
+
+        resp = self._get(self.data, HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE=etag)
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(b''.join(resp.streaming_content), b'Test')
+
+        resp = self._get(self.data, HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(resp.status_code, 200)
+        resp.close()
+
+class StubServiceHandler(BaseHTTPRequestHandler):
+    '''Handles requests to the stub service used by SimpleWebProxyViewTestCase. Each request's path is recorded.'''
+
+    requests = []
+    binary = bytes(range(256)) * 1000
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self, include_body):
+        self.requests.append((self.command, self.path))
+        path = self.path.split('?')[0]
+        if path == '/service/specific_op/':
+            body = b'It was successful'
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/xml')
+            self.send_header('Content-Disposition', 'attachment;filename="Results.xml"')
+            self.send_header('Custom-Header', 'Custom header value')
+        elif path == '/service/binary/':
+            body = self.binary
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/zip')
+        elif path == '/service/search/count/':
+            body = ('{"count" : %d}' % len(self.requests)).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+        elif path == '/service/slow/':
+            time.sleep(0.5)
+            body = b'Too late'
+            self.send_response(200)
+        else:
+            body = b'Failure'
+            self.send_response(404)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if include_body:
+            try:
+                self.wfile.write(body)
+            except ConnectionError:
+                # The client has given up waiting
+                pass
+
+    def do_GET(self):
+        self._respond(True)
+
+    def do_HEAD(self):
+        self._respond(False)
 
 
 class SimpleWebProxyViewTestCase(SimpleTestCase):
 
+    @classmethod
+    def setUpClass(cls):
+        super(SimpleWebProxyViewTestCase, cls).setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubServiceHandler)
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+        cls.service_url = 'http://127.0.0.1:%d/service' % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super(SimpleWebProxyViewTestCase, cls).tearDownClass()
+
     def setUp(self):
         self.factory = RequestFactory()
-        self.test_view = SimpleWebProxyView(service_url='http://www.fake.com/service')
+        self.test_view = SimpleWebProxyView.as_view(service_url=self.service_url)
+        del StubServiceHandler.requests[:]
+        caches['default'].clear()
+
+    def _content(self, response):
+        try:
+            return b''.join(response.streaming_content) if response.streaming else response.content
+        finally:
+            response.close()
 
     def test_successful_get(self):
-        with mock.patch('common.views.requests.get') as mock_requests_get:
-            resp = mock.Mock
-            resp.text = 'It was successful'
-            resp.status_code = 200
-            resp.headers = {'content-type' : 'text/xml', 'content-disposition' : 'attachment;filename="Results.xml"'}
+        request = self.factory.get('/my_service/specific_op/?param1=1&param2=2')
 
-            args = []
-            kwargs = {'op' : 'specific_op/'}
-            request = self.factory.get('/my_service/specific_op/?param1=1&param2=2')
+        response = self.test_view(request, op='specific_op/')
 
-            response = self.test_view.get(request, *args, **kwargs)
+        self.assertEqual(StubServiceHandler.requests, [('GET', '/service/specific_op/?param1=1&param2=2')])
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/xml')
+        self.assertEqual(response['Content-Disposition'], 'attachment;filename="Results.xml"')
+        self.assertEqual(self._content(response), b'It was successful')
 
-            self.assertEqual(mock_requests_get.call_args[0], ('http://www.fake.com/service/specific_op/?param1=1&param2=2',))
-            self.assertEqual(response.status_code, 200)
-            self.assertContains(response, 'It was successful')
-            self.assertEqual(response['Content-Type'], 'text/xml')
-            self.assertEqual(response['Content-Disposition'], 'attachment;filename="Results.xml"')
+    def test_binary_get(self):
+        request = self.factory.get('/my_service/binary/')
+
+        response = self.test_view(request, op='binary/')
+
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        self.assertEqual(self._content(response), StubServiceHandler.binary)
 
     def test_unsuccssful_get(self):
-        with mock.patch('common.views.requests.get') as mock_requests_get:
-            resp = mock.Mock
-            resp.text = 'Failure'
-            resp.status_code = 404
+        request = self.factory.get('/my_service/specific_op/?param1=1&param2=2')
+
+        response = self.test_view(request, op='missing/')
+
+        self.assertEqual(response.status_code, 404)
 
-            args = []
-            kwargs = {'op' : 'specific_op/'}
-            request = self.factory.get('/my_service/specific_op/?param1=1&param2=2')
+    def test_timeout(self):
+        request = self.factory.get('/my_service/slow/')
 
-            response = self.test_view.get(request, *args, **kwargs)
+        with self.settings(HTTP_READ_TIMEOUT=0.1):
+            response = self.test_view(request, op='slow/')
 
-            self.assertEqual(mock_requests_get.call_args[0], ('http://www.fake.com/service/specific_op/?param1=1&param2=2',))
-            self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.status_code, 504)
+
+    def test_unreachable(self):
+        request = self.factory.get('/my_service/specific_op/')
+
+        response = SimpleWebProxyView.as_view(service_url='http://127.0.0.1:1/service')(request, op='specific_op/')
+
+        self.assertEqual(response.status_code, 502)
 
     def test_successful_head(self):
-        with mock.patch('common.views.requests.head') as mock_requests_head:
-            resp = mock.Mock
-            resp.text = 'It was successful'
-            resp.status_code = 200
-            resp.headers = {'content-type' : 'text/xml',
-                            'content-disposition' : 'attachment;filename="Results.xml"',
-                            'custom-header' : 'Custom header value'}
-
-            args = []
-            kwargs = {'op' : 'specific_op/'}
-            request = self.factory.head('/my_service/specific_op/?param1=1&param2=2')
-
-            response = self.test_view.head(request, *args, **kwargs)
-
-            self.assertEqual(mock_requests_head.call_args[0], ('http://www.fake.com/service/specific_op/?param1=1&param2=2',))
-            self.assertEqual(response.status_code, 200)
-            self.assertContains(response, 'It was successful')
-            self.assertEqual(response['Content-Type'], 'text/xml')
-            self.assertEqual(response['Content-Disposition'], 'attachment;filename="Results.xml"')
-            self.assertEqual(response['custom-header'], 'Custom header value')
+        request = self.factory.head('/my_service/specific_op/?param1=1&param2=2')
+
+        response = self.test_view(request, op='specific_op/')
+
+        self.assertEqual(StubServiceHandler.requests, [('HEAD', '/service/specific_op/?param1=1&param2=2')])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/xml')
+        self.assertEqual(response['Content-Disposition'], 'attachment;filename="Results.xml"')
+        self.assertEqual(response['custom-header'], 'Custom header value')
 
     def test_unsuccssful_head(self):
-        with mock.patch('common.views.requests.head') as mock_requests_head:
-            resp = mock.Mock
-            resp.text = 'Failure'
-            resp.status_code = 404
+        request = self.factory.head('/my_service/specific_op/?param1=1&param2=2')
 
-            args = []
-            kwargs = {'op' : 'specific_op/'}
-            request = self.factory.head('/my_service/specific_op/?param1=1&param2=2')
+        response = self.test_view(request, op='missing/')
 
-            response = self.test_view.head(request, *args, **kwargs)
+        self.assertEqual(response.status_code, 404)
 
-            self.assertEqual(mock_requests_head.call_args[0], ('http://www.fake.com/service/specific_op/?param1=1&param2=2',))
-            self.assertEqual(response.status_code, 404)
+    def test_cached_head_and_count(self):
+        view = SimpleWebProxyView.as_view(service_url=self.service_url, cache_timeout=60)
+
+        for i in range(2):
+            response = view(self.factory.head('/my_service/specific_op/?param1=1'), op='specific_op/')
+            self.assertEqual(response['custom-header'], 'Custom header value')
+            response = view(self.factory.get('/my_service/search/count/?param1=1'), op='search/count/')
+            self.assertEqual(self._content(response), b'{"count" : 2}')
+            self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(len(StubServiceHandler.requests), 2)
+
+        # Other query strings and ops are not answered from the cache
+        view(self.factory.head('/my_service/specific_op/?param1=2'), op='specific_op/')
+        self._content(view(self.factory.get('/my_service/specific_op/?param1=1'), op='specific_op/'))
+        self._content(view(self.factory.get('/my_service/specific_op/?param1=1'), op='specific_op/'))
+        self.assertEqual(len(StubServiceHandler.requests), 5)
+
+    def _batch(self, operations, **initkwargs):
+        view = BatchWebProxyView.as_view(**initkwargs)
+        request = self.factory.post('/my_service/batch/', json.dumps(operations), content_type='application/json')
+        response = view(request)
+        return response.status_code, json.loads(response.content.decode('utf-8'))
+
+    def test_batch(self):
+        class TestProxyView(SimpleWebProxyView):
+            service_url = self.service_url
+
+        status, content = self._batch([
+            {'op' : 'specific_op/', 'params' : {'param1' : ['1', '2']}},
+            {'op' : 'missing/', 'method' : 'head'},
+            {'op' : 'search/count/', 'method' : 'GET'},
+        ], proxy_view_class=TestProxyView)
+
+        self.assertEqual(status, 200)
+        results = content['results']
+        self.assertEqual([r['status'] for r in results], [200, 404, 200])
+        self.assertEqual(results[0]['headers']['Custom-Header'], 'Custom header value')
+        self.assertNotIn('content', results[0])
+        self.assertEqual(results[2]['method'], 'GET')
+        self.assertIn('count', json.loads(results[2]['content']))
+        self.assertIn(('HEAD', '/service/specific_op/?param1=1&param1=2'), StubServiceHandler.requests)
+
+    def test_batch_concurrent(self):
+        class TestProxyView(SimpleWebProxyView):
+            service_url = self.service_url
+
+        start = time.time()
+        status, content = self._batch([{'op' : 'slow/'}] * 4, proxy_view_class=TestProxyView, max_concurrency=4)
+
+        self.assertEqual([r['status'] for r in content['results']], [200] * 4)
+        # Each operation takes half a second
+        self.assertLess(time.time() - start, 1.5)
+
+    def test_batch_invalid(self):
+        for operations in [{}, [], [{'method' : 'HEAD'}], [{'op' : 'specific_op/', 'method' : 'POST'}],
+                           [{'op' : 'specific_op/', 'method' : 'GET'}], [{'op' : 'count/', 'params' : []}],
+                           [{'op' : 'count/'}] * 51, [{'op' : '../admin/'}], [{'op' : 'count/?mimeType=csv'}]]:
+            status, content = self._batch(operations)
+            self.assertEqual(status, 400)
+            self.assertIn('error', content)
+        self.assertEqual(StubServiceHandler.requests, [])
 
     def test_invalid_method(self):
         args = []
@@ -0,0 +1,109 @@
+'''
+Keeps files built from the database, such as the static sitemap files and the method dump, in a directory shared
+by the site's processes. A manifest in the directory records when the files were built, along with whatever else
+their builder needs, so every process agrees on when they are out of date: when the manifest is older than the
+maximum age or has been expired. A lock on the directory makes one process do each rebuild. Files are written to
+temporary files which are then renamed, so readers never see a partly written file.
+'''
+from contextlib import contextmanager
+import gzip
+import json
+import os
+import tempfile
+import time
+
+from .locks import file_lock
+
+MANIFEST_NAME = 'manifest.json'
+LOCK_NAME = 'build.lock'
+
+
+class BuiltFiles(object):
+    '''
+    Base class of a set of files built together in directory which are out of date after max_age seconds.
+    Subclasses implement build_files, which writes the files and returns their manifest, a dictionary which
+    can be encoded as JSON. The time the files were built is added to the manifest as 'built'.
+    '''
+    directory = None
+    max_age = None
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def read_manifest(self):
+        '''Returns the manifest of the files, or an empty dictionary if they have not been built.'''
+        try:
+            with open(self.path(MANIFEST_NAME)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def write_manifest(self, manifest):
+        with self.atomic_file(self.path(MANIFEST_NAME), 'w') as f:
+            json.dump(manifest, f)
+
+    def is_current(self, manifest, *args):
+        '''Returns True if the files built with args, those of build_files, are up to date.'''
+        return time.time() - manifest.get('built', 0) < self.max_age
+
+    @contextmanager
+    def lock(self):
+        '''Holds the directory's lock, creating the directory if it does not exist.'''
+        os.makedirs(self.directory, exist_ok=True)
+        with file_lock(self.path(LOCK_NAME)):
+            yield
+
+    @contextmanager
+    def atomic_file(self, path, mode='wb', compress=False):
+        '''
+        Opens a temporary file in the directory which replaces the file at path if the block completes without
+        an exception. If compress is True, the file is gzipped.
+        '''
+        fd, temp_path = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(fd, mode) as f:
+                if compress:
+                    # mtime=0 so that the same content always gives the same file
+                    with gzip.GzipFile(fileobj=f, mode='wb', mtime=0) as gzip_file:
+                        yield gzip_file
+                else:
+                    yield f
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def build_files(self, *args):
+        raise NotImplementedError
+
+    def _build(self, *args):
+        manifest = self.build_files(*args)
+        manifest['built'] = time.time()
+        self.write_manifest(manifest)
+        return manifest
+
+    def build(self, *args):
+        '''Builds the files while holding the directory's lock. Returns the manifest.'''
+        with self.lock():
+            return self._build(*args)
+
+    def get_manifest(self, *args):
+        '''Returns the manifest of the files, building them first if they are out of date.'''
+        manifest = self.read_manifest()
+        if not self.is_current(manifest, *args):
+            with self.lock():
+                # Another process may have rebuilt the files while this one waited for the lock
+                manifest = self.read_manifest()
+                if not self.is_current(manifest, *args):
+                    manifest = self._build(*args)
+        return manifest
+
+    def expire(self):
+        '''Marks the files as out of date, so that they are rebuilt when they are next needed.'''
+        if not os.path.exists(self.path(MANIFEST_NAME)):
+            return
+        with self.lock():
+            manifest = self.read_manifest()
+            if manifest:
+                manifest['built'] = 0
+                self.write_manifest(manifest)
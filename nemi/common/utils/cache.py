@@ -0,0 +1,71 @@
+'''
+Provides the cache used to hold data derived from the NEMI catalogue along with the data version token
+which invalidates it. Keys built with versioned_key include the current data version, so bumping the
+version whenever the published catalogue changes (methods are published, archived or approved) makes
+every previously cached entry unreachable. The entries then expire on their own.
+
+The token itself expires after the data cache's TIMEOUT. With a cache which is not shared between processes,
+or when data is loaded outside of the site so that nothing bumps the version, this bounds how long a process
+keeps using data derived from an old version, including the in-process values kept with version_cached.
+'''
+import functools
+import hashlib
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+DATA_VERSION_KEY = 'nemi_data_version'
+
+
+def get_data_cache():
+    '''Returns the cache used to hold catalogue data. This is the cache named by the DATA_CACHE_ALIAS setting.'''
+    return caches[getattr(settings, 'DATA_CACHE_ALIAS', 'default')]
+
+
+def get_data_version():
+    '''Returns the current data version token as a string. A new token is created if one does not exist.'''
+    return get_data_cache().get_or_set(DATA_VERSION_KEY, lambda: uuid.uuid4().hex)
+
+
+def bump_data_version():
+    '''Replaces the data version token, invalidating all entries cached with versioned_key.
+    Returns the new token.
+    '''
+    version = uuid.uuid4().hex
+    get_data_cache().set(DATA_VERSION_KEY, version)
+    return version
+
+
+def versioned_key(prefix, *parts):
+    '''Returns a cache key which starts with prefix and is unique for the current data version and parts.
+    The parts are hashed so that the key is safe for any cache backend regardless of their contents.
+    '''
+    digest = hashlib.md5('\x1f'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+    return '%s:%s:%s' % (prefix, get_data_version(), digest)
+
+
+def version_cached(build):
+    '''
+    Decorator which keeps the value that build returns for each tuple of arguments in the process, and builds it
+    again the first time it is requested after the data version changes. Only one thread builds at a time, so
+    threads which request a value while it is being built wait for it rather than also building it.
+    '''
+    values = {}  # Maps the arguments to the (data version, value) built with them
+    lock = threading.Lock()
+
+    @functools.wraps(build)
+    def get(*args):
+        version = get_data_version()
+        cached = values.get(args)
+        if cached is None or cached[0] != version:
+            with lock:
+                # Another thread may have built the value while this one waited for the lock
+                cached = values.get(args)
+                if cached is None or cached[0] != version:
+                    cached = (version, build(*args))
+                    values[args] = cached
+        return cached[1]
+
+    return get
@@ -0,0 +1,125 @@
+'''
+Writes exports of search results to files in settings.EXPORT_DIR from background jobs (see common.utils.jobs),
+so that large exports do not time out a request. An export's key is a hash of the view, the export type, the
+request parameters and the data version. A finished export with the same key is reused for
+EXPORT_REUSE_TIMEOUT seconds, and export files are removed once they are EXPORT_KEEP_TIME seconds old.
+'''
+import datetime
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from common.models import BackgroundJob
+
+from .cache import get_data_version
+from .view_utils import write_tsv, write_xls
+from .xlsx import write_xlsx
+
+EXPORT_JOB_KIND = 'export'
+
+EXPORT_CONTENT_TYPES = {
+    'tsv' : 'text/tab-separated-values',
+    'xls' : 'application/vnd.ms-excel',
+    'xlsx' : 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def export_key(*parts):
+    '''Returns the key of an export made from parts and the current data version.'''
+    return hashlib.sha256('\x1f'.join([get_data_version()] + [str(p) for p in parts]).encode('utf-8')).hexdigest()
+
+
+def export_path(name):
+    '''Returns the absolute path of the export file whose name relative to the export directory is name.
+    Raises ValueError if name is outside of the export directory.
+    '''
+    export_dir = os.path.abspath(settings.EXPORT_DIR)
+    path = os.path.abspath(os.path.join(export_dir, name))
+    if os.path.dirname(os.path.dirname(path)) != export_dir:
+        raise ValueError('%s is not an export file' % name)
+    return path
+
+
+def find_export_job(key):
+    '''Returns the most recent export job with key which is pending, running or has finished within
+    EXPORT_REUSE_TIMEOUT seconds and whose file still exists. Returns None if there is no such job.
+    Pending and running jobs which have not been updated for EXPORT_STALE_TIMEOUT seconds are marked as failed
+    first, as a job is lost if the process running it stops.
+    '''
+    now = timezone.now()
+    BackgroundJob.objects.filter(
+        kind=EXPORT_JOB_KIND, key=key, status__in=[BackgroundJob.PENDING, BackgroundJob.RUNNING],
+        updated__lt=now - datetime.timedelta(seconds=settings.EXPORT_STALE_TIMEOUT)
+    ).update(status=BackgroundJob.FAILED, result='The export stopped before it finished', updated=now)
+
+    cutoff = now - datetime.timedelta(seconds=settings.EXPORT_REUSE_TIMEOUT)
+    jobs = BackgroundJob.objects.filter(kind=EXPORT_JOB_KIND, key=key, created__gte=cutoff).exclude(
+        status=BackgroundJob.FAILED).order_by('-created')
+    for job in jobs[:1]:
+        if job.status != BackgroundJob.FINISHED or os.path.exists(export_path(job.result)):
+            return job
+    return None
+
+
+def remove_old_exports():
+    '''Removes the export files which are more than EXPORT_KEEP_TIME seconds old.'''
+    if not os.path.isdir(settings.EXPORT_DIR):
+        return
+    cutoff = time.time() - settings.EXPORT_KEEP_TIME
+    for entry in os.scandir(settings.EXPORT_DIR):
+        if entry.is_dir() and entry.stat().st_mtime < cutoff:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+class _ProgressRows:
+    '''Iterates over rows, advancing progress by the number of rows read every chunk_size rows.'''
+
+    def __init__(self, rows, progress, chunk_size):
+        self.rows = rows
+        self.progress = progress
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        count = 0
+        for row in self.rows:
+            yield row
+            count += 1
+            if count == self.chunk_size:
+                self.progress.advance(count)
+                count = 0
+        if count:
+            self.progress.advance(count)
+
+
+def write_export(progress, key, export_type, filename, headings, rows, numeric_columns=(), chunk_size=2000):
+    '''Writes rows, with headings as the column headers, to the export file for key, a file of export_type named
+    filename plus the suffix. progress is advanced by the number of rows written. Returns the name of the file
+    relative to the export directory, which is the job's result.
+    '''
+    name = os.path.join(key, '%s.%s' % (filename, export_type))
+    path = export_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    rows = _ProgressRows(rows, progress, chunk_size)
+    fd, partial_path = tempfile.mkstemp(suffix='.part', dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as fileobj:
+            if export_type == 'tsv':
+                write_tsv(fileobj, headings, rows, chunk_size=chunk_size)
+            elif export_type == 'xlsx':
+                write_xlsx(fileobj, headings, rows, numeric_columns=numeric_columns, chunk_size=chunk_size)
+            elif export_type == 'xls':
+                write_xls(fileobj, headings, rows)
+            else:
+                raise ValueError('Unknown export type %s' % export_type)
+        os.replace(partial_path, path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+    return name
@@ -0,0 +1,40 @@
+'''
+Provides the HTTP session shared by the views which make requests to other services. The session keeps a pool
+of connections to each host, so requests made by the same process reuse connections rather than opening a new
+one each time.
+'''
+import threading
+
+from django.conf import settings
+import requests
+from requests.adapters import HTTPAdapter
+
+# Headers which apply to a single connection and must not be copied from an upstream response
+HOP_BY_HOP_HEADERS = frozenset([
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailers',
+    'transfer-encoding', 'upgrade',
+])
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_http_session():
+    '''Returns the process wide requests Session. Each host's connection pool holds up to the
+    HTTP_POOL_SIZE setting connections.
+    '''
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings.HTTP_POOL_SIZE)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+def get_http_timeout():
+    '''Returns the (connect, read) timeout in seconds to use for requests made with the shared session.'''
+    return (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT)
@@ -0,0 +1,93 @@
+'''
+Runs long jobs, such as archiving many methods, on a pool of worker threads in this process so that they
+do not tie up a request. Each job is recorded as a common.models.BackgroundJob which the job function updates
+with its progress and errors through a JobProgress, and which clients poll with the job status view.
+No broker is needed, but a job is lost if its process stops before the job finishes.
+'''
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import threading
+import uuid
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from common.models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_job_executor():
+    '''Returns the process wide executor which has settings.JOB_WORKERS worker threads.'''
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.JOB_WORKERS, thread_name_prefix='nemi-job')
+    return _executor
+
+
+def _update_job(job_id, **fields):
+    '''Updates the fields of the job, job_id, and its updated time, which a queryset update does not set.'''
+    BackgroundJob.objects.filter(job_id=job_id).update(updated=timezone.now(), **fields)
+
+
+class JobProgress:
+    '''Passed to a job's function to record its progress in its BackgroundJob.'''
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.errors = {}
+
+    def set_total(self, total):
+        _update_job(self.job_id, total=total)
+
+    def advance(self, count=1, errors=None):
+        '''Adds count to the number of items completed. errors is a dictionary which maps items which
+        failed to their error messages.
+        '''
+        fields = {'completed' : F('completed') + count}
+        if errors:
+            self.errors.update((str(item), str(message)) for item, message in errors.items())
+            fields['errors'] = json.dumps(self.errors)
+        _update_job(self.job_id, **fields)
+
+
+def _run_job(job_id, func, args, kwargs):
+    _update_job(job_id, status=BackgroundJob.RUNNING)
+    try:
+        result = func(JobProgress(job_id), *args, **kwargs)
+    except Exception as e:
+        logger.exception('Background job %s failed', job_id)
+        _update_job(job_id, status=BackgroundJob.FAILED, result=str(e))
+    else:
+        _update_job(job_id, status=BackgroundJob.FINISHED, result='' if result is None else str(result))
+
+
+def _run_job_in_worker(job_id, func, args, kwargs):
+    try:
+        _run_job(job_id, func, args, kwargs)
+    finally:
+        # Database connections belong to the worker thread, which outlives the job
+        connections.close_all()
+
+
+def submit_job(kind, func, *args, total=0, username='', key='', **kwargs):
+    '''Creates a BackgroundJob and runs func(progress, *args, **kwargs) on a worker thread once the current
+    transaction commits. progress is the job's JobProgress. The string of the value func returns is stored as the
+    job's result. key identifies the job's input when its result can be reused by identical jobs.
+    If settings.JOBS_RUN_EAGERLY is True, func is run before this returns. Returns the job.
+    '''
+    job = BackgroundJob.objects.create(job_id=uuid.uuid4().hex, kind=kind, key=key, total=total, username=username)
+    if settings.JOBS_RUN_EAGERLY:
+        _run_job(job.job_id, func, args, kwargs)
+        job.refresh_from_db()
+    else:
+        transaction.on_commit(lambda: get_job_executor().submit(_run_job_in_worker, job.job_id, func, args, kwargs))
+    return job
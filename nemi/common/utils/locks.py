@@ -0,0 +1,20 @@
+'''
+Provides a lock on a file which is held across processes, for work on files shared by the site's processes which
+only one of them should do at a time, such as rebuilding the sitemap files.
+'''
+from contextlib import contextmanager
+import fcntl
+import os
+
+
+@contextmanager
+def file_lock(path):
+    '''Holds an exclusive lock on the file at path, which is created if it does not exist, while the block runs.
+    Blocks until the lock is available. The lock is released if the process exits.
+    '''
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
@@ -0,0 +1,87 @@
+'''
+Holds the per view request metrics recorded by nemi_project.middleware.InstrumentationMiddleware and renders
+them in the Prometheus text exposition format. Metrics are kept in memory by each process, so a scraper sees
+the totals of the process which answers it.
+'''
+from collections import defaultdict
+import threading
+
+# Upper bounds, in seconds, of the request duration histogram buckets
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# The (name, help) of the counters kept for each view
+COUNTERS = (
+    ('nemi_requests_total', 'Number of requests.'),
+    ('nemi_db_queries_total', 'Number of database queries made by requests.'),
+    ('nemi_db_seconds_total', 'Time spent in database queries by requests.'),
+    ('nemi_template_seconds_total', 'Time spent rendering templates by requests.'),
+    ('nemi_python_seconds_total', 'Time spent by requests outside of database queries and template rendering.'),
+    ('nemi_response_bytes_total', 'Size of the response content.'),
+)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RequestMetrics(object):
+    '''Totals of the request measurements for each view name.'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counters = dict((name, defaultdict(float)) for name, _ in COUNTERS)
+            self._buckets = defaultdict(lambda: [0] * len(DURATION_BUCKETS))
+            self._durations = defaultdict(float)
+
+    def record(self, view_name, duration, queries, db_time, template_time):
+        '''Adds the measurements of a request to view_name's totals. Times are in seconds.'''
+        with self._lock:
+            self._counters['nemi_requests_total'][view_name] += 1
+            self._counters['nemi_db_queries_total'][view_name] += queries
+            self._counters['nemi_db_seconds_total'][view_name] += db_time
+            self._counters['nemi_template_seconds_total'][view_name] += template_time
+            self._counters['nemi_python_seconds_total'][view_name] += max(duration - db_time - template_time, 0)
+            self._durations[view_name] += duration
+            buckets = self._buckets[view_name]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    buckets[i] += 1
+
+    def add_response_bytes(self, view_name, response_bytes):
+        with self._lock:
+            self._counters['nemi_response_bytes_total'][view_name] += response_bytes
+
+    def get(self, name, view_name):
+        '''Returns the value of the counter, name, for view_name.'''
+        with self._lock:
+            return self._counters[name].get(view_name, 0)
+
+    def render(self):
+        '''Returns the metrics in the Prometheus text exposition format.'''
+        lines = []
+        with self._lock:
+            for name, description in COUNTERS:
+                lines.append('# HELP %s %s' % (name, description))
+                lines.append('# TYPE %s counter' % name)
+                for view_name, value in sorted(self._counters[name].items()):
+                    lines.append('%s{view="%s"} %s' % (name, _escape(view_name), repr(float(value))))
+
+            name = 'nemi_request_duration_seconds'
+            lines.append('# HELP %s Duration of requests.' % name)
+            lines.append('# TYPE %s histogram' % name)
+            for view_name, buckets in sorted(self._buckets.items()):
+                view = _escape(view_name)
+                for bound, count in zip(DURATION_BUCKETS, buckets):
+                    lines.append('%s_bucket{view="%s",le="%s"} %d' % (name, view, bound, count))
+                count = int(self._counters['nemi_requests_total'][view_name])
+                lines.append('%s_bucket{view="%s",le="+Inf"} %d' % (name, view, count))
+                lines.append('%s_sum{view="%s"} %s' % (name, view, repr(self._durations[view_name])))
+                lines.append('%s_count{view="%s"} %d' % (name, view, count))
+        return '\n'.join(lines) + '\n'
+
+
+request_metrics = RequestMetrics()
@@ -0,0 +1,149 @@
+'''
+Provides a content addressed, on-disk cache of the pdf files stored in the database. Each pdf is stored once,
+named by the SHA-256 digest of its contents, under the objects directory. Entries in the keys directory map
+a cache key, such as ('live', revision_id), and a version, built from the revision's dates with pdf_version and
+the pdf's size, to a digest. An entry whose version no longer matches the database is a miss. When the objects
+exceed the maximum size, the least recently used ones are removed. Writes go to temporary files which are then renamed,
+so several processes can share the cache directory.
+'''
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+
+from django.conf import settings
+
+
+class CachedPdf(object):
+    '''A pdf file in the cache.'''
+
+    def __init__(self, path, digest, size):
+        self.path = path
+        self.digest = digest
+        self.size = size
+
+
+def pdf_version(*values):
+    '''Returns the version string for a pdf whose row has the values, such as its dates and size. Datetimes are
+    kept to the microsecond, so a pdf replaced on the day it was loaded gets a new version. The values should
+    always be read the same way, from a raw cursor, as the models' date fields drop the time.
+    '''
+    return '/'.join(value.isoformat() if isinstance(value, (datetime.date, datetime.time)) else str(value)
+                    for value in values)
+
+
+class PdfCache(object):
+    '''
+    An on-disk pdf cache in directory which holds at most max_size bytes of pdfs.
+    '''
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        self.objects_dir = os.path.join(directory, 'objects')
+        self.keys_dir = os.path.join(directory, 'keys')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.keys_dir, exist_ok=True)
+
+    def _key_path(self, key):
+        return os.path.join(self.keys_dir, hashlib.md5(repr(tuple(key)).encode('utf-8')).hexdigest())
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest)
+
+    def _write_atomic(self, path, chunks):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    def get(self, key, version):
+        '''Returns the CachedPdf for key if the cached pdf has version, otherwise None.'''
+        try:
+            with open(self._key_path(key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('version') != version:
+            return None
+
+        path = self._object_path(entry['digest'])
+        try:
+            # The modification time records when the object was last used
+            os.utime(path)
+            size = os.path.getsize(path)
+        except OSError:
+            return None
+        return CachedPdf(path, entry['digest'], size)
+
+    def put(self, key, version, chunks):
+        '''Stores the pdf contained in the iterable of bytes, chunks, as version of key and returns its CachedPdf.'''
+        sha = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.objects_dir, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    sha.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+            digest = sha.hexdigest()
+            os.replace(tmp_path, self._object_path(digest))
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+        entry = json.dumps({'version' : version, 'digest' : digest})
+        self._write_atomic(self._key_path(key), [entry.encode('utf-8')])
+        self.evict(keep=digest)
+        return CachedPdf(self._object_path(digest), digest, size)
+
+    def invalidate(self, key):
+        '''Removes the entry for key. The pdf itself stays in the cache until it is evicted.'''
+        try:
+            os.unlink(self._key_path(key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self, keep=None):
+        '''Removes the least recently used pdfs, other than the one with digest keep, until the cache holds
+        no more than max_size bytes.
+        '''
+        objects = []
+        total = 0
+        with os.scandir(self.objects_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                objects.append((stat.st_mtime, entry.name, stat.st_size))
+                total += stat.st_size
+
+        objects.sort()
+        for mtime, name, size in objects:
+            if total <= self.max_size:
+                break
+            if name == keep:
+                continue
+            try:
+                os.unlink(self._object_path(name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def get_pdf_cache():
+    '''Returns the PdfCache in the PDF_CACHE_DIR setting or None if the cache is not enabled.'''
+    directory = getattr(settings, 'PDF_CACHE_DIR', None)
+    if not directory:
+        return None
+    return PdfCache(directory, settings.PDF_CACHE_MAX_SIZE)
@@ -0,0 +1,116 @@
+'''
+Writes sitemaps as static gzipped files so that crawler requests are served from disk rather than rebuilt from
+the database. Each page of each section, at most the sitemap's limit of 50,000 urls, is a file listed by the
+sitemap index. The files are kept as common.utils.built_files.BuiltFiles, whose manifest also records the digest
+of each page, which is the page's ETag. They are rebuilt when they are SITEMAP_MAX_AGE seconds old or methods
+change. A rebuild reads every page's urls but only renders and writes the pages whose urls have changed.
+'''
+import hashlib
+import json
+import os
+
+from django.conf import settings
+from django.template.loader import render_to_string
+
+from .built_files import BuiltFiles
+
+INDEX_NAME = 'index'
+
+
+def page_name(section, page):
+    return '%s-%d' % (section, page)
+
+
+class SitemapFiles(BuiltFiles):
+    '''The sitemap files for the dictionary of sitemaps, which maps a section name to a Sitemap class or instance,
+    held in directory, which defaults to the SITEMAP_DIR setting. location(name) returns the path of the url of
+    the page, name.
+    '''
+
+    def __init__(self, directory, sitemaps, location):
+        self._directory = directory
+        self.sitemaps = sitemaps
+        self.location = location
+
+    @property
+    def directory(self):
+        return self._directory or settings.SITEMAP_DIR
+
+    @property
+    def max_age(self):
+        return settings.SITEMAP_MAX_AGE
+
+    def page_path(self, name):
+        return self.path('sitemap-%s.xml.gz' % name)
+
+    def _write_page(self, name, template, context, previous_etag=None):
+        '''Renders the page, name, and writes it unless its content is unchanged. Returns its etag.'''
+        content = render_to_string(template, context).encode('utf-8')
+        etag = hashlib.md5(content).hexdigest()
+        if etag != previous_etag or not os.path.exists(self.page_path(name)):
+            with self.atomic_file(self.page_path(name), compress=True) as f:
+                f.write(content)
+        return etag
+
+    def is_current(self, manifest, site, protocol):
+        return (manifest.get('domain') == site.domain and
+                manifest.get('protocol') == protocol and
+                super(SitemapFiles, self).is_current(manifest))
+
+    def build(self, site, protocol):
+        '''Writes the sitemap pages whose urls have changed and the index. Returns a tuple of the number of
+        pages written and the number of pages which were unchanged.
+        '''
+        manifest = super(SitemapFiles, self).build(site, protocol)
+        return manifest['written'], len(manifest['pages']) - manifest['written']
+
+    def build_files(self, site, protocol):
+        previous = self.read_manifest()
+        if previous.get('domain') != site.domain or previous.get('protocol') != protocol:
+            previous = {}
+        previous_pages = previous.get('pages', {})
+
+        pages = {}
+        locations = []
+        written = 0
+        for section, sitemap in self.sitemaps.items():
+            if callable(sitemap):
+                sitemap = sitemap()
+            for page in sitemap.paginator.page_range:
+                name = page_name(section, page)
+                urls = sitemap.get_urls(page=page, site=site, protocol=protocol)
+                urls_digest = hashlib.md5(json.dumps(
+                    [(url['location'], str(url['lastmod']), url['changefreq'], url['priority']) for url in urls]
+                ).encode('utf-8')).hexdigest()
+
+                entry = previous_pages.get(name)
+                if entry is None or entry['urls'] != urls_digest or not os.path.exists(self.page_path(name)):
+                    entry = {'urls' : urls_digest,
+                             'etag' : self._write_page(name, 'sitemap.xml', {'urlset' : urls})}
+                    written += 1
+                pages[name] = entry
+                locations.append('%s://%s%s' % (protocol, site.domain, self.location(name)))
+
+        index_etag = self._write_page(INDEX_NAME, 'sitemap_index.xml', {'sitemaps' : locations}, previous.get('index'))
+        for name in previous_pages:
+            if name not in pages and os.path.exists(self.page_path(name)):
+                os.remove(self.page_path(name))
+
+        return {'domain' : site.domain,
+                'protocol' : protocol,
+                'index' : index_etag,
+                'pages' : pages,
+                'written' : written}
+
+    def get(self, name, site, protocol):
+        '''Returns the (path, etag) of the gzipped file of the sitemap page or index, name, rebuilding the files
+        if they are out of date. Returns None if there is no such page.
+        '''
+        manifest = self.get_manifest(site, protocol)
+        if name == INDEX_NAME:
+            etag = manifest.get('index')
+        else:
+            etag = manifest.get('pages', {}).get(name, {}).get('etag')
+        if etag is None:
+            return None
+        return self.page_path(name), etag
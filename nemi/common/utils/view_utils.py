@@ -3,34 +3,101 @@ Created on Mar 20, 2012
 
 @author: mbucknel
 '''
+import base64
+import binascii
+import json
+import re
+from tempfile import SpooledTemporaryFile
+
 # Provides conversion to Excel format
 from xlwt import Workbook
 
-from django.http import HttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+
+from .xlsx import write_xlsx
+
+TSV_CHUNK_SIZE = 2000  # Number of rows fetched from the database and encoded at a time when streaming a tsv file
+
+XLSX_SPOOL_SIZE = 5 * 1024 * 1024  # Size in bytes at which an xlsx file being written is moved from memory to disk
+
+XLS_MAX_ROWS = 65536  # Number of rows, including the headings, which an xls sheet can hold
+
+_RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Backslash escapes for the characters which can not appear within a tab-separated value
+_TSV_ESCAPES = str.maketrans({'\\' : '\\\\', '\t' : '\\t', '\n' : '\\n', '\r' : '\\r'})
 
 def dictfetchall(cursor):
     '''Returns all rows from the cursor query as a dictionary with the key value equal to column name in uppercase'''
     desc = cursor.description
-    return [dict(zip([col[0] for col in desc], row))
+    return [dict(zip([col[0].upper() for col in desc], row))
             for row in cursor.fetchall()]
 
-def tsv_response(headings, vl_qs, filename):
-    ''' Returns an http response which contains a tab-separate-values file
+def tsv_value(value):
+    '''Returns value as a string suitable for a tab-separated values file. Tabs, newlines, carriage returns
+    and backslashes are escaped with a backslash.
+    '''
+    return str(value).translate(_TSV_ESCAPES)
+
+def iter_rows(vl_qs, chunk_size=TSV_CHUNK_SIZE):
+    '''Returns an iterator over the rows in vl_qs. If vl_qs is a query set, rows are fetched from the
+    database chunk_size rows at a time rather than loading the whole result into memory.
+    '''
+    if hasattr(vl_qs, 'iterator'):
+        return vl_qs.iterator(chunk_size=chunk_size)
+    return iter(vl_qs)
+
+def _tsv_content(headings, rows, chunk_size):
+    '''Generator which yields the encoded contents of a tab-separated values file, chunk_size rows at a time.'''
+    yield ('\t'.join(headings) + '\n').encode('utf-8')
+
+    lines = []
+    for row in rows:
+        lines.append(''.join('%s\t' % tsv_value(col) for col in row) + '\n')
+        if len(lines) >= chunk_size:
+            yield ''.join(lines).encode('utf-8')
+            lines = []
+
+    if lines:
+        yield ''.join(lines).encode('utf-8')
+
+def write_tsv(fileobj, headings, vl_qs, chunk_size=TSV_CHUNK_SIZE):
+    '''Writes a tab-separated values file representing the values list query set, vl_qs, with headings as the
+    column headers to the binary file, fileobj, chunk_size rows at a time.
+    '''
+    for content in _tsv_content(headings, iter_rows(vl_qs, chunk_size), chunk_size):
+        fileobj.write(content)
+
+def tsv_response(headings, vl_qs, filename, chunk_size=TSV_CHUNK_SIZE):
+    ''' Returns a streaming http response which contains a tab-separate-values file
     representing the values list query set, vl_qs, and using headings as the
     column headers. filename will be the name of the file created with the suffix *.tsv
+    vl_qs may also be any iterable of rows. Rows are read and encoded chunk_size rows at a time
+    so that memory use does not depend on the number of rows.
     '''
-    response = HttpResponse(content_type='text/tab-separated-values')
+    response = StreamingHttpResponse(_tsv_content(headings, iter_rows(vl_qs, chunk_size), chunk_size),
+                                     content_type='text/tab-separated-values')
     response['Content-Disposition'] = ('attachment; filename=%s.tsv' % filename)
 
-    response.write('\t'.join(headings))
-    response.write('\n')
+    return response
 
-    for row in vl_qs:
-        for col in row:
-            response.write('%s\t' % str(col))
-        response.write('\n')
+def write_xls(fileobj, headings, vl_qs):
+    '''Writes an Excel file representing the values list query set, vl_qs, with headings as the column
+    headers to fileobj.
+    '''
+    wb = Workbook()
+    ws = wb.add_sheet('sheet 1')
 
-    return response
+    for col_i, heading in enumerate(headings):
+        ws.write(0, col_i, heading)
+
+    for row_i, row in enumerate(vl_qs):
+        for col_i, value in enumerate(row):
+            ws.write(row_i + 1, col_i, value)
+
+    wb.save(fileobj)
 
 def xls_response(headings, vl_qs, filename):
     '''Returns an http response which contains an Excel file
@@ -40,16 +107,84 @@ def xls_response(headings, vl_qs, filename):
     response = HttpResponse(content_type='application/vnd.ms-excel')
     response['Content-Disposition'] = ('attachment; filename=%s.xls' % filename)
 
-    wb = Workbook()
-    ws = wb.add_sheet('sheet 1')
+    write_xls(response, headings, vl_qs)
 
-    for col_i, heading in enumerate(headings):
-        ws.write(0, col_i, heading)
+    return response
 
-    for row_i, row in enumerate(vl_qs):
-        for col_i, value in enumerate(row):
-            ws.write(row_i + 1, col_i, value)
+def xlsx_response(headings, vl_qs, filename, numeric_columns=(), chunk_size=TSV_CHUNK_SIZE):
+    '''Returns a streaming http response which contains an Excel 2007+ workbook
+    representing the values list query set, vl_qs, and using headings as the column headers.
+    filename will be the name of the file created with the suffix *.xlsx. Values in the column indexes
+    in numeric_columns are written as numbers when possible. The workbook is written to a spooled
+    temporary file a chunk of rows at a time, so it is not limited by memory or by the 65,536 rows of an xls file.
+    '''
+    spool = SpooledTemporaryFile(max_size=XLSX_SPOOL_SIZE)
+    try:
+        write_xlsx(spool, headings, iter_rows(vl_qs, chunk_size), numeric_columns=numeric_columns,
+                   chunk_size=chunk_size)
+        size = spool.tell()
+        spool.seek(0)
+    except Exception:
+        spool.close()
+        raise
 
-    wb.save(response)
+    response = FileResponse(spool, content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    response['Content-Length'] = size
+    response['Content-Disposition'] = ('attachment; filename=%s.xlsx' % filename)
 
     return response
+
+def encode_cursor(values):
+    '''Returns an opaque, url safe cursor string which holds the list of values.'''
+    return base64.urlsafe_b64encode(json.dumps(values, cls=DjangoJSONEncoder).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor, length):
+    '''Returns the list of values held in cursor. Raises ValueError if cursor is not a valid cursor
+    containing length values.
+    '''
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (binascii.Error, UnicodeError, json.JSONDecodeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != length:
+        raise ValueError('Invalid cursor')
+    return values
+
+def keyset_filter(fields, values):
+    '''Returns a Q object which selects the rows which follow the row containing values when rows are ordered
+    ascending by fields. fields should not contain null values and together should identify a row.
+    '''
+    result = Q()
+    equal = {}
+    for field, value in zip(fields, values):
+        result |= Q(**dict(equal, **{field + '__gt' : value}))
+        equal[field] = value
+    return result
+
+def parse_range_header(header, size):
+    '''Returns the (start, stop) byte offsets, with stop exclusive, requested by the Range header value for a
+    representation of size bytes. Returns None if the header should be ignored, which is the case for multiple
+    ranges and units other than bytes. Raises ValueError if the range can not be satisfied.
+    '''
+    match = _RANGE_PATTERN.match(header.replace(' ', ''))
+    if match is None:
+        return None
+
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        stop = min(int(last) + 1, size) if last else size
+        if last and int(last) < start:
+            return None
+    elif last:
+        # A suffix range, the last bytes of the representation
+        start = max(size - int(last), 0)
+        stop = size
+        if int(last) == 0:
+            raise ValueError('Unsatisfiable range')
+    else:
+        return None
+
+    if start >= size:
+        raise ValueError('Unsatisfiable range')
+    return start, stop
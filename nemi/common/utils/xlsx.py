@@ -0,0 +1,164 @@
+'''
+Writes Office Open XML (.xlsx) workbooks a row at a time. Worksheet XML is compressed into the zip file as it
+is generated and cells use inline strings rather than a shared strings table, so memory use does not depend
+on the number of rows written. A worksheet holds at most XLSX_MAX_ROWS rows, including the headings. Rows
+beyond that are continued on additional worksheets which repeat the headings.
+'''
+from decimal import Decimal
+import math
+import re
+from xml.sax.saxutils import escape
+import zipfile
+
+XLSX_MAX_ROWS = 1048576
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '%s'
+    '</Types>'
+)
+_CONTENT_TYPE_SHEET = ('<Override PartName="/xl/worksheets/sheet%d.xml" '
+                       'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>')
+
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets>%s</sheets>'
+    '</workbook>'
+)
+_WORKBOOK_SHEET = '<sheet name="sheet %d" sheetId="%d" r:id="rId%d"/>'
+
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '%s'
+    '</Relationships>'
+)
+_WORKBOOK_RELS_SHEET = ('<Relationship Id="rId%d" '
+                        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+                        'Target="worksheets/sheet%d.xml"/>')
+
+_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_END = '</sheetData></worksheet>'
+
+# Characters which are not allowed in an XML 1.0 document
+_INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+
+def _number(value):
+    '''Returns the string representation of value to use in a numeric cell or None if value is not a finite number.
+    If value is a string, it is converted to a number if possible.
+    '''
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, str):
+        try:
+            value = Decimal(value.strip())
+        except ArithmeticError:
+            return None
+    if isinstance(value, (float, Decimal)):
+        value = float(value)
+        if math.isfinite(value):
+            return repr(value)
+    return None
+
+
+def xlsx_cell(value, numeric=False):
+    '''Returns the xml for a cell containing value. Numbers are written as numeric cells and
+    strings as inline strings. If numeric is True, strings which contain a number are written as numeric cells.
+    '''
+    if value is None:
+        return '<c/>'
+    if isinstance(value, bool):
+        return '<c t="b"><v>%d</v></c>' % value
+    if numeric or not isinstance(value, str):
+        number = _number(value)
+        if number is not None:
+            return '<c><v>%s</v></c>' % number
+
+    return '<c t="inlineStr"><is><t xml:space="preserve">%s</t></is></c>' % \
+        escape(_INVALID_XML_CHARS.sub('', str(value)))
+
+
+def _row(row_number, cells):
+    return '<row r="%d">%s</row>' % (row_number, ''.join(cells))
+
+
+def write_xlsx(fileobj, headings, rows, numeric_columns=(), max_rows=XLSX_MAX_ROWS, chunk_size=2000):
+    '''Writes a workbook to fileobj, which must be seekable, with headings as the first row of each worksheet
+    followed by the rows of the iterable, rows. Values in the column indexes in numeric_columns are written as
+    numeric cells when they contain a number. Rows are compressed chunk_size rows at a time.
+    Returns the number of worksheets written.
+    '''
+    heading_row = _row(1, [xlsx_cell(heading) for heading in headings])
+    numeric_columns = frozenset(numeric_columns)
+    rows = iter(rows)
+
+    with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED) as xlsx:
+        sheet_count = 0
+        more_rows = True
+        while more_rows:
+            sheet_count += 1
+            with xlsx.open('xl/worksheets/sheet%d.xml' % sheet_count, 'w', force_zip64=True) as sheet:
+                sheet.write((_SHEET_START + heading_row).encode('utf-8'))
+
+                lines = []
+                row_number = 1
+                more_rows = False
+                for row in rows:
+                    row_number += 1
+                    lines.append(_row(row_number,
+                                      [xlsx_cell(value, col_i in numeric_columns) for col_i, value in enumerate(row)]))
+                    if len(lines) >= chunk_size:
+                        sheet.write(''.join(lines).encode('utf-8'))
+                        lines = []
+                    if row_number >= max_rows:
+                        more_rows = True
+                        break
+
+                lines.append(_SHEET_END)
+                sheet.write(''.join(lines).encode('utf-8'))
+
+            # Don't leave an empty worksheet when the last one was filled exactly
+            if more_rows:
+                try:
+                    first_row = next(rows)
+                except StopIteration:
+                    more_rows = False
+                else:
+                    rows = _prepend(first_row, rows)
+
+        sheet_numbers = range(1, sheet_count + 1)
+        xlsx.writestr('[Content_Types].xml',
+                      _CONTENT_TYPES % ''.join(_CONTENT_TYPE_SHEET % i for i in sheet_numbers))
+        xlsx.writestr('_rels/.rels', _ROOT_RELS)
+        xlsx.writestr('xl/workbook.xml', _WORKBOOK % ''.join(_WORKBOOK_SHEET % (i, i, i) for i in sheet_numbers))
+        xlsx.writestr('xl/_rels/workbook.xml.rels',
+                      _WORKBOOK_RELS % ''.join(_WORKBOOK_RELS_SHEET % (i, i) for i in sheet_numbers))
+
+    return sheet_count
+
+
+def _prepend(first, rest):
+    yield first
+    yield from rest
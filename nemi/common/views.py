@@ -1,28 +1,121 @@
 
+import calendar
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import hashlib
+import json
+import os
+import re
+
 import requests
 
+from django.contrib.sites.shortcuts import get_current_site
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
 from django.forms import Form
-from django.http import Http404, HttpResponse
+from django.http import FileResponse, Http404, HttpRequest, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, urlencode
+from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import View
 from django.views.generic.edit import TemplateResponseMixin
 
-from .models import DefinitionsDOM
-from .utils.view_utils import xls_response, tsv_response
+from .models import BackgroundJob, DefinitionsDOM
+from .utils.cache import get_data_cache, versioned_key
+from .utils.exports import EXPORT_CONTENT_TYPES, EXPORT_JOB_KIND, export_path
+from .utils.http import HOP_BY_HOP_HEADERS, get_http_session, get_http_timeout
+from .utils.pdf_cache import get_pdf_cache
+from .utils.sitemap_files import INDEX_NAME
+from .utils.view_utils import parse_range_header, xls_response, tsv_response
 
 
 class ChoiceJsonView(View):
-    ''' Extends the standard View to return a JSON object representing a list of choices
+    ''' Extends the standard View to return a JSON object representing a list of choices.
+    If cache_choices is True, the JSON is kept in the data cache and served with an ETag. The cache key
+    includes the view class, the GET parameters listed in cache_params and the data version, so
+    entries are invalidated whenever the data version is bumped.
     '''
+    cache_choices = False
+    cache_params = ()  # GET parameters which change the choices returned by get_choices
+
     def get_choices(self, request, *args, **kwargs):
         ''' Returns a list of tuples representing the choices. The first element in the tuple is the value
         and the second is the display value.
         '''
 
-    def get(self, request, *args, **kwargs):
+    def get_choices_content(self, request, *args, **kwargs):
+        '''Returns the JSON string representing the choices.'''
         choices = ['{"value" : "' + value + '", "display_value" : "' + display_value + '"}'
                    for (value, display_value) in self.get_choices(request, *args, **kwargs)]
 
-        return HttpResponse('{"choices" : [' + ','.join(choices) + ']}', content_type='application/json')
+        return '{"choices" : [' + ','.join(choices) + ']}'
+
+    def get_cache_key(self, request):
+        '''Returns the data cache key for the choices requested.'''
+        view_name = '%s.%s' % (self.__class__.__module__, self.__class__.__name__)
+        params = ['%s=%s' % (p, ','.join(request.GET.getlist(p))) for p in self.cache_params]
+        return versioned_key('choices', view_name, *params)
+
+    def get(self, request, *args, **kwargs):
+        if not self.cache_choices:
+            return HttpResponse(self.get_choices_content(request, *args, **kwargs), content_type='application/json')
+
+        cache = get_data_cache()
+        cache_key = self.get_cache_key(request)
+        content = cache.get(cache_key)
+        if content is None:
+            content = self.get_choices_content(request, *args, **kwargs)
+            cache.set(cache_key, content)
+
+        etag = '"%s"' % hashlib.md5(content.encode('utf-8')).hexdigest()
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+
+        return response
+
+
+def _pdf_reader(pdf):
+    '''Returns a (size, read) tuple for pdf, where read(offset, amount) returns amount bytes starting at the zero based
+    offset. pdf may be an Oracle LOB, a seekable file like object, bytes or a string.
+    '''
+    if callable(getattr(pdf, 'size', None)):
+        # LOB offsets start at one
+        return pdf.size(), lambda offset, amount: pdf.read(offset + 1, amount)
+
+    if hasattr(pdf, 'seek'):
+        size = pdf.seek(0, os.SEEK_END)
+        pdf.seek(0)
+
+        def read(offset, amount):
+            pdf.seek(offset)
+            return pdf.read(amount)
+        return size, read
+
+    if isinstance(pdf, str):
+        pdf = pdf.encode('utf-8')
+    return len(pdf), lambda offset, amount: pdf[offset:offset + amount]
+
+
+def _pdf_content(read, start, stop, chunk_size, fileobj=None):
+    '''Generator which yields the bytes from start up to stop using read, chunk_size bytes at a time.
+    If fileobj is given, it is closed when the generator finishes.
+    '''
+    try:
+        offset = start
+        while offset < stop:
+            chunk = read(offset, min(chunk_size, stop - offset))
+            if not chunk:
+                break
+            offset += len(chunk)
+            yield chunk
+    finally:
+        if fileobj is not None:
+            fileobj.close()
 
 
 class PdfView(View):
@@ -30,15 +123,24 @@ class PdfView(View):
     Extends the standard View to return a response containing a downloadable file, which is assumed to be a pdf file.
     The mimetype pdf and filename suffix can be specified as attributes or by overriding get_response_info to retrieve
     the mimetype, pdf, and filename from the request, args, and/or kwargs.
+    The pdf is streamed chunk_size bytes at a time and single byte range requests are supported, so the
+    pdf is never held in memory.
+    If cache_key is set and the pdf cache is enabled (see common.utils.pdf_cache), the pdf is copied to the cache
+    the first time it is requested at cache_version and size and then served from the cache with its digest as
+    the ETag.
     '''
 
     mimetype = ''
     pdf = None
     filename = ''
+    chunk_size = 64 * 1024
+    cache_key = None
+    cache_version = None
 
     def get_pdf_info(self):
         '''This should be overridden if the above parameters are not defined when extending the class
-         The function should retrieve the information. Note that pdf should be a file like object.
+         The function should retrieve the information. Note that pdf should be a file like object, an
+         Oracle LOB, or the contents of the file.
          '''
         pass
 
@@ -48,10 +150,105 @@ class PdfView(View):
         if not self.mimetype or not self.pdf:
             return Http404
 
-        response = HttpResponse(content_type=self.mimetype)
+        pdf = self.pdf
+        fileobj = None
+        etag = None
+        pdf_cache = get_pdf_cache() if self.cache_key is not None else None
+        if pdf_cache is not None:
+            # The pdf's size is part of its version, so a pdf replaced without a change to its dates is a miss
+            size, read = _pdf_reader(self.pdf)
+            version = '%s/%d' % (self.cache_version, size)
+            cached = pdf_cache.get(self.cache_key, version)
+            if cached is None:
+                cached = pdf_cache.put(self.cache_key, version, _pdf_content(read, 0, size, self.chunk_size))
+
+            etag = '"%s"' % cached.digest
+            response = get_conditional_response(request, etag=etag)
+            if response is not None:
+                return response
+            pdf = fileobj = open(cached.path, 'rb')
+
+        size, read = _pdf_reader(pdf)
+        meta = getattr(request, 'META', {})
+        byte_range = None
+        # A range is only served if the If-Range validator, when given, matches the pdf
+        if 'HTTP_RANGE' in meta and meta.get('HTTP_IF_RANGE', etag) == etag:
+            try:
+                byte_range = parse_range_header(meta['HTTP_RANGE'], size)
+            except ValueError:
+                if fileobj is not None:
+                    fileobj.close()
+                response = HttpResponse(status=416)
+                response['Content-Range'] = 'bytes */%d' % size
+                return response
+
+        if byte_range is None:
+            start, stop = 0, size
+            if fileobj is not None:
+                response = FileResponse(fileobj, content_type=self.mimetype)
+            else:
+                response = StreamingHttpResponse(_pdf_content(read, start, stop, self.chunk_size),
+                                                 content_type=self.mimetype)
+        else:
+            start, stop = byte_range
+            response = StreamingHttpResponse(_pdf_content(read, start, stop, self.chunk_size, fileobj),
+                                             content_type=self.mimetype, status=206)
+            response['Content-Range'] = 'bytes %d-%d/%d' % (start, stop - 1, size)
+
+        response['Content-Length'] = stop - start
+        response['Accept-Ranges'] = 'bytes'
         response['Content-Disposition'] = 'attachment;filename=%s.pdf' % self.filename
+        if etag is not None:
+            response['ETag'] = etag
+
+        return response
+
+
+class CachedPageMixin(object):
+    '''
+    Mixin for template views which keeps the rendered page in the data cache and handles conditional requests.
+    Views must implement get_page_version, which returns a (last modified date, version) tuple for the
+    requested page or None if the page should not be cached. The cache key includes the request path,
+    the version and the data version, so a page is rendered again when its version changes or the data
+    version is bumped. Pages are only cached for anonymous users since the templates show editing links
+    to users who are logged in.
+    '''
+
+    page_cache_timeout = DEFAULT_TIMEOUT  # Seconds, defaults to the data cache's timeout
+
+    def get_page_version(self):
+        raise NotImplementedError
 
-        response.write(self.pdf)
+    def get(self, request, *args, **kwargs):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return super(CachedPageMixin, self).get(request, *args, **kwargs)
+
+        page_version = self.get_page_version()
+        if page_version is None:
+            return super(CachedPageMixin, self).get(request, *args, **kwargs)
+
+        last_modified_date, version = page_version
+        cache_key = versioned_key('page', request.path, version)
+        etag = '"%s"' % hashlib.md5(cache_key.encode('utf-8')).hexdigest()
+        last_modified = calendar.timegm(last_modified_date.timetuple()) if last_modified_date else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            cache = get_data_cache()
+            page = cache.get(cache_key)
+            if page is None:
+                response = super(CachedPageMixin, self).get(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                response.render()
+                cache.set(cache_key, (response.content, response['Content-Type']), self.page_cache_timeout)
+            else:
+                response = HttpResponse(page[0], content_type=page[1])
+
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
 
         return response
 
@@ -184,34 +381,246 @@ class ExportSearchView(View):
             raise Http404
 
 
+def _upstream_content(resp, chunk_size):
+    '''Generator which yields the body of the streamed requests response, resp, chunk_size bytes at a time and
+    then returns its connection to the pool.
+    '''
+    try:
+        for chunk in resp.iter_content(chunk_size):
+            yield chunk
+    finally:
+        resp.close()
+
+
 class SimpleWebProxyView(View):
     '''Extends the standard View to implement a simple web proxy. Currently only get and head methods
     are proxied. The class should be extended by assigning a value to service_url.
+    Requests use the shared, pooled session in common.utils.http and the body of a GET response is streamed
+    to the client chunk_size bytes at a time. If cache_timeout is set, responses to HEAD requests and to GET
+    requests for ops ending in count are kept in the default cache for that many seconds.
     '''
     service_url = ''  # Destination url
     http_method_names = ['get', 'head']  # This should be a list of method strings. Currently only HEAD and GET are implemented
+    chunk_size = 64 * 1024
+    cache_timeout = 0
 
     def _target_url(self, request, **kwargs):
         return '%s/%s?%s' % (self.service_url, kwargs.get('op', ''), request.META.get('QUERY_STRING'))
 
+    def _is_cached(self, request, **kwargs):
+        return self.cache_timeout and (request.method == 'HEAD' or kwargs.get('op', '').rstrip('/').endswith('count'))
+
+    def _cache_key(self, request, **kwargs):
+        digest = hashlib.md5(('%s\x1f%s' % (kwargs.get('op', ''), request.META.get('QUERY_STRING'))).encode('utf-8'))
+        return 'proxy:%s:%s:%s' % (self.service_url, request.method, digest.hexdigest())
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method.lower() not in self.http_method_names or not self._is_cached(request, **kwargs):
+            return super(SimpleWebProxyView, self).dispatch(request, *args, **kwargs)
+
+        key = self._cache_key(request, **kwargs)
+        cached = caches['default'].get(key)
+        if cached is None:
+            response = super(SimpleWebProxyView, self).dispatch(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            content = b''.join(response) if response.streaming else response.content
+            cached = (content, [(header, value) for header, value in response.items()])
+            caches['default'].set(key, cached, self.cache_timeout)
+
+        content, headers = cached
+        http_resp = HttpResponse(content)
+        for header, value in headers:
+            http_resp[header] = value
+        return http_resp
+
     def get(self, request, *args, **kwargs):
-        resp = requests.get(self._target_url(request, **kwargs))
+        try:
+            resp = get_http_session().get(self._target_url(request, **kwargs), stream=True, timeout=get_http_timeout())
+        except requests.Timeout:
+            return HttpResponse('Request failed', status=504)
+        except requests.RequestException:
+            return HttpResponse('Request failed', status=502)
+
         if resp.status_code == 200:
-            http_resp = HttpResponse(resp.text, content_type=resp.headers['content-type'], status=resp.status_code)
-            http_resp['Content-Disposition'] = resp.headers['content-disposition']
+            http_resp = StreamingHttpResponse(_upstream_content(resp, self.chunk_size),
+                                              content_type=resp.headers.get('content-type'), status=resp.status_code)
+            if 'content-disposition' in resp.headers:
+                http_resp['Content-Disposition'] = resp.headers['content-disposition']
         else:
+            resp.close()
             http_resp = HttpResponse('Request failed', status=resp.status_code)
 
-
         return http_resp
 
     def head(self, request, *args, **kwargs):
-        resp = requests.head(self._target_url(request, **kwargs))
+        try:
+            resp = get_http_session().head(self._target_url(request, **kwargs), timeout=get_http_timeout())
+        except requests.Timeout:
+            return HttpResponse('Request failed', status=504)
+        except requests.RequestException:
+            return HttpResponse('Request failed', status=502)
+
         if resp.status_code == 200:
-            http_resp = HttpResponse(resp.text, status=resp.status_code)
+            http_resp = HttpResponse(status=resp.status_code)
             for key in resp.headers:
-                http_resp[key] = resp.headers[key]
+                if key.lower() not in HOP_BY_HOP_HEADERS:
+                    http_resp[key] = resp.headers[key]
         else:
             http_resp = HttpResponse('Request failed', status=resp.status_code)
 
         return http_resp
+
+
+class BatchWebProxyView(View):
+    '''Accepts a POST whose JSON body is a list of operations for the proxy, proxy_view_class, and runs them concurrently,
+    at most max_concurrency at a time, returning all of the results in one JSON response. Each operation is an
+    object with an op, an optional method, HEAD (the default) or GET, and optional params, an object of query
+    parameters whose values are strings or lists of strings. GET is only allowed for ops ending in count so that the
+    combined response stays small. Each result has the status, the response headers and, for GET, the content.
+    The operations use the proxy view, so they share its connection pool and cache.
+    '''
+    proxy_view_class = SimpleWebProxyView
+    http_method_names = ['post']
+    max_operations = 50
+    max_concurrency = 8
+    op_pattern = re.compile(r'[A-Za-z0-9-_/]*')  # The ops accepted by the proxy's url pattern
+
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        # The proxied operations are read only so the view does not need CSRF protection
+        return super(BatchWebProxyView, self).dispatch(request, *args, **kwargs)
+
+    def _operation(self, operation):
+        '''Returns the validated (method, op, query string) of operation. Raises ValueError if it is invalid.'''
+        if not isinstance(operation, dict) or not isinstance(operation.get('op'), str):
+            raise ValueError('Each operation must be an object with an op')
+        method = operation.get('method', 'HEAD').upper()
+        op = operation['op']
+        if not self.op_pattern.fullmatch(op):
+            raise ValueError('Invalid op %s' % op)
+        if method not in ('HEAD', 'GET'):
+            raise ValueError('Unsupported method %s' % method)
+        if method == 'GET' and not op.rstrip('/').endswith('count'):
+            raise ValueError('Only count ops can be retrieved with GET')
+        params = operation.get('params', {})
+        if not isinstance(params, dict):
+            raise ValueError('params must be an object')
+        return method, op, urlencode(params, doseq=True)
+
+    def _run(self, method, op, query_string):
+        sub_request = HttpRequest()
+        sub_request.method = method
+        sub_request.META['QUERY_STRING'] = query_string
+        response = self.proxy_view_class.as_view()(sub_request, op=op)
+        try:
+            result = {
+                'op' : op,
+                'method' : method,
+                'status' : response.status_code,
+                'headers' : dict(response.items()),
+            }
+            if method == 'GET':
+                content = b''.join(response) if response.streaming else response.content
+                result['content'] = content.decode(response.charset, 'replace')
+        finally:
+            response.close()
+        return result
+
+    def post(self, request, *args, **kwargs):
+        try:
+            operations = json.loads(request.body.decode('utf-8'))
+            if not isinstance(operations, list) or not operations:
+                raise ValueError('The request must contain a list of operations')
+            if len(operations) > self.max_operations:
+                raise ValueError('At most %d operations can be requested' % self.max_operations)
+            operations = [self._operation(operation) for operation in operations]
+        except (ValueError, TypeError) as e:
+            return JsonResponse({'error' : str(e)}, status=400)
+
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(operations))) as executor:
+            results = list(executor.map(lambda operation: self._run(*operation), operations))
+
+        return JsonResponse({'results' : results})
+
+
+class JobStatusView(View):
+    '''Returns the JSON status of the BackgroundJob with job_id. A job started by a user can only be seen by
+    that user or a superuser. Other jobs can only be seen by staff, except for jobs of public_kinds, whose
+    results are public data, which can be seen by anyone given the job's id.
+    '''
+    public_kinds = (EXPORT_JOB_KIND,)
+
+    def get(self, request, *args, **kwargs):
+        job = get_object_or_404(BackgroundJob, job_id=kwargs['job_id'])
+        if job.username:
+            allowed = request.user.is_superuser or request.user.username == job.username
+        else:
+            allowed = request.user.is_staff or job.kind in self.public_kinds
+        if not allowed:
+            raise Http404
+
+        return JsonResponse({
+            'job_id' : job.job_id,
+            'kind' : job.kind,
+            'status' : job.status,
+            'total' : job.total,
+            'completed' : job.completed,
+            'errors' : job.get_errors(),
+            'result' : job.result,
+            'created' : job.created.isoformat(),
+            'updated' : job.updated.isoformat(),
+            'download' : (reverse('job_download', args=[job.job_id])
+                          if job.kind == EXPORT_JOB_KIND and job.status == BackgroundJob.FINISHED else None),
+        })
+
+
+class JobDownloadView(View):
+    '''Returns the file written by the finished export job with job_id.'''
+
+    def get(self, request, *args, **kwargs):
+        job = get_object_or_404(BackgroundJob, job_id=kwargs['job_id'], kind=EXPORT_JOB_KIND,
+                                status=BackgroundJob.FINISHED)
+        try:
+            fileobj = open(export_path(job.result), 'rb')
+        except (ValueError, OSError):
+            # The file has been removed
+            raise Http404
+
+        filename = os.path.basename(job.result)
+        response = FileResponse(fileobj, content_type=EXPORT_CONTENT_TYPES.get(filename.rsplit('.', 1)[-1]))
+        response['Content-Disposition'] = 'attachment; filename=%s' % filename
+        return response
+
+
+class SitemapView(View):
+    '''Serves the index or a page, name, of the static sitemap files, sitemap_files. The gzipped file is
+    sent as is to clients which accept gzip.
+    '''
+    sitemap_files = None  # A common.utils.sitemap_files.SitemapFiles
+
+    def get(self, request, name=INDEX_NAME, *args, **kwargs):
+        found = self.sitemap_files.get(name, get_current_site(request), request.scheme)
+        if found is None:
+            raise Http404
+        path, digest = found
+        try:
+            last_modified = int(os.path.getmtime(path))
+            with open(path, 'rb') as f:
+                content = f.read()
+        except OSError:
+            raise Http404
+
+        gzipped = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+        etag = '"%s%s"' % (digest, '-gzip' if gzipped else '')
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            if gzipped:
+                response = HttpResponse(content, content_type='application/xml')
+                response['Content-Encoding'] = 'gzip'
+            else:
+                response = HttpResponse(gzip.decompress(content), content_type='application/xml')
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
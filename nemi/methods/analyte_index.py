@@ -0,0 +1,123 @@
+'''
+Provides the in-process indexes used to answer the analyte name and code autocomplete requests.
+Each index holds its keys in a sorted array, used to find prefix matches with a binary search, along
+with postings lists of the one to three character n-grams in the keys, used to find substring matches.
+Matching is case insensitive. The indexes are used when the ANALYTE_SELECT_INDEX setting is True.
+Otherwise query_analytes answers the same searches from the database.
+'''
+from bisect import bisect_left
+
+from django.db.models.functions import Upper
+
+from common.utils.cache import version_cached
+
+from .models import AnalyteCodeRel, AnalyteCodeVW
+
+GRAM_SIZE = 3
+
+
+def _grams(key, size):
+    return set(key[i:i + size] for i in range(len(key) - size + 1))
+
+
+class AnalyteIndex(object):
+    '''
+    Index of (key, value) entries which can be searched for keys containing a term. Searches return the
+    values of the matching entries, with the entries whose key starts with the term first, each in key order.
+    '''
+
+    def __init__(self, entries):
+        entries = sorted((key.upper(), key, value) for key, value in entries)
+        self._keys = [e[0] for e in entries]
+        self._values = [e[2] for e in entries]
+
+        postings = {}
+        for i, key in enumerate(self._keys):
+            for size in range(1, GRAM_SIZE + 1):
+                for gram in _grams(key, size):
+                    postings.setdefault(gram, []).append(i)
+        self._postings = dict((gram, tuple(indexes)) for gram, indexes in postings.items())
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _prefix_range(self, term):
+        start = bisect_left(self._keys, term)
+        # Every key which starts with term sorts before term followed by the largest character.
+        return start, bisect_left(self._keys, term + '\U0010ffff', start)
+
+    def search(self, term, limit=None):
+        '''Returns a list of up to limit values whose key contains term.'''
+        term = term.upper()
+        if not term:
+            return []
+
+        start, stop = self._prefix_range(term)
+        if limit is not None and stop - start >= limit:
+            return self._values[start:start + limit]
+        matches = list(range(start, stop))
+
+        # Scan the smallest postings list of the term's n-grams. If the term is no longer than an n-gram,
+        # every entry in the list contains it.
+        size = min(len(term), GRAM_SIZE)
+        postings = min((self._postings.get(gram, ()) for gram in _grams(term, size)), key=len)
+        for i in postings:
+            if limit is not None and len(matches) >= limit:
+                break
+            if not start <= i < stop and (size == len(term) or term in self._keys[i]):
+                matches.append(i)
+
+        if limit is not None:
+            matches = matches[:limit]
+        return [self._values[i] for i in matches]
+
+
+def _code_entries():
+    codes = AnalyteCodeVW.objects.values_list('analyte_analyte_code', flat=True).distinct()
+    return [(code, code) for code in codes]
+
+
+def _name_entries():
+    return [(name, [name, code]) for (name, code) in AnalyteCodeRel.objects.values_list('analyte_name', 'analyte_code')]
+
+
+# The model, key field and value fields searched by query_analytes for each kind
+_QUERIES = {
+    'code' : (AnalyteCodeVW, 'analyte_analyte_code', ('analyte_analyte_code',)),
+    'name' : (AnalyteCodeRel, 'analyte_name', ('analyte_name', 'analyte_code')),
+}
+
+
+def query_analytes(kind, term, limit=None):
+    '''Returns a list of up to limit values of kind, 'code' or 'name', whose key contains term, in the order of
+    AnalyteIndex.search. The database is queried rather than the in-process index.
+    '''
+    if not term:
+        return []
+    model, key_field, value_fields = _QUERIES[kind]
+    prefix_filter = {key_field + '__istartswith' : term}
+    querysets = [model.objects.filter(**prefix_filter),
+                 model.objects.filter(**{key_field + '__icontains' : term}).exclude(**prefix_filter)]
+
+    matches = []
+    for queryset in querysets:
+        queryset = queryset.order_by(Upper(key_field), key_field).values_list(*value_fields).distinct()
+        if limit is not None:
+            if len(matches) >= limit:
+                break
+            queryset = queryset[:limit - len(matches)]
+        matches.extend(row[0] if len(value_fields) == 1 else list(row) for row in queryset)
+    return matches
+
+
+_ENTRIES = {
+    'code' : _code_entries,
+    'name' : _name_entries,
+}
+
+@version_cached
+def get_analyte_index(kind):
+    '''Returns the AnalyteIndex for kind, 'code' or 'name', for the current data version. Values in the code
+    index are analyte codes. Values in the name index are [analyte name, analyte code] lists.
+    '''
+    return AnalyteIndex(_ENTRIES[kind]())
@@ -0,0 +1,124 @@
+'''
+Provides the exact match analyte name and code lookups used by the analyte results views and keeps the
+denormalized analyte search table, common.models.MethodAnalyteSearch, up to date with method_analyte_all_vw.
+Names and codes are compared by their normalized key, see analyte_key. A refresh compares the table with the
+view and only writes the rows of the analyte methods which were added, changed or removed. The rows of methods
+published, archived or approved in NEMI are refreshed when they change, see refresh_changed_methods.
+'''
+from itertools import groupby
+from operator import itemgetter
+import re
+
+from django.conf import settings
+from django.db import transaction
+
+from common.models import MethodAnalyteSearch
+
+from .models import MethodAnalyteAllVW
+
+# Columns copied from the view. The analyte name and code keys are derived from them.
+SEARCH_FIELDS = tuple(field.attname for field in MethodAnalyteSearch._meta.fields if not field.primary_key
+                      and field.attname not in ('analyte_method_id', 'analyte_name_key', 'analyte_code_key'))
+KEY_FIELDS = ('analyte_name_key', 'analyte_code_key')
+
+
+def analyte_key(value):
+    '''Returns the normalized key of an analyte name or code, which is casefolded with runs of whitespace
+    collapsed to a single space.
+    '''
+    return ' '.join(value.split()).casefold() if value else value
+
+
+def analyte_pattern(values):
+    '''Returns a regular expression which matches any of the analyte names or codes in values, ignoring
+    differences in whitespace. It should be matched ignoring case.
+    '''
+    return '(' + '|'.join(r'^\s*' + r'\s+'.join(re.escape(word) for word in value.split()) + r'\s*$'
+                          for value in values) + ')'
+
+
+def filter_analytes(queryset, field, values, search_table=False):
+    '''Returns queryset filtered to the rows whose field, 'analyte_name' or 'analyte_code', matches one of
+    values, ignoring case and differences in whitespace. If search_table is True, queryset is a MethodAnalyteSearch
+    queryset and its indexed key column is matched. Otherwise the view's column is matched with a case insensitive
+    regular expression, see analyte_pattern.
+    '''
+    values = dict((analyte_key(value), value) for value in values if value and value.split())
+    if not values:
+        return queryset.none()
+    if search_table:
+        return queryset.filter(**{field + '_key__in' : list(values)})
+    return queryset.filter(**{field + '__iregex' : analyte_pattern(values.values())})
+
+
+def _search_values(values):
+    '''Returns the values of SEARCH_FIELDS, values, followed by the values of KEY_FIELDS derived from them.'''
+    row = dict(zip(SEARCH_FIELDS, values))
+    return tuple(values) + (analyte_key(row['analyte_name']), analyte_key(row['analyte_code']))
+
+
+def search_table_changes(existing, view_rows):
+    '''
+    Compares the analyte search table with the view. existing maps the analyte_method_id of each analyte method in
+    the table to the set of its rows' values of SEARCH_FIELDS and KEY_FIELDS. view_rows are tuples of the view's
+    analyte_method_id followed by its SEARCH_FIELDS, ordered by analyte_method_id. The view's joins can give an
+    analyte method more than one row. Each distinct row is kept, as each can be returned by the analyte results
+    views, so an analyte method whose rows have changed has all of them replaced.
+
+    Returns a tuple of the lists of the ids of the analyte methods created, changed and deleted, and the list of
+    the (analyte_method_id, values) rows to write for the created and changed ones.
+    '''
+    created = []
+    changed = []
+    new_rows = []
+    seen = set()
+    for analyte_method_id, rows in groupby(view_rows, itemgetter(0)):
+        seen.add(analyte_method_id)
+        rows = set(_search_values(row[1:]) for row in rows)
+        old_rows = existing.get(analyte_method_id)
+        if old_rows != rows:
+            (created if old_rows is None else changed).append(analyte_method_id)
+            new_rows.extend((analyte_method_id, values) for values in rows)
+
+    deleted = [analyte_method_id for analyte_method_id in existing if analyte_method_id not in seen]
+    return created, changed, deleted, new_rows
+
+
+def refresh_analyte_search(method_ids=None, batch_size=1000):
+    '''Updates the analyte search table from method_analyte_all_vw. If method_ids is given, only the rows of those
+    methods are refreshed. Returns a tuple of the number of analyte methods created, updated and deleted.
+    '''
+    view_rows = MethodAnalyteAllVW.objects.all()
+    search_rows = MethodAnalyteSearch.objects.all()
+    if method_ids is not None:
+        view_rows = view_rows.filter(method_id__in=method_ids)
+        search_rows = search_rows.filter(method_id__in=method_ids)
+
+    existing = {}
+    for row in search_rows.values_list('analyte_method_id', *(SEARCH_FIELDS + KEY_FIELDS)).iterator():
+        existing.setdefault(row[0], set()).add(row[1:])
+    created, changed, deleted, new_rows = search_table_changes(
+        existing, view_rows.order_by('analyte_method_id').values_list('analyte_method_id', *SEARCH_FIELDS).iterator())
+
+    removed = changed + deleted
+    with transaction.atomic():
+        for i in range(0, len(removed), batch_size):
+            MethodAnalyteSearch.objects.filter(analyte_method_id__in=removed[i:i + batch_size]).delete()
+        # The backend chooses the bulk_create batch size, as Django does not cap an explicit size to its limits
+        MethodAnalyteSearch.objects.bulk_create(
+            [MethodAnalyteSearch(analyte_method_id=analyte_method_id, **dict(zip(SEARCH_FIELDS + KEY_FIELDS, values)))
+             for analyte_method_id, values in new_rows])
+
+    return len(created), len(changed), len(deleted)
+
+
+def refresh_changed_methods(sender, method_ids, batch_size=1000, **kwargs):
+    '''
+    Receiver of common.signals.methods_changed which refreshes the analyte search table rows of the methods which
+    were published, archived or approved, when the ANALYTE_SEARCH_TABLE setting is True.
+    '''
+    if not settings.ANALYTE_SEARCH_TABLE:
+        return
+    method_ids = list(method_ids)
+    for i in range(0, len(method_ids), batch_size):
+        refresh_analyte_search(method_ids[i:i + batch_size], batch_size)
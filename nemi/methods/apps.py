@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+
+
+class MethodsAppConfig(AppConfig):
+    name = 'methods'
+
+    def ready(self):
+        from common.signals import methods_changed
+        from .analyte_search import refresh_changed_methods
+        from .dump import expire_dump_files
+
+        methods_changed.connect(refresh_changed_methods, dispatch_uid='methods.refresh_changed_methods')
+        methods_changed.connect(expire_dump_files, dispatch_uid='methods.expire_dump_files')
@@ -0,0 +1,219 @@
+'''
+Writes the published method catalogue as newline-delimited JSON for harvesters which mirror NEMI. Each line is
+one method from method_vw with its analytes from method_analyte_all_vw and its revisions from
+revision_summary_vw. The three views are each read once, in method_id order, a fetch of DUMP_FETCH_SIZE rows at a
+time, and merged, so memory use does not depend on the size of the catalogue.
+
+The full dump is also kept, plain and gzipped, as files in DUMP_DIR (see common.utils.built_files), which are
+served rather than read from the database on each request. Once methods change or the files are DUMP_MAX_AGE
+seconds old, they are rebuilt by a background job or the dump_methods command while the old files are still served.
+'''
+import datetime
+import hashlib
+from itertools import groupby
+import json
+import os
+import threading
+import zlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from common.utils.built_files import BuiltFiles
+from common.utils.jobs import submit_job
+from common.utils.view_utils import iter_rows
+
+from .models import MethodVW, MethodAnalyteAllVW, RevisionSummaryVw
+
+DUMP_FETCH_SIZE = 5000  # Number of rows read from each view per fetch
+DUMP_WRITE_SIZE = 200  # Number of methods encoded before a chunk of the dump is yielded
+DUMP_NAME = 'nemi_methods.ndjson'
+DUMP_JOB_KIND = 'dump'
+
+METHOD_FIELDS = tuple(field.attname for field in MethodVW._meta.fields)
+# The method columns repeated on every analyte row are left out.
+ANALYTE_FIELDS = ('analyte_method_id',) + tuple(field.attname for field in MethodAnalyteAllVW._meta.fields
+                                                if field.attname not in METHOD_FIELDS + ('analyte_method_id',))
+REVISION_FIELDS = tuple(field.attname for field in RevisionSummaryVw._meta.fields if field.attname != 'method_id')
+
+
+def parse_since(value):
+    '''Returns the date represented by value, formatted as YYYY-MM-DD. Raises ValueError if value is not a date.'''
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def dump_querysets(since=None):
+    '''
+    Returns the method, analyte and revision query sets of the dump, each ordered by method_id. If since is a
+    date, only the methods loaded on or after since, or with a revision updated or loaded on or after since, are
+    included.
+    '''
+    method_qs = MethodVW.objects.all()
+    if since is not None:
+        revised_qs = RevisionSummaryVw.objects.filter(
+            Q(last_update_date__gte=since) | Q(date_loaded__gte=since)).values('method_id')
+        method_qs = method_qs.filter(Q(date_loaded__gte=since) | Q(method_id__in=revised_qs))
+
+    analyte_qs = MethodAnalyteAllVW.objects.all()
+    revision_qs = RevisionSummaryVw.objects.all()
+    if since is not None:
+        analyte_qs = analyte_qs.filter(method_id__in=method_qs.values('method_id'))
+        revision_qs = revision_qs.filter(method_id__in=method_qs.values('method_id'))
+
+    return (method_qs.order_by('method_id').values(*METHOD_FIELDS),
+            analyte_qs.order_by('method_id', 'analyte_method_id').values('method_id', *ANALYTE_FIELDS),
+            revision_qs.order_by('method_id', 'revision_id').values('method_id', *REVISION_FIELDS))
+
+
+def _grouped(rows):
+    '''Generator which yields a (method_id, rows) tuple for each method in rows, without the method_id column.'''
+    for method_id, group in groupby(rows, lambda row: row['method_id']):
+        yield method_id, [{key : value for key, value in row.items() if key != 'method_id'} for row in group]
+
+
+def _children(groups, method_id, pending):
+    '''
+    Returns the rows in groups, an iterator of (method_id, rows) ordered by method_id, which belong to method_id.
+    pending is a one item list holding the group read ahead of the previous method, or None.
+    '''
+    while pending[0] is None or pending[0][0] < method_id:
+        pending[0] = next(groups, (float('inf'), []))
+    if pending[0][0] == method_id:
+        return pending[0][1]
+    return []
+
+
+def iter_methods(since=None, fetch_size=DUMP_FETCH_SIZE):
+    '''Generator which yields a dictionary for each method in the dump, see dump_querysets.'''
+    method_qs, analyte_qs, revision_qs = dump_querysets(since)
+
+    analyte_groups = _grouped(iter_rows(analyte_qs, fetch_size))
+    revision_groups = _grouped(iter_rows(revision_qs, fetch_size))
+    analytes_pending = [None]
+    revisions_pending = [None]
+    for method in iter_rows(method_qs, fetch_size):
+        method['analytes'] = _children(analyte_groups, method['method_id'], analytes_pending)
+        method['revisions'] = _children(revision_groups, method['method_id'], revisions_pending)
+        yield method
+
+
+def ndjson_content(records, compress=False, write_size=DUMP_WRITE_SIZE):
+    '''
+    Generator which yields the encoded newline-delimited JSON of records, write_size records at a time. If
+    compress is True the content is gzipped.
+    '''
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    lines = []
+    for record in records:
+        lines.append(json.dumps(record, cls=DjangoJSONEncoder, separators=(',', ':')) + '\n')
+        if len(lines) >= write_size:
+            content = ''.join(lines).encode('utf-8')
+            lines = []
+            if compressor:
+                content = compressor.compress(content)
+            if content:
+                yield content
+
+    content = ''.join(lines).encode('utf-8')
+    if compressor:
+        content = compressor.compress(content) + compressor.flush()
+    if content:
+        yield content
+
+
+def write_dump(fileobj, since=None, compress=False):
+    '''Writes the dump to the binary file, fileobj. Returns the number of methods written.'''
+    count = 0
+
+    def counted(records):
+        nonlocal count
+        for record in records:
+            count += 1
+            yield record
+
+    for content in ndjson_content(counted(iter_methods(since)), compress):
+        fileobj.write(content)
+    return count
+
+
+class _DumpWriter(object):
+    '''Writes the dump to each of fileobjs and keeps the digest of its content.'''
+
+    def __init__(self, *fileobjs):
+        self.fileobjs = fileobjs
+        self.digest = hashlib.md5()
+
+    def write(self, content):
+        self.digest.update(content)
+        for fileobj in self.fileobjs:
+            fileobj.write(content)
+
+
+class DumpFiles(BuiltFiles):
+    '''The full dump files, plain and gzipped, in DUMP_DIR. The manifest records the 'count' of methods and the
+    'etag', the digest of the plain dump.
+    '''
+
+    @property
+    def directory(self):
+        return settings.DUMP_DIR
+
+    @property
+    def max_age(self):
+        return settings.DUMP_MAX_AGE
+
+    def dump_path(self, compress=False):
+        return self.path(DUMP_NAME + ('.gz' if compress else ''))
+
+    def exists(self):
+        return os.path.exists(self.dump_path()) and os.path.exists(self.dump_path(compress=True))
+
+    def is_current(self, manifest):
+        return self.exists() and super(DumpFiles, self).is_current(manifest)
+
+    def build_files(self):
+        with self.atomic_file(self.dump_path(compress=True), compress=True) as gzip_fileobj:
+            with self.atomic_file(self.dump_path()) as fileobj:
+                writer = _DumpWriter(fileobj, gzip_fileobj)
+                count = write_dump(writer)
+        return {'count' : count,
+                'etag' : writer.digest.hexdigest()}
+
+
+dump_files = DumpFiles()
+
+# Held while a job to rebuild the dump files is pending or running in this process
+_rebuild_lock = threading.Lock()
+
+
+def _rebuild_dump_files(progress):
+    try:
+        return dump_files.get_manifest()['count']
+    finally:
+        _rebuild_lock.release()
+
+
+def expire_dump_files(sender, **kwargs):
+    '''Receiver of common.signals.methods_changed which has the dump files rebuilt after their next request.'''
+    dump_files.expire()
+
+
+def get_dump_files():
+    '''
+    Returns the manifest of the full dump files. The files are built first if there are none yet. If they are
+    out of date, a background job rebuilds them and the manifest of the existing files is returned meanwhile,
+    so that requests do not wait for the rebuild.
+    '''
+    manifest = dump_files.read_manifest()
+    if not manifest or not dump_files.exists():
+        return dump_files.get_manifest()
+
+    if not dump_files.is_current(manifest) and _rebuild_lock.acquire(blocking=False):
+        try:
+            submit_job(DUMP_JOB_KIND, _rebuild_dump_files)
+        except Exception:
+            _rebuild_lock.release()
+            raise
+    return manifest
@@ -0,0 +1,207 @@
+'''
+Provides the in-process facet index used to count the methods each search form choice would give. The methods
+in method_vw are numbered in the order of the method results page, by source_method_identifier and method_id,
+and, for every facet, each value is mapped to a bitset, held in a Python int, of the methods which have it. The
+methods matched by the method results filters are then found by intersecting bitsets.
+'''
+from bisect import bisect_right
+
+from common.utils.cache import version_cached
+
+from .models import MethodVW
+
+
+def bitset(positions):
+    '''Returns the bitset, an int, with the bits at positions set.'''
+    bits = bytearray()
+    for position in positions:
+        byte = position >> 3
+        if byte >= len(bits):
+            bits.extend(bytes(byte - len(bits) + 1))
+        bits[byte] |= 1 << (position & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def positions(bits):
+    '''Generator which yields the positions of the bits set in the bitset, bits, in increasing order.'''
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    for byte_i, byte in enumerate(data):
+        while byte:
+            low = byte & -byte
+            yield (byte_i << 3) + low.bit_length() - 1
+            byte ^= low
+
+
+def popcount(bits):
+    '''Returns the number of bits set in the bitset, bits.'''
+    return bin(bits).count('1')
+
+
+class Facet(object):
+    '''
+    A method results filter which matches the methods whose field has one of the values selected by the name
+    GET parameter. The counts of a facet are given for each of its choices.
+    '''
+
+    def __init__(self, name, field):
+        self.name = name
+        self.field = field
+
+    def key(self, value):
+        '''Returns the key of a column value in the facet's bitsets.'''
+        return value
+
+    def get_selected(self, query):
+        '''Returns the list of keys selected by the QueryDict, query, or None if the facet does not filter.'''
+        value = query.get(self.name, '')
+        return [self.key(value)] if value != '' else None
+
+    def matching_keys(self, keys, selected):
+        '''Returns the keys, of those in keys, whose methods are matched when selected is chosen.'''
+        return [key for key in selected if key in keys]
+
+    def get_choices(self, keys):
+        '''Returns the list of choices given keys, the keys of all methods.'''
+        return sorted(keys)
+
+
+class CategoryFacet(Facet):
+    '''The category filter, which ignores case.'''
+
+    def key(self, value):
+        return value.upper()
+
+
+class MultipleFacet(Facet):
+    '''
+    A filter which matches any of the values given in the name parameter. If always is False the filter is
+    only applied when the last value is not empty.
+    '''
+
+    def __init__(self, name, field, always=False):
+        super(MultipleFacet, self).__init__(name, field)
+        self.always = always
+
+    def get_selected(self, query):
+        if self.always:
+            applied = self.name in query
+        else:
+            applied = bool(query.get(self.name))
+        return query.getlist(self.name) if applied else None
+
+
+class SourceFacet(Facet):
+    '''
+    The source filter, which matches the methods whose source contains the value. The sources of the agencies
+    in grouped_sources are counted together, as they are offered by the source choices.
+    '''
+
+    grouped_sources = ('EPA', 'USGS', 'DOE')
+
+    def matching_keys(self, keys, selected):
+        return [key for key in keys if any(value in key for value in selected)]
+
+    def get_choices(self, keys):
+        return sorted(set(key for key in keys if not any(group in key for group in self.grouped_sources))
+                      | set(group for group in self.grouped_sources if any(group in key for key in keys)))
+
+
+class InstrumentationFacet(Facet):
+    '''The instrumentation filter, whose values are instrumentation ids.'''
+
+    def key(self, value):
+        return str(value)
+
+
+FACETS = (
+    CategoryFacet('category', 'method_category'),
+    MultipleFacet('subcategory', 'method_subcategory'),
+    Facet('media_name', 'media_name'),
+    SourceFacet('source', 'method_source'),
+    InstrumentationFacet('instrumentation', 'instrumentation_id'),
+    MultipleFacet('method_type', 'method_type_desc', always=True),
+    Facet('matrix', 'matrix'),
+)
+
+# The methods in the index are numbered in this order, which is the order of the method results page.
+ORDER_FIELDS = ('source_method_identifier', 'method_id')
+
+
+class FacetIndex(object):
+    '''
+    Bitsets of the methods with each facet value. rows are (method_id, source_method_identifier, value of each
+    facet's field) tuples. The methods are numbered in ORDER_FIELDS order.
+    '''
+
+    def __init__(self, rows, facets=FACETS):
+        self.facets = facets
+
+        rows = sorted(rows, key=lambda row: (row[1], row[0]))
+        self.method_ids = [row[0] for row in rows]
+        self._identifier_keys = [row[1].upper() for row in rows]
+        self._order_keys = [(row[1], row[0]) for row in rows]
+        self.all_bits = (1 << len(rows)) - 1
+
+        self._bitsets = {}
+        self._choices = {}
+        for facet_i, facet in enumerate(facets):
+            key_positions = {}
+            for position, row in enumerate(rows):
+                if row[facet_i + 2] is not None:
+                    key_positions.setdefault(facet.key(row[facet_i + 2]), []).append(position)
+            bitsets = dict((key, bitset(key_positions[key])) for key in key_positions)
+            self._bitsets[facet.name] = bitsets
+            self._choices[facet.name] = [(choice, self._match(facet, [choice]))
+                                         for choice in facet.get_choices(list(bitsets))]
+
+    def __len__(self):
+        return len(self.method_ids)
+
+    def _match(self, facet, selected):
+        bitsets = self._bitsets[facet.name]
+        bits = 0
+        for key in facet.matching_keys(bitsets, selected):
+            bits |= bitsets[key]
+        return bits
+
+    def filter_bits(self, query, exclude=None):
+        '''
+        Returns the bitset of the methods matched by the filters in the QueryDict, query, leaving out the
+        filter of the facet named exclude.
+        '''
+        bits = self.all_bits
+        for facet in self.facets:
+            if facet.name != exclude:
+                selected = facet.get_selected(query)
+                if selected is not None:
+                    bits &= self._match(facet, selected)
+        return bits
+
+    def identifier_bits(self, term):
+        '''Returns the bitset of the methods whose source_method_identifier contains term, ignoring case.'''
+        term = term.upper()
+        return bitset(position for position, identifier in enumerate(self._identifier_keys) if term in identifier)
+
+    def seek(self, values):
+        '''Returns the position of the first method which follows the ORDER_FIELDS values, values.'''
+        return bisect_right(self._order_keys, tuple(values))
+
+    def counts(self, query):
+        '''
+        Returns a tuple of the number of methods matched by query and a dictionary which maps each facet name to
+        a list of (choice, count) tuples. count is the number of methods matched if the facet's filter were
+        replaced by choice.
+        '''
+        facet_counts = {}
+        for facet in self.facets:
+            bits = self.filter_bits(query, exclude=facet.name)
+            facet_counts[facet.name] = [(choice, popcount(bits & choice_bits))
+                                        for choice, choice_bits in self._choices[facet.name]]
+        return popcount(self.filter_bits(query)), facet_counts
+
+
+@version_cached
+def get_facet_index():
+    '''Returns the FacetIndex of method_vw for the current data version.'''
+    fields = ['method_id', 'source_method_identifier'] + [facet.field for facet in FACETS]
+    return FacetIndex(MethodVW.objects.values_list(*fields).iterator())
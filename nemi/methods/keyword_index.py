@@ -0,0 +1,175 @@
+'''
+Implements the on-disk inverted index used by the local keyword search engine. An index is a single segment
+file which is memory-mapped when searched, so searches only read the parts of the file they need. Documents
+are scored with BM25.
+
+The segment file contains, in order (all values little-endian):
+    header          magic, document count, term count, average document length and the offsets of the sections below
+    document ids    int64 per document, the method_id of the document
+    lengths         uint32 per document, the weighted number of tokens in the document
+    term offsets    uint32 per term plus one, the offset of each term in the term text
+    postings offsets uint64 per term plus one, the offset of each term's postings in the postings
+    term text       the utf-8 encoded terms, in sorted order
+    postings        uint32 pairs of (document index, weighted term frequency) for each term
+'''
+from collections import Counter
+import math
+import mmap
+import os
+import re
+import struct
+import tempfile
+
+MAGIC = b'NEMIKW01'
+_HEADER = struct.Struct('<8sIId6Q')
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_PATTERN = re.compile(r'[^\W_]+')
+
+
+def tokenize(text):
+    '''Returns the list of lower case word tokens in text.'''
+    return _TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+def write_segment(path, documents):
+    '''Writes a segment file to path from the iterable, documents, of (method_id, fields) tuples, where fields is
+    a list of (text, weight) tuples. The tokens in each field count weight times. The file is written to a
+    temporary file and then moved to path, so readers never see a partial segment.
+    '''
+    doc_ids = []
+    lengths = []
+    postings = {}
+    for doc_index, (method_id, fields) in enumerate(documents):
+        frequencies = Counter()
+        for text, weight in fields:
+            for token in tokenize(text):
+                frequencies[token] += weight
+        doc_ids.append(method_id)
+        lengths.append(sum(frequencies.values()))
+        for token, frequency in frequencies.items():
+            postings.setdefault(token.encode('utf-8'), []).extend((doc_index, frequency))
+
+    terms = sorted(postings)
+    doc_count = len(doc_ids)
+    avg_length = float(sum(lengths)) / doc_count if doc_count else 0.0
+
+    term_offsets = [0]
+    postings_offsets = [0]
+    for term in terms:
+        term_offsets.append(term_offsets[-1] + len(term))
+        postings_offsets.append(postings_offsets[-1] + 4 * len(postings[term]))
+
+    ids_offset = _HEADER.size
+    lengths_offset = ids_offset + 8 * doc_count
+    term_offsets_offset = lengths_offset + 4 * doc_count
+    postings_offsets_offset = term_offsets_offset + 4 * len(term_offsets)
+    text_offset = postings_offsets_offset + 8 * len(postings_offsets)
+    postings_offset = text_offset + term_offsets[-1]
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.keyword_index')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, doc_count, len(terms), avg_length,
+                                 ids_offset, lengths_offset, term_offsets_offset,
+                                 postings_offsets_offset, text_offset, postings_offset))
+            f.write(struct.pack('<%dq' % doc_count, *doc_ids))
+            f.write(struct.pack('<%dI' % doc_count, *lengths))
+            f.write(struct.pack('<%dI' % len(term_offsets), *term_offsets))
+            f.write(struct.pack('<%dQ' % len(postings_offsets), *postings_offsets))
+            f.write(b''.join(terms))
+            for term in terms:
+                f.write(struct.pack('<%dI' % len(postings[term]), *postings[term]))
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+    return doc_count, len(terms)
+
+
+class Segment(object):
+    '''
+    A memory-mapped segment file. Use search to score the documents which contain every term of a query.
+    '''
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, self.doc_count, self.term_count, self.avg_length, ids_offset, lengths_offset, term_offsets_offset,
+         postings_offsets_offset, self._text_offset, self._postings_offset) = _HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError('%s is not a keyword index segment' % path)
+
+        view = memoryview(self._mmap)
+        self._doc_ids = view[ids_offset:lengths_offset].cast('q')
+        self._lengths = view[lengths_offset:term_offsets_offset].cast('I')
+        self._term_offsets = view[term_offsets_offset:postings_offsets_offset].cast('I')
+        self._postings_offsets = view[postings_offsets_offset:self._text_offset].cast('Q')
+        self._view = view
+
+    def _term(self, i):
+        return self._mmap[self._text_offset + self._term_offsets[i]:self._text_offset + self._term_offsets[i + 1]]
+
+    def _find_term(self, term):
+        '''Returns the index of term in the term dictionary or None if it is not in the index.'''
+        lo, hi = 0, self.term_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid) < term:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.term_count and self._term(lo) == term:
+            return lo
+        return None
+
+    def _postings(self, i):
+        start = self._postings_offset + self._postings_offsets[i]
+        return self._view[start:self._postings_offset + self._postings_offsets[i + 1]].cast('I')
+
+    def method_id(self, doc_index):
+        return self._doc_ids[doc_index]
+
+    def search(self, query):
+        '''Returns a dictionary of the BM25 score of each document, by document index, which contains
+        every token in query.
+        '''
+        tokens = set(tokenize(query))
+        if not tokens or not self.doc_count:
+            return {}
+
+        term_postings = []
+        for token in tokens:
+            i = self._find_term(token.encode('utf-8'))
+            if i is None:
+                return {}
+            term_postings.append(self._postings(i))
+        # Start with the rarest term so that the candidate set is as small as possible
+        term_postings.sort(key=len)
+
+        scores = None
+        for postings in term_postings:
+            df = len(postings) // 2
+            idf = math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+            term_scores = {}
+            for j in range(0, len(postings), 2):
+                doc_index = postings[j]
+                if scores is not None and doc_index not in scores:
+                    continue
+                tf = postings[j + 1]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[doc_index] / self.avg_length)
+                term_scores[doc_index] = idf * tf * (BM25_K1 + 1) / (tf + norm)
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = dict((doc_index, score + scores[doc_index]) for doc_index, score in term_scores.items())
+            if not scores:
+                break
+
+        return scores
@@ -0,0 +1,171 @@
+'''
+Provides the keyword search backends used by KeywordResultsView. The backend is chosen with the
+KEYWORD_SEARCH_BACKEND setting. A backend's search method returns a lazy sequence of result rows, in score
+order, which can be passed to a Paginator. Only the rows of the requested page are retrieved.
+Each row is a dictionary with the upper case keys used by the keyword results template.
+'''
+import heapq
+import os
+import re
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from common.utils.view_utils import dictfetchall
+
+from .keyword_index import Segment
+from .models import MethodSummaryVW
+
+
+def _clean_keyword(k):
+    ''' Returns keyword with the Oracle Text special characters escaped and the keyword surrounded by wildcards.
+    Quotes are left as they are, as the keyword is passed to the query as a bind parameter.
+    '''
+    special_char_pattern = re.compile(r'(?P<special>[^a-zA-Z0-9\'\"])')
+    result = re.sub(special_char_pattern, r'\\\g<special>', k)
+
+    return '%' + result + '%'
+
+
+def get_keyword_search():
+    '''Returns an instance of the keyword search backend named by the KEYWORD_SEARCH_BACKEND setting.'''
+    return import_string(settings.KEYWORD_SEARCH_BACKEND)()
+
+
+class OracleKeywordResults(object):
+    '''
+    Lazy results of an Oracle Text search. The count and each page are retrieved with separate queries.
+    '''
+
+    _QUERY = "SELECT MAX(score(1)) method_summary_score, mf.method_id, mf.source_method_identifier method_number, \
+mf.link_to_full_method, mf.mimetype, mf.method_official_name, mf.method_descriptive_name, mf.method_source, mf.method_category \
+FROM nemi_data.method_fact mf, nemi_data.revision_join rj \
+WHERE mf.revision_id = rj.revision_id (+) AND \
+(CONTAINS(mf.source_method_identifier, %s, 1) > 0 \
+OR CONTAINS(rj.method_pdf, %s, 2) > 0) \
+GROUP BY mf.method_id, mf.source_method_identifier, mf.link_to_full_method, mf.mimetype, mf.revision_id, mf.method_official_name, \
+mf.method_descriptive_name, mf.method_source, mf.method_category"
+
+    def __init__(self, keyword):
+        self.params = [keyword, keyword]
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT COUNT(*) FROM (' + self._QUERY + ')', self.params)
+                self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step is not None:
+            raise TypeError('Keyword results only support slicing')
+        start = key.start or 0
+        stop = self.count() if key.stop is None else key.stop
+        if stop <= start:
+            return []
+
+        with connection.cursor() as cursor:
+            cursor.execute(self._QUERY + ' ORDER BY method_summary_score DESC, mf.method_id OFFSET %s ROWS FETCH NEXT %s ROWS ONLY',
+                           self.params + [start, stop - start])
+            return dictfetchall(cursor)
+
+
+class OracleKeywordSearch(object):
+    '''
+    Searches the method identifiers and method pdfs using the Oracle Text indexes.
+    '''
+
+    def search(self, keyword):
+        return OracleKeywordResults(_clean_keyword(keyword))
+
+
+class LocalKeywordResults(object):
+    '''
+    Lazy results of a search of a local keyword index. The matching documents are only ranked as far as
+    the end of the requested page and the method details are retrieved for the rows of that page.
+    '''
+
+    def __init__(self, segment, scores):
+        self.segment = segment
+        self.scores = scores
+
+    def count(self):
+        return len(self.scores)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step is not None:
+            raise TypeError('Keyword results only support slicing')
+        start = key.start or 0
+        stop = self.count() if key.stop is None else key.stop
+        if stop <= start:
+            return []
+
+        # Ties are broken by method_id so that pages are stable
+        ranked = heapq.nsmallest(stop, self.scores.items(),
+                                 key=lambda item: (-item[1], self.segment.method_id(item[0])))[start:stop]
+        method_ids = [self.segment.method_id(doc_index) for doc_index, score in ranked]
+
+        methods = MethodSummaryVW.objects.filter(method_id__in=method_ids).values(
+            'method_id', 'source_method_identifier', 'link_to_full_method', 'mimetype', 'method_official_name',
+            'method_descriptive_name', 'method_source', 'method_category')
+        methods_by_id = dict((m['method_id'], m) for m in methods)
+
+        rows = []
+        for (doc_index, score), method_id in zip(ranked, method_ids):
+            method = methods_by_id.get(method_id)
+            # A method may have been removed since the index was built
+            if method is None:
+                continue
+            rows.append({'METHOD_SUMMARY_SCORE' : round(score, 2),
+                         'METHOD_ID' : method_id,
+                         'METHOD_NUMBER' : method['source_method_identifier'],
+                         'LINK_TO_FULL_METHOD' : method['link_to_full_method'],
+                         'MIMETYPE' : method['mimetype'],
+                         'METHOD_OFFICIAL_NAME' : method['method_official_name'],
+                         'METHOD_DESCRIPTIVE_NAME' : method['method_descriptive_name'],
+                         'METHOD_SOURCE' : method['method_source'],
+                         'METHOD_CATEGORY' : method['method_category']})
+        return rows
+
+
+_segments = {}
+_segments_lock = threading.Lock()
+
+
+def get_segment(path):
+    '''Returns the Segment for the index file at path. The segment is reopened when the file is replaced.'''
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise ImproperlyConfigured('The keyword index %s does not exist. Run the build_keyword_index command to create it.' % path)
+
+    file_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    cached = _segments.get(path)
+    if cached is None or cached[0] != file_id:
+        with _segments_lock:
+            cached = _segments.get(path)
+            if cached is None or cached[0] != file_id:
+                cached = (file_id, Segment(path))
+                _segments[path] = cached
+    return cached[1]
+
+
+class LocalKeywordSearch(object):
+    '''
+    Searches the local BM25 keyword index at the KEYWORD_INDEX_PATH setting. The index is built with
+    the build_keyword_index management command. Methods which contain every word of the keyword match.
+    '''
+
+    def search(self, keyword):
+        segment = get_segment(settings.KEYWORD_INDEX_PATH)
+        return LocalKeywordResults(segment, segment.search(keyword))
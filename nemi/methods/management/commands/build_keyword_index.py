@@ -0,0 +1,68 @@
+"""
+This command builds the local keyword search index used by
+`methods.keyword_search.LocalKeywordSearch`. Each published method is indexed
+using its identifier, names, and summary along with the text of its current
+revision's PDF. The new index replaces the existing file once it is complete.
+"""
+from io import BytesIO
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+import PyPDF2
+
+from common.models import RevisionJoin
+
+from ...keyword_index import write_segment
+from ...models import MethodSummaryVW
+
+# The tokens in each field count this many times
+FIELD_WEIGHTS = (
+    ('source_method_identifier', 3),
+    ('method_official_name', 2),
+    ('method_descriptive_name', 2),
+    ('brief_method_summary', 1),
+)
+PDF_WEIGHT = 1
+
+
+def pdf_text(pdf):
+    """
+    Returns the text extracted from the pdf file contents, pdf, or an empty
+    string if the text can not be extracted.
+    """
+    try:
+        reader = PyPDF2.PdfFileReader(BytesIO(pdf), strict=False)
+        return ' '.join(reader.getPage(i).extractText() for i in range(reader.getNumPages()))
+    except Exception:
+        return ''
+
+
+class Command(BaseCommand):
+    help = 'Builds the local keyword search index from the published methods.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', default=None,
+            help='Path of the index file. Defaults to the KEYWORD_INDEX_PATH setting.')
+        parser.add_argument(
+            '--no-pdf', action='store_false', dest='pdf',
+            help='Do not index the text of the method PDFs.')
+
+    def documents(self, include_pdf):
+        fields = [name for name, weight in FIELD_WEIGHTS]
+        methods = MethodSummaryVW.objects.order_by('method_id').values('method_id', 'revision_id', *fields)
+        for method in methods.iterator():
+            texts = [(method[name], weight) for name, weight in FIELD_WEIGHTS]
+            if include_pdf and method['revision_id']:
+                pdf = RevisionJoin.objects.filter(
+                    revision_id=method['revision_id'], mimetype='application/pdf'
+                ).values_list('method_pdf', flat=True).first()
+                if pdf:
+                    texts.append((pdf_text(bytes(pdf)), PDF_WEIGHT))
+            yield method['method_id'], texts
+
+    def handle(self, *args, **options):
+        path = options['output'] or settings.KEYWORD_INDEX_PATH
+        doc_count, term_count = write_segment(path, self.documents(options['pdf']))
+        self.stdout.write(
+            'Indexed %d methods and %d terms in %s' % (doc_count, term_count, path))
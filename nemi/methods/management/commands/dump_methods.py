@@ -0,0 +1,50 @@
+"""
+This command writes the method catalogue as newline-delimited JSON, one
+method with its analytes and revisions per line. It produces the same dump
+as the api/methods/dump/ url and is meant for mirroring NEMI without going
+through the web server. With --refresh, it rebuilds the dump files served at
+that url instead, for example after loading data.
+"""
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...dump import dump_files, parse_since, write_dump
+
+
+class Command(BaseCommand):
+    help = 'Writes the method catalogue as newline-delimited JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', default='-',
+            help='The file to write. The dump is written to standard output if this is -, the default.')
+        parser.add_argument(
+            '--since',
+            help='Only write the methods loaded or revised on or after this date, formatted as YYYY-MM-DD.')
+        parser.add_argument(
+            '--gzip', action='store_true',
+            help='Gzip the dump.')
+        parser.add_argument(
+            '--refresh', action='store_true',
+            help='Rebuild the full dump files served at api/methods/dump/ in DUMP_DIR.')
+
+    def handle(self, *args, **options):
+        if options['refresh']:
+            manifest = dump_files.build()
+            self.stdout.write('Wrote %d methods to %s' % (manifest['count'], dump_files.dump_path()))
+            return
+
+        since = None
+        if options['since']:
+            try:
+                since = parse_since(options['since'])
+            except ValueError:
+                raise CommandError('--since must be a date formatted as YYYY-MM-DD')
+
+        if options['output'] == '-':
+            write_dump(sys.stdout.buffer, since, options['gzip'])
+        else:
+            with open(options['output'], 'wb') as fileobj:
+                count = write_dump(fileobj, since, options['gzip'])
+            self.stdout.write('Wrote %d methods to %s' % (count, options['output']))
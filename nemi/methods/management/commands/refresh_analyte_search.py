@@ -0,0 +1,23 @@
+"""
+This command refreshes the analyte search table used by the analyte results
+views when the ANALYTE_SEARCH_TABLE setting is True, the default. Only the
+rows which differ from method_analyte_all_vw are written. Run it after
+migrating, to fill the table, and after loading data outside of NEMI.
+"""
+from django.core.management.base import BaseCommand
+
+from ...analyte_search import refresh_analyte_search
+
+
+class Command(BaseCommand):
+    help = 'Refreshes the analyte search table from method_analyte_all_vw.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--method-id', type=int, action='append', dest='method_ids',
+            help='Only refresh the rows of this method. May be given more than once.')
+
+    def handle(self, *args, **options):
+        created, updated, deleted = refresh_analyte_search(options['method_ids'])
+        self.stdout.write(
+            'Created %d, updated %d and deleted %d analyte search rows' % (created, updated, deleted))
@@ -0,0 +1,62 @@
+''' This module contains the pagination used by the NEMI method api.
+'''
+
+from collections import OrderedDict
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from common.utils.view_utils import decode_cursor, encode_cursor, keyset_filter
+
+
+class KeysetPagination(BasePagination):
+    '''
+    Paginates a values query set ordered by keyset_fields. The cursor parameter holds the keyset_fields
+    values of the last row of the previous page, so a page is read by seeking to the row which follows
+    it rather than by counting an offset. The rows must include the keyset_fields.
+    '''
+
+    keyset_fields = ('method_id',)  # These should not be null and together should identify a row.
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 100
+    max_page_size = 1000
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            page_size = self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        queryset = queryset.order_by(*self.keyset_fields)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            try:
+                values = decode_cursor(cursor, len(self.keyset_fields))
+            except ValueError:
+                raise NotFound('Invalid cursor')
+            queryset = queryset.filter(keyset_filter(self.keyset_fields, values))
+
+        page_size = self.get_page_size(request)
+        rows = list(queryset[:page_size + 1])
+
+        self.next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            self.next_cursor = encode_cursor([rows[-1][field] for field in self.keyset_fields])
+        return rows
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([('next', self.get_next_link()),
+                                     ('results', data)]))
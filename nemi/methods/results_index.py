@@ -0,0 +1,82 @@
+'''
+Answers the method results searches from the in-process facet index, see methods.facets, rather than with a
+query of method_vw. The filters of MethodResultsMixin are evaluated as bitset operations and only the rows
+shown, a page at a time, are retrieved from the database by method_id. This is used by MethodResultsView
+when the METHOD_RESULTS_INDEX setting is True.
+'''
+from itertools import islice
+
+from .facets import ORDER_FIELDS, get_facet_index, popcount, positions
+
+
+class IndexedResults(object):
+    '''
+    Lazy results of a search of the facet index, in ORDER_FIELDS order, which can be passed to a Paginator.
+    The rows of a slice are retrieved from queryset. If fields is given, the rows are dictionaries of those
+    fields, which must include method_id, otherwise they are model instances.
+    '''
+
+    ordered = True
+
+    def __init__(self, index, bits, queryset, fields=None):
+        self.index = index
+        self.bits = bits
+        self.queryset = queryset
+        self.fields = fields
+        self._count = None
+
+    def _clone(self, bits=None, fields=None):
+        return IndexedResults(self.index, self.bits if bits is None else bits, self.queryset, fields or self.fields)
+
+    def count(self):
+        if self._count is None:
+            self._count = popcount(self.bits)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def order_by(self, *fields):
+        '''Returns the results, which can only be ordered by ORDER_FIELDS.'''
+        if tuple(fields) != ORDER_FIELDS:
+            raise ValueError('Indexed results are ordered by %s' % ', '.join(ORDER_FIELDS))
+        return self
+
+    def values(self, *fields):
+        '''Returns the results with rows which are dictionaries of fields.'''
+        return self._clone(fields=fields)
+
+    def after(self, values):
+        '''Returns the results which follow the row whose ORDER_FIELDS have values.'''
+        return self._clone(bits=self.bits & ~((1 << self.index.seek(values)) - 1))
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step is not None:
+            raise TypeError('Indexed results only support slicing')
+        start = key.start or 0
+        stop = self.count() if key.stop is None else key.stop
+        if stop <= start:
+            return []
+
+        method_ids = [self.index.method_ids[position] for position in islice(positions(self.bits), start, stop)]
+        if self.fields:
+            rows = dict((row['method_id'], row)
+                        for row in self.queryset.filter(method_id__in=method_ids).values(*self.fields))
+        else:
+            rows = self.queryset.in_bulk(method_ids)
+        return [rows[method_id] for method_id in method_ids if method_id in rows]
+
+
+def method_results(query, queryset):
+    '''
+    Returns the IndexedResults of the methods matched by the MethodResultsMixin filters in the QueryDict, query.
+    Rows are retrieved from queryset.
+    '''
+    index = get_facet_index()
+    bits = index.filter_bits(query)
+    if 'method_number' in query:
+        bits &= index.identifier_bits(query.get('method_number'))
+    return IndexedResults(index, bits, queryset)
@@ -0,0 +1,105 @@
+'''
+Provides the in-process statistical method attribute matrix used by the statistical results views when the
+STAT_MATRIX setting is True. The matrix has a row for each method with any of the attributes searched by the
+statistical filters, which in practice are the statistical (SAM) methods. A row packs all of the method's
+attributes, from its source citation and the statistical relation tables, into one bitset held in a Python int,
+so any combination of the filters is answered with one pass over the rows. approve_stat_methods bumps the data
+version, which makes get_stat_matrix rebuild the matrix, when methods are approved.
+'''
+from common.models import SourceCitationRef, PublicationSourceRel
+from common.models import StatAnalysisRel, StatDesignRel, StatMediaRel, StatTopicRel
+from common.utils.cache import version_cached
+
+from .models import MethodVW
+
+# The GET parameter of each statistical filter, which is also the name of its attribute in the matrix
+FILTERS = ('item_type',
+           'complexity',
+           'analysis_type',
+           'publication_source_type',
+           'study_objective',
+           'media_emphasized',
+           'special_topic')
+
+# The (attribute, model, field) of each attribute held by the statistical relation tables
+METHOD_RELATIONS = (
+    ('analysis_type', StatAnalysisRel, 'analysis_type_id'),
+    ('study_objective', StatDesignRel, 'design_objective_id'),
+    ('media_emphasized', StatMediaRel, 'media_name_id'),
+    ('special_topic', StatTopicRel, 'topic_id'),
+)
+
+
+def _value_key(value):
+    '''Returns the string which value is compared as. Whole numbers are compared as integers.'''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+class StatMatrix(object):
+    '''
+    Rows of packed attribute bitsets. rows are (method_id, attributes) tuples where attributes is an iterable
+    of (attribute, value) tuples. Values are compared with the GET parameters as strings, see _value_key.
+    '''
+
+    def __init__(self, rows):
+        self._bits = {}  # The bit of each (attribute, value)
+        self.rows = []
+        for method_id, attributes in rows:
+            row_bits = 0
+            for attribute, value in attributes:
+                row_bits |= 1 << self._bits.setdefault((attribute, _value_key(value)), len(self._bits))
+            if row_bits:
+                self.rows.append((method_id, row_bits))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def method_ids(self, query):
+        '''
+        Returns the list of the ids of the methods which have all of the attributes selected by the statistical
+        filters in the QueryDict, query, or None if none of the filters are selected.
+        '''
+        selected = [(attribute, query.get(attribute, '')) for attribute in FILTERS]
+        selected = [key for key in selected if key[1] != '']
+        if not selected:
+            return None
+        if not all(key in self._bits for key in selected):
+            return []
+
+        mask = 0
+        for key in selected:
+            mask |= 1 << self._bits[key]
+        return [method_id for method_id, row_bits in self.rows if row_bits & mask == mask]
+
+
+def _matrix_rows():
+    '''Returns the list of (method_id, attributes) rows of the methods in method_vw.'''
+    citation_attributes = {}
+    for citation_id, item_type_id in SourceCitationRef.objects.filter(
+            item_type__isnull=False).order_by().values_list('source_citation_id', 'item_type_id'):
+        citation_attributes.setdefault(citation_id, []).append(('item_type', item_type_id))
+    for citation_id, source_id in PublicationSourceRel.objects.order_by().values_list(
+            'source_citation_ref_id', 'source_id'):
+        citation_attributes.setdefault(citation_id, []).append(('publication_source_type', source_id))
+
+    method_attributes = {}
+    for attribute, model, field in METHOD_RELATIONS:
+        for method_id, value in model.objects.order_by().values_list('method_id', field):
+            method_attributes.setdefault(method_id, []).append((attribute, value))
+
+    rows = []
+    for method_id, citation_id, complexity in MethodVW.objects.order_by('method_id').values_list(
+            'method_id', 'source_citation_id', 'sam_complexity').iterator():
+        attributes = citation_attributes.get(citation_id, []) + method_attributes.get(method_id, [])
+        if complexity:
+            attributes.append(('complexity', complexity))
+        rows.append((method_id, attributes))
+    return rows
+
+
+@version_cached
+def get_stat_matrix():
+    '''Returns the StatMatrix of method_vw for the current data version.'''
+    return StatMatrix(_matrix_rows())
@@ -1,12 +1,26 @@
 import unittest
 
 from . import test_views
+from . import test_analyte_index
+from . import test_keyword_search
+from . import test_analyte_search
+from . import test_dump
+from . import test_facets
+from . import test_results_index
+from . import test_stat_matrix
 
 
 def suite():
     suite1 = unittest.TestLoader().loadTestsFromModule(test_views)
+    suite2 = unittest.TestLoader().loadTestsFromModule(test_analyte_index)
+    suite3 = unittest.TestLoader().loadTestsFromModule(test_keyword_search)
+    suite4 = unittest.TestLoader().loadTestsFromModule(test_analyte_search)
+    suite5 = unittest.TestLoader().loadTestsFromModule(test_dump)
+    suite6 = unittest.TestLoader().loadTestsFromModule(test_facets)
+    suite7 = unittest.TestLoader().loadTestsFromModule(test_results_index)
+    suite8 = unittest.TestLoader().loadTestsFromModule(test_stat_matrix)
 
-    alltests = unittest.TestSuite([suite1])
+    alltests = unittest.TestSuite([suite1, suite2, suite3, suite4, suite5, suite6, suite7, suite8])
 
     return alltests
 
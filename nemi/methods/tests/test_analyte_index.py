@@ -0,0 +1,59 @@
+from django.test import SimpleTestCase, TestCase
+
+from common.utils.cache import bump_data_version, get_data_cache
+from methods.analyte_index import AnalyteIndex, get_analyte_index
+from methods.models import AnalyteCodeVW
+from reference.models import AnalyteCodeRel as ReferenceAnalyteCodeRel, AnalyteRef
+
+
+def _create_analyte_code(name, code):
+    # analyte_code_rel is also mapped by the reference app, whose model requires an analyte
+    analyte = AnalyteRef.objects.create(analyte_code=code)
+    return ReferenceAnalyteCodeRel.objects.create(analyte=analyte, analyte_name=name, analyte_code=code)
+
+
+class AnalyteIndexTestCase(SimpleTestCase):
+
+    def setUp(self):
+        names = ['Nitrate', 'Nitrite', 'Ammonia as nitrogen', 'Total nitrogen', 'Zinc', 'Dinitrotoluene', 'NI']
+        self.index = AnalyteIndex([(name, name) for name in names])
+
+    def test_prefix_matches_first(self):
+        self.assertEqual(self.index.search('nit'), ['Nitrate', 'Nitrite', 'Ammonia as nitrogen', 'Dinitrotoluene', 'Total nitrogen'])
+        self.assertEqual(self.index.search('NITRO'), ['Ammonia as nitrogen', 'Dinitrotoluene', 'Total nitrogen'])
+
+    def test_short_terms(self):
+        self.assertEqual(self.index.search('ni'), ['NI', 'Nitrate', 'Nitrite', 'Ammonia as nitrogen', 'Dinitrotoluene', 'Total nitrogen'])
+        self.assertEqual(self.index.search('z'), ['Zinc'])
+
+    def test_limit(self):
+        self.assertEqual(self.index.search('nit', 1), ['Nitrate'])
+        self.assertEqual(self.index.search('nit', 3), ['Nitrate', 'Nitrite', 'Ammonia as nitrogen'])
+
+    def test_no_match(self):
+        self.assertEqual(self.index.search('xyz'), [])
+        self.assertEqual(self.index.search('nitrox'), [])
+        self.assertEqual(self.index.search(''), [])
+
+
+class GetAnalyteIndexTestCase(TestCase):
+
+    def setUp(self):
+        get_data_cache().clear()
+        _create_analyte_code('Nitrate', '14797-55-8')
+        AnalyteCodeVW.objects.create(analyte_analyte_id=1, analyte_analyte_code='14797-55-8', ac_analyte_name='Nitrate')
+        AnalyteCodeVW.objects.create(analyte_analyte_id=2, analyte_analyte_code='14797-55-8', ac_analyte_name='NITRATE')
+
+    def test_indexes(self):
+        self.assertEqual(get_analyte_index('name').search('itr'), [['Nitrate', '14797-55-8']])
+        self.assertEqual(get_analyte_index('code').search('797'), ['14797-55-8'])
+
+    def test_rebuilt_when_data_version_changes(self):
+        index = get_analyte_index('name')
+        _create_analyte_code('Nitrite', '14797-65-0')
+
+        with self.assertNumQueries(0):
+            self.assertIs(get_analyte_index('name'), index)
+
+        bump_data_version()
+        self.assertEqual(get_analyte_index('name').search('nitri'), [['Nitrite', '14797-65-0']])
@@ -0,0 +1,142 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase
+
+from common.models import MethodAnalyteSearch
+from common.signals import methods_changed
+from methods.analyte_search import SEARCH_FIELDS, analyte_key, filter_analytes, refresh_analyte_search, \
+    search_table_changes
+from methods.models import MethodAnalyteAllVW
+from methods.views import AnalyteResultsView
+
+
+def _create_view_row(analyte_method_id, method_id, analyte_name, analyte_code, **kwargs):
+    return MethodAnalyteAllVW.objects.create(analyte_method_id=analyte_method_id, method_id=method_id,
+                                             method_source_id=1, source_citation_id=1, method_subcategory_id=1,
+                                             analyte_id=analyte_method_id, analyte_name=analyte_name,
+                                             analyte_code=analyte_code, source_method_identifier='M%d' % method_id,
+                                             **kwargs)
+
+
+class RefreshAnalyteSearchTestCase(TestCase):
+
+    def setUp(self):
+        _create_view_row(1, 1, 'Zinc', '7440-66-6', dl_units='mg/L')
+        _create_view_row(2, 1, 'Lead', '7439-92-1')
+        _create_view_row(3, 2, 'Zinc', '7440-66-6')
+
+    def test_refresh(self):
+        self.assertEqual(refresh_analyte_search(), (3, 0, 0))
+
+        row = MethodAnalyteSearch.objects.get(analyte_method_id=1)
+        self.assertEqual(row.analyte_name_key, 'zinc')
+        self.assertEqual(row.dl_units, 'mg/L')
+        self.assertEqual(row.method_id, 1)
+
+        # Nothing is written when the view has not changed
+        self.assertEqual(refresh_analyte_search(), (0, 0, 0))
+
+    def test_incremental_refresh(self):
+        refresh_analyte_search()
+        MethodAnalyteAllVW.objects.filter(analyte_method_id=1).update(analyte_name='Zinc, total')
+        MethodAnalyteAllVW.objects.filter(analyte_method_id=3).delete()
+        _create_view_row(4, 2, 'Copper', '7440-50-8')
+
+        # Only the rows of method 1 are refreshed
+        self.assertEqual(refresh_analyte_search(method_ids=[1]), (0, 1, 0))
+        self.assertEqual(MethodAnalyteSearch.objects.get(analyte_method_id=1).analyte_name_key, 'zinc, total')
+        self.assertTrue(MethodAnalyteSearch.objects.filter(analyte_method_id=3).exists())
+
+        self.assertEqual(refresh_analyte_search(), (1, 0, 1))
+        self.assertEqual(sorted(MethodAnalyteSearch.objects.values_list('analyte_method_id', flat=True)), [1, 2, 4])
+
+    def test_repeated_analyte_method(self):
+        # Each distinct row of an analyte method repeated by the view's joins is kept
+        values = dict((field, None) for field in SEARCH_FIELDS)
+        view_rows = []
+        for units in ('mg/L', 'ug/L', 'ug/L'):
+            values.update(analyte_name='Zinc', analyte_code='7440-66-6', dl_units=units)
+            view_rows.append((1,) + tuple(values[field] for field in SEARCH_FIELDS))
+
+        created, changed, deleted, new_rows = search_table_changes({}, view_rows)
+        self.assertEqual((created, changed, deleted), ([1], [], []))
+        self.assertEqual(len(new_rows), 2)
+
+        existing = {1 : set(values for analyte_method_id, values in new_rows), 2 : set()}
+        self.assertEqual(search_table_changes(existing, view_rows)[:3], ([], [], [2]))
+        self.assertEqual(search_table_changes(existing, view_rows[:1])[:3], ([], [1], [2]))
+
+    def test_changed_methods_refreshed(self):
+        with self.settings(ANALYTE_SEARCH_TABLE=True):
+            methods_changed.send(sender=None, method_ids=[2])
+        self.assertEqual(list(MethodAnalyteSearch.objects.values_list('analyte_method_id', flat=True)), [3])
+
+        with self.settings(ANALYTE_SEARCH_TABLE=False):
+            methods_changed.send(sender=None, method_ids=[1])
+        self.assertEqual(MethodAnalyteSearch.objects.count(), 1)
+
+    def test_command(self):
+        call_command('refresh_analyte_search', method_ids=[2], stdout=StringIO())
+
+        self.assertEqual(list(MethodAnalyteSearch.objects.values_list('analyte_method_id', flat=True)), [3])
+
+
+class AnalyteResultsSearchTableTestCase(TestCase):
+
+    def setUp(self):
+        _create_view_row(1, 1, 'Zinc', '7440-66-6')
+        _create_view_row(2, 1, 'Lead', '7439-92-1')
+        _create_view_row(3, 2, 'zinc', '7440-66-6')
+        _create_view_row(5, 4, 'Nitrate  as N', 'NO3')
+        refresh_analyte_search()
+        self.factory = RequestFactory()
+
+    def _results(self, query):
+        view = AnalyteResultsView()
+        view.request = self.factory.get('/methods/analyte_results/', query)
+        return sorted((row['method_id'], row['analyte_name']) for row in view.get_queryset())
+
+    def test_search_table_matches_view(self):
+        for query in [{'analyte_name' : 'ZINC'}, {'analyte_name' : ['lead', 'Zinc']}, {'analyte_code' : '7440-66-6'},
+                      {'analyte_code' : ['no3', '7439-92-1']}]:
+            with self.settings(ANALYTE_SEARCH_TABLE=False):
+                expected = self._results(query)
+            with self.settings(ANALYTE_SEARCH_TABLE=True):
+                self.assertEqual(self._results(query), expected)
+            self.assertTrue(expected)
+
+    def test_whitespace_ignored(self):
+        for search_table in (False, True):
+            with self.settings(ANALYTE_SEARCH_TABLE=search_table):
+                self.assertEqual(self._results({'analyte_name' : ' nitrate as   N'}), [(4, 'Nitrate  as N')])
+                self.assertEqual(self._results({'analyte_name' : 'Nitrate'}), [])
+
+    def test_search_table_used(self):
+        # Rows which have not been refreshed into the table are not found, but are found at once in the view
+        _create_view_row(4, 3, 'Copper', '7440-50-8')
+
+        with self.settings(ANALYTE_SEARCH_TABLE=True):
+            self.assertEqual(self._results({'analyte_name' : 'Copper'}), [])
+        with self.settings(ANALYTE_SEARCH_TABLE=False):
+            self.assertEqual(self._results({'analyte_name' : 'Copper'}), [(3, 'Copper')])
+
+
+class AnalyteKeyTestCase(TestCase):
+
+    def test_analyte_key(self):
+        self.assertEqual(analyte_key(' Zinc,\tTOTAL  recoverable '), 'zinc, total recoverable')
+        self.assertEqual(analyte_key('STRASSE'), analyte_key('straße'))
+        self.assertIsNone(analyte_key(None))
+
+    def test_filter_unknown_analytes(self):
+        data = filter_analytes(MethodAnalyteAllVW.objects.all(), 'analyte_name', ['Unobtainium'])
+        self.assertEqual(list(data), [])
+        self.assertEqual(list(filter_analytes(MethodAnalyteAllVW.objects.all(), 'analyte_name', ['  '])), [])
+
+    def test_special_characters(self):
+        _create_view_row(1, 1, 'Chromium (VI)', '18540-29-9')
+        _create_view_row(2, 1, 'Chromium VI', '18540-29-9')
+
+        data = filter_analytes(MethodAnalyteAllVW.objects.all(), 'analyte_name', ['chromium  (vi)'])
+        self.assertEqual(list(data.values_list('analyte_method_id', flat=True)), [1])
@@ -0,0 +1,127 @@
+import datetime
+from io import StringIO
+import gzip
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.http import FileResponse
+from django.test import TestCase
+
+from common.models import BackgroundJob
+from common.signals import methods_changed
+from methods.dump import ANALYTE_FIELDS, DUMP_JOB_KIND, dump_files, iter_methods
+from methods.models import MethodAnalyteAllVW, RevisionSummaryVw
+
+from .test_views import MethodSummaryFactory
+
+
+class MethodDumpTestCase(TestCase):
+
+    def setUp(self):
+        old = datetime.date(2019, 1, 1)
+        new = datetime.date(2020, 6, 1)
+        MethodSummaryFactory(method_id=1, date_loaded=old)
+        MethodSummaryFactory(method_id=2, date_loaded=new)
+        MethodSummaryFactory(method_id=3, date_loaded=old)
+        for analyte_method_id, method_id in ((10, 1), (11, 1), (12, 3)):
+            MethodAnalyteAllVW.objects.create(analyte_method_id=analyte_method_id, method_id=method_id,
+                                              method_source_id=1, source_citation_id=1, method_subcategory_id=1,
+                                              analyte_id=analyte_method_id, analyte_name='A%d' % analyte_method_id)
+        for revision_id, method_id, last_update_date in ((20, 1, old), (21, 3, new)):
+            RevisionSummaryVw.objects.create(revision_id=revision_id, method_id=method_id, insert_date=old,
+                                             last_update_date=last_update_date, pdf_insert_date=old,
+                                             date_loaded=old, revision_flag=1)
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_override = self.settings(DUMP_DIR=directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_iter_methods(self):
+        methods = list(iter_methods(fetch_size=1))
+
+        self.assertEqual([method['method_id'] for method in methods], [1, 2, 3])
+        self.assertEqual([analyte['analyte_method_id'] for analyte in methods[0]['analytes']], [10, 11])
+        self.assertEqual(set(methods[0]['analytes'][0]), set(ANALYTE_FIELDS))
+        self.assertEqual(methods[1]['analytes'], [])
+        self.assertEqual([revision['revision_id'] for revision in methods[2]['revisions']], [21])
+        self.assertNotIn('method_id', methods[2]['revisions'][0])
+
+    def test_since(self):
+        methods = list(iter_methods(since=datetime.date(2020, 1, 1)))
+
+        self.assertEqual([method['method_id'] for method in methods], [2, 3])
+        self.assertEqual([analyte['analyte_method_id'] for analyte in methods[1]['analytes']], [12])
+
+    def test_view(self):
+        resp = self.client.get('/api/methods/dump/')
+        self.assertEqual(resp['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(resp.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line)['method_id'] for line in lines], [1, 2, 3])
+        self.assertEqual(json.loads(lines[0])['date_loaded'], '2019-01-01')
+
+        self.assertEqual(self.client.get('/api/methods/dump/', HTTP_IF_NONE_MATCH=resp['ETag']).status_code, 304)
+
+        resp = self.client.get('/api/methods/dump/', {'since' : '2020-01-01', 'gzip' : 'true'})
+        lines = gzip.decompress(b''.join(resp.streaming_content)).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line)['method_id'] for line in lines], [2, 3])
+
+        self.assertEqual(self.client.get('/api/methods/dump/', {'since' : '2020'}).status_code, 400)
+
+    def test_view_serves_file(self):
+        etag = self.client.get('/api/methods/dump/')['ETag']
+
+        # The full dump is served from the files until they are out of date, the since dump from the database
+        MethodSummaryFactory(method_id=4, date_loaded=datetime.date(2020, 6, 1))
+        resp = self.client.get('/api/methods/dump/')
+        self.assertIsInstance(resp, FileResponse)
+        self.assertEqual(resp['ETag'], etag)
+        lines = b''.join(resp.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line)['method_id'] for line in lines], [1, 2, 3])
+        resp = self.client.get('/api/methods/dump/', {'since' : '2020-01-01'})
+        lines = b''.join(resp.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line)['method_id'] for line in lines], [2, 3, 4])
+
+        resp = self.client.get('/api/methods/dump/', {'gzip' : 'true'})
+        self.assertEqual(resp['Content-Type'], 'application/gzip')
+        self.assertEqual(resp['ETag'], etag[:-1] + '-gzip"')
+        self.assertEqual(len(gzip.decompress(b''.join(resp.streaming_content)).splitlines()), 3)
+
+        # Out of date files are still served while a job rebuilds them
+        with self.settings(DUMP_MAX_AGE=0, JOBS_RUN_EAGERLY=True):
+            resp = self.client.get('/api/methods/dump/')
+        self.assertEqual(resp['ETag'], etag)
+        self.assertTrue(BackgroundJob.objects.filter(kind=DUMP_JOB_KIND, status=BackgroundJob.FINISHED).exists())
+        resp = self.client.get('/api/methods/dump/')
+        self.assertNotEqual(resp['ETag'], etag)
+        self.assertEqual(len(b''.join(resp.streaming_content).splitlines()), 4)
+
+    def test_expired_when_methods_change(self):
+        etag = self.client.get('/api/methods/dump/')['ETag']
+        MethodSummaryFactory(method_id=4, date_loaded=datetime.date(2020, 6, 1))
+
+        methods_changed.send(sender=None, method_ids=[4])
+        with self.settings(JOBS_RUN_EAGERLY=True):
+            self.client.get('/api/methods/dump/')
+        self.assertNotEqual(self.client.get('/api/methods/dump/')['ETag'], etag)
+
+    def test_command(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+
+        call_command('dump_methods', output=path, gzip=True, stdout=StringIO())
+
+        with gzip.open(path, 'rt') as fileobj:
+            self.assertEqual([json.loads(line)['method_id'] for line in fileobj], [1, 2, 3])
+
+    def test_command_refresh(self):
+        call_command('dump_methods', refresh=True, stdout=StringIO())
+
+        self.assertEqual(dump_files.read_manifest()['count'], 3)
+        with gzip.open(dump_files.dump_path(compress=True), 'rt') as fileobj:
+            self.assertEqual([json.loads(line)['method_id'] for line in fileobj], [1, 2, 3])
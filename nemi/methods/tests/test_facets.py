@@ -0,0 +1,84 @@
+import json
+
+from django.http import QueryDict
+from django.test import RequestFactory, SimpleTestCase, TestCase
+
+from common.utils.cache import bump_data_version
+from methods.facets import bitset, popcount, FacetIndex, get_facet_index
+from methods.models import MethodVW
+from methods.views import ResultsMixin
+
+from .test_views import MethodSummaryFactory
+
+# method_id, method number, category, subcategory, media name, source, instrumentation id, method type, matrix
+ROWS = [
+    (1, 'M1', 'CHEMICAL', 'Inorganic', 'WATER', 'EPA-OW', 1, 'Analytical', 'Water'),
+    (2, 'M2', 'CHEMICAL', 'Organic', 'WATER', 'USGS-NWQL', 2, 'Analytical', 'Water'),
+    (3, 'M3', 'CHEMICAL', 'Organic', 'SOIL', 'EPA-ORD', 2, 'Sampling', 'Soil'),
+    (4, 'M4', 'Biological', 'Fish', 'TISSUE', 'ASTM', 3, 'Analytical', 'Tissue'),
+]
+
+
+class BitsetTestCase(SimpleTestCase):
+
+    def test_bitset(self):
+        bits = bitset([0, 3, 9])
+        self.assertEqual(bits, 0b1000001001)
+        self.assertEqual(popcount(bits), 3)
+        self.assertEqual(bitset([]), 0)
+
+
+class FacetIndexTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.index = FacetIndex(ROWS)
+
+    def test_counts(self):
+        count, facets = self.index.counts(QueryDict('category=chemical&media_name=WATER'))
+
+        self.assertEqual(count, 2)
+        self.assertEqual(facets['media_name'], [('SOIL', 1), ('TISSUE', 0), ('WATER', 2)])
+        self.assertEqual(facets['category'], [('BIOLOGICAL', 0), ('CHEMICAL', 2)])
+        self.assertEqual(facets['source'], [('ASTM', 0), ('EPA', 1), ('USGS', 1)])
+        self.assertEqual(facets['instrumentation'], [('1', 1), ('2', 1), ('3', 0)])
+        self.assertEqual(facets['matrix'], [('Soil', 0), ('Tissue', 0), ('Water', 2)])
+
+    def test_filters(self):
+        self.assertEqual(self.index.counts(QueryDict('source=EPA'))[0], 2)
+        self.assertEqual(self.index.counts(QueryDict('subcategory=Fish&subcategory=Organic'))[0], 3)
+        self.assertEqual(self.index.counts(QueryDict('subcategory=Fish&subcategory='))[0], 4)
+        self.assertEqual(self.index.counts(QueryDict('method_type='))[0], 0)
+        self.assertEqual(self.index.counts(QueryDict('instrumentation=2&method_type=Analytical'))[0], 1)
+
+
+class FacetCountsViewTestCase(TestCase):
+
+    def setUp(self):
+        for method_id, identifier, category, subcategory, media_name, source, instrumentation_id, method_type, \
+                matrix in ROWS:
+            MethodSummaryFactory(method_id=method_id, source_method_identifier=identifier, method_category=category,
+                                 method_subcategory=subcategory, media_name=media_name, method_source=source,
+                                 instrumentation_id=instrumentation_id, method_type_desc=method_type, matrix=matrix)
+        bump_data_version()
+
+    def test_matches_results_mixin(self):
+        for query_string in ('', 'category=chemical', 'subcategory=Organic&media_name=WATER', 'source=EPA',
+                             'instrumentation=2', 'method_type=Analytical&method_type=Sampling&category=CHEMICAL'):
+            mixin = ResultsMixin()
+            mixin.queryset = MethodVW.objects.all()
+            mixin.request = RequestFactory().get('/methods/results/?' + query_string)
+
+            resp = self.client.get('/methods/facet_counts/?' + query_string)
+            self.assertEqual(json.loads(resp.content.decode('utf-8'))['count'], mixin.get_queryset().count(),
+                             query_string)
+
+    def test_rebuilt_on_data_change(self):
+        index = get_facet_index()
+        self.assertIs(get_facet_index(), index)
+
+        MethodVW.objects.filter(method_id=4).update(media_name='WATER')
+        bump_data_version()
+
+        resp = self.client.get('/methods/facet_counts/', {'category' : 'Biological'})
+        facets = json.loads(resp.content.decode('utf-8'))['facets']
+        self.assertIn({'value' : 'WATER', 'count' : 1}, facets['media_name'])
@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from methods.keyword_index import Segment, tokenize, write_segment
+from methods.keyword_search import LocalKeywordSearch
+from methods.models import MethodSummaryVW
+from methods.views import KeywordResultsView
+
+
+class TokenizeTestCase(SimpleTestCase):
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize('EPA 300.0: Nitrate-N_total'), ['epa', '300', '0', 'nitrate', 'n', 'total'])
+        self.assertEqual(tokenize(''), [])
+        self.assertEqual(tokenize(None), [])
+
+
+class SegmentTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'index.seg')
+        write_segment(self.path, [
+            (10, [('EPA 300.0', 3), ('Nitrate and nitrite by ion chromatography', 1)]),
+            (20, [('USGS I-2545', 3), ('Nitrate plus nitrite, nitrite nitrite by colorimetry', 1)]),
+            (30, [('Zinc by ICP', 3), ('Metals', 1)]),
+        ])
+        self.segment = Segment(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _method_ids(self, scores):
+        ranked = sorted(scores.items(), key=lambda item: -item[1])
+        return [self.segment.method_id(doc_index) for doc_index, score in ranked]
+
+    def test_counts(self):
+        self.assertEqual(self.segment.doc_count, 3)
+
+    def test_term_frequency_ranks_higher(self):
+        self.assertEqual(self._method_ids(self.segment.search('nitrite')), [20, 10])
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(self._method_ids(self.segment.search('Nitrate chromatography')), [10])
+        self.assertEqual(self.segment.search('nitrate zinc'), {})
+        self.assertEqual(self.segment.search('missing'), {})
+        self.assertEqual(self.segment.search('...'), {})
+
+    def test_weighted_field(self):
+        self.assertEqual(self._method_ids(self.segment.search('epa')), [10])
+
+
+class LocalKeywordSearchTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'index.seg')
+        for method_id in range(1, 26):
+            MethodSummaryVW.objects.create(method_id=method_id,
+                                           revision_id=method_id,
+                                           method_source_id=1,
+                                           source_citation_id=1,
+                                           method_subcategory_id=1,
+                                           method_source='EPA',
+                                           source_method_identifier='EPA %d' % method_id,
+                                           method_descriptive_name='Nitrate ' * (method_id % 5 + 1),
+                                           method_category='INORGANIC')
+        MethodSummaryVW.objects.create(method_id=100, revision_id=100, method_source_id=1, source_citation_id=1,
+                                       method_subcategory_id=1, source_method_identifier='Zinc')
+        call_command('build_keyword_index', output=self.path, pdf=False, stdout=open(os.devnull, 'w'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_results_are_lazy_and_ranked(self):
+        with override_settings(KEYWORD_INDEX_PATH=self.path):
+            results = LocalKeywordSearch().search('nitrate')
+
+        self.assertEqual(results.count(), 25)
+        with self.assertNumQueries(1):
+            page = results[0:5]
+        # The methods with the most occurrences of nitrate rank first, then by method_id
+        self.assertEqual([r['METHOD_ID'] for r in page], [4, 9, 14, 19, 24])
+        self.assertEqual(page[0]['METHOD_NUMBER'], 'EPA 4')
+        self.assertEqual(page[0]['METHOD_CATEGORY'], 'INORGANIC')
+        self.assertEqual([r['METHOD_ID'] for r in results[5:7]], [3, 8])
+
+    @override_settings(KEYWORD_SEARCH_BACKEND='methods.keyword_search.LocalKeywordSearch')
+    def test_view(self):
+        with self.settings(KEYWORD_INDEX_PATH=self.path):
+            request = RequestFactory().get('/methods/keyword_results/', {'keyword_search_field' : 'nitrate', 'page' : 2})
+            response = KeywordResultsView.as_view()(request)
+
+        self.assertEqual(response.context_data['total_found'], 25)
+        self.assertEqual(response.context_data['results'].number, 2)
+        self.assertEqual(len(response.context_data['results'].object_list), 5)
+
+    def test_index_is_reopened_when_rebuilt(self):
+        with override_settings(KEYWORD_INDEX_PATH=self.path):
+            self.assertEqual(LocalKeywordSearch().search('zinc').count(), 1)
+            MethodSummaryVW.objects.filter(method_id=100).update(source_method_identifier='Copper')
+            call_command('build_keyword_index', output=self.path, pdf=False, stdout=open(os.devnull, 'w'))
+
+            self.assertEqual(LocalKeywordSearch().search('zinc').count(), 0)
+            self.assertEqual(LocalKeywordSearch().search('copper').count(), 1)
@@ -0,0 +1,56 @@
+from django.test import RequestFactory, TestCase, override_settings
+
+from common.utils.cache import bump_data_version
+from methods.results_index import IndexedResults, method_results
+from methods.models import MethodVW
+from methods.views import MethodResultsMixin
+
+from .test_views import MethodResultsViewTestCase, MethodSummaryFactory
+
+
+@override_settings(METHOD_RESULTS_INDEX=True)
+class IndexedMethodResultsViewTestCase(MethodResultsViewTestCase):
+    '''Runs the method results view tests with the results found from the index.'''
+
+    def setUp(self):
+        super(IndexedMethodResultsViewTestCase, self).setUp()
+        bump_data_version()
+
+    def test_uses_index(self):
+        response = self.client.get('/methods/results/', {'category' : 'A'})
+
+        self.assertIsInstance(response.context_data['paginator'].object_list, IndexedResults)
+
+
+class MethodResultsTestCase(TestCase):
+
+    def setUp(self):
+        rows = [(1, 'EPA 300.0', 'CHEMICAL', 'WATER', 'EPA-OW', 'Water'),
+                (2, 'EPA 200.7', 'CHEMICAL', 'WATER', 'EPA-OW', 'Soil'),
+                (3, 'D1234', 'CHEMICAL', 'SOIL', 'ASTM', 'Water'),
+                (4, 'I-1234', 'BIOLOGICAL', 'WATER', 'USGS-NWQL', 'Water')]
+        for method_id, identifier, category, media_name, source, matrix in rows:
+            MethodSummaryFactory(method_id=method_id, source_method_identifier=identifier, method_category=category,
+                                 media_name=media_name, method_source=source, matrix=matrix)
+        bump_data_version()
+
+    def test_matches_queryset(self):
+        for query_string in ('', 'method_number=epa', 'method_number=1234&category=chemical', 'matrix=Water',
+                             'source=EPA&matrix=Soil', 'media_name=WATER&method_number='):
+            mixin = MethodResultsMixin()
+            mixin.request = RequestFactory().get('/methods/results/?' + query_string)
+            qs = mixin.get_queryset().order_by('source_method_identifier', 'method_id')
+
+            results = method_results(mixin.request.GET, MethodVW.objects.all())
+            self.assertEqual(results.count(), qs.count(), query_string)
+            self.assertEqual([method.method_id for method in results],
+                             list(qs.values_list('method_id', flat=True)), query_string)
+
+    def test_slices(self):
+        results = method_results(RequestFactory().get('/methods/results/').GET, MethodVW.objects.all())
+
+        with self.assertNumQueries(1):
+            self.assertEqual([row['method_id'] for row in results.values('method_id')[1:3]], [2, 1])
+        self.assertEqual([row['method_id'] for row in results.values('method_id').after(['EPA 200.7', 2])[:]],
+                         [1, 4])
+        self.assertEqual(results[5:10], [])
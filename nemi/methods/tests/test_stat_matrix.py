@@ -0,0 +1,92 @@
+import datetime
+
+from django.http import QueryDict
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from common.models import SourceCitationRef, SourceCitationStgRef, PublicationSourceRelStg, MethodStg
+from common.models import StatisticalItemType, StatAnalysisRelStg, StatDesignRelStg, StatTopicRelStg, StatMediaRelStg
+from common.utils.cache import bump_data_version
+from methods.stat_matrix import StatMatrix, get_stat_matrix
+from methods.views import StatisticalResultsView
+from sams.approval import approve_stat_methods
+
+from .test_views import MethodSummaryFactory
+
+
+class StatMatrixTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.matrix = StatMatrix([
+            (1, [('item_type', 1), ('analysis_type', 2), ('analysis_type', 3), ('complexity', 'Low')]),
+            (2, [('item_type', 1), ('analysis_type', 3), ('media_emphasized', 'WATER')]),
+            (3, [('item_type', 2)]),
+            (4, []),
+        ])
+
+    def test_rows(self):
+        # Methods without any attributes have no row
+        self.assertEqual(len(self.matrix), 3)
+
+    def test_method_ids(self):
+        self.assertIsNone(self.matrix.method_ids(QueryDict('item_type=&category=STATISTICAL')))
+        self.assertEqual(self.matrix.method_ids(QueryDict('item_type=1')), [1, 2])
+        self.assertEqual(self.matrix.method_ids(QueryDict('item_type=1&analysis_type=3')), [1, 2])
+        self.assertEqual(self.matrix.method_ids(QueryDict('analysis_type=3&complexity=Low')), [1])
+        self.assertEqual(self.matrix.method_ids(QueryDict('media_emphasized=WATER&analysis_type=2')), [])
+        self.assertEqual(self.matrix.method_ids(QueryDict('special_topic=9')), [])
+
+
+class StatisticalResultsTestCase(TestCase):
+
+    fixtures = ['static_data.json',
+                'method_subcategory_ref.json',
+                'method_type_ref.json',
+                'method_source_ref.json',
+                'instrumentation_ref.json']
+
+    def setUp(self):
+        item_type = StatisticalItemType.objects.create(stat_item_index=100)
+        for method_id, analysis_type_id, media_name in ((1, 2, 'AGRICULTURAL PRODUCTS'), (2, 1, 'AIR')):
+            citation_id = method_id + 10
+            SourceCitationStgRef.objects.create(source_citation_id=citation_id, source_citation='SAMS',
+                                                item_type=item_type)
+            SourceCitationRef.objects.create(source_citation_id=citation_id, source_citation='SAMS',
+                                             item_type=item_type)
+            PublicationSourceRelStg.objects.create(source_citation_ref_id=citation_id, source_id=6)
+            MethodStg.objects.create(method_id=method_id, source_method_identifier='SAMS M%d' % method_id,
+                                     method_subcategory_id=16, method_type_id=1, method_source_id=91,
+                                     instrumentation_id=125, source_citation_id=citation_id,
+                                     date_loaded=datetime.date(2012, 1, 1))
+            StatAnalysisRelStg.objects.create(method_id=method_id, analysis_type_id=analysis_type_id)
+            StatDesignRelStg.objects.create(method_id=method_id, design_objective_id=4)
+            StatTopicRelStg.objects.create(method_id=method_id, topic_id=4)
+            StatMediaRelStg.objects.create(method_id=method_id, media_name_id=media_name)
+            MethodSummaryFactory(method_id=method_id, source_method_identifier='SAMS M%d' % method_id,
+                                 source_citation_id=citation_id, method_category='STATISTICAL',
+                                 sam_complexity='Low')
+        MethodSummaryFactory(method_id=3, source_citation_id=13, method_category='CHEMICAL', sam_complexity='')
+        bump_data_version()
+
+    def _method_ids(self, params):
+        request = RequestFactory().get('/methods/statistical_results/', params)
+        response = StatisticalResultsView.as_view()(request)
+        return [method.method_id for method in response.context_data['data']]
+
+    def test_approval(self):
+        self.assertEqual(len(get_stat_matrix()), 2)
+        self.assertEqual(self._method_ids({'analysis_type' : 2}), [])
+
+        approve_stat_methods([1, 2], 'user1')
+        # The data version is bumped when the approval is committed
+        bump_data_version()
+
+        self.assertEqual(self._method_ids({'category' : 'STATISTICAL'}), [1, 2])
+        self.assertEqual(self._method_ids({'item_type' : 100, 'publication_source_type' : 6}), [1, 2])
+        self.assertEqual(self._method_ids({'analysis_type' : 2, 'study_objective' : 4, 'special_topic' : 4}), [1])
+        self.assertEqual(self._method_ids({'media_emphasized' : 'AIR', 'complexity' : 'Low'}), [2])
+        self.assertEqual(self._method_ids({'complexity' : 'High'}), [])
+
+
+@override_settings(STAT_MATRIX=True)
+class StatisticalResultsMatrixTestCase(StatisticalResultsTestCase):
+    '''Runs the StatisticalResultsView tests with the filters answered by the attribute matrix.'''
@@ -4,12 +4,33 @@ Created on Mar 13, 2012
 @author: mbucknel
 '''
 
-from django.test import SimpleTestCase, TestCase
+import datetime
+import json
+import shutil
+import tempfile
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.db import connection
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
 from factory.django import DjangoModelFactory
 from rest_framework.test import APIRequestFactory
 
-from methods.models import MethodVW
-from methods.views import _clean_name, _clean_keyword, MethodRestViewSet
+from common.models import AnalyteSummaryVW, BackgroundJob, InstrumentationRef, Method, MethodTypeRef, SourceCitationRef
+from common.utils.cache import bump_data_version, get_data_cache
+from methods.models import MethodVW, MethodSummaryVW, AnalyteCodeVW, MethodAnalyteAllVW, RevisionSummaryVw
+from methods.keyword_search import OracleKeywordSearch, _clean_keyword
+from methods.views import _clean_name, MethodRestViewSet, MethodSummaryView, ExportMethodAnalyte
+from methods.views import AnalyteSelectView, ExportMethodResultsView, MethodResultsView
+from reference.models import AnalyteCodeRel as ReferenceAnalyteCodeRel, AnalyteRef
+
+
+def _create_analyte_code(name, code):
+    # analyte_code_rel is also mapped by the reference app, whose model requires an analyte
+    analyte = AnalyteRef.objects.create(analyte_code=code)
+    return ReferenceAnalyteCodeRel.objects.create(analyte=analyte, analyte_name=name, analyte_code=code)
 
 
 class CleanNameTestCase(SimpleTestCase):
@@ -51,19 +72,19 @@ class CleanKeywordTestCase(SimpleTestCase):
 
     def test_with_quote(self):
         keyword = "ni'trate"
-        self.assertEqual(_clean_keyword(keyword), "%ni''trate%")
+        self.assertEqual(_clean_keyword(keyword), "%ni'trate%")
 
     def test_with_two_quotes(self):
         keyword = "ni'trate'chloride"
-        self.assertEqual(_clean_keyword(keyword), "%ni''trate''chloride%")
+        self.assertEqual(_clean_keyword(keyword), "%ni'trate'chloride%")
 
     def test_with_double_quotes(self):
         keyword = 'ni"trate'
-        self.assertEqual(_clean_keyword(keyword), '%ni""trate%')
+        self.assertEqual(_clean_keyword(keyword), '%ni"trate%')
 
     def test_with_two_double_quotes(self):
         keyword = 'ni"trate"chloride'
-        self.assertEqual(_clean_keyword(keyword), '%ni""trate""chloride%')
+        self.assertEqual(_clean_keyword(keyword), '%ni"trate"chloride%')
 
     def test_with_percent(self):
         keyword = 'ni%trate'
@@ -75,7 +96,7 @@ class CleanKeywordTestCase(SimpleTestCase):
 
     def test_with_percent_and_quote_chars(self):
         keyword = 'ni"tr%ate'
-        self.assertEqual(_clean_keyword(keyword), '%ni""tr\%ate%')
+        self.assertEqual(_clean_keyword(keyword), '%ni"tr\%ate%')
 
     def test_with_dash(self):
         keyword = 'ni-trate'
@@ -87,7 +108,11 @@ class CleanKeywordTestCase(SimpleTestCase):
 
     def test_with_comma_and_quote(self):
         keyword = "ni,tr'ate"
-        self.assertEqual(_clean_keyword(keyword), "%ni\,tr''ate%")
+        self.assertEqual(_clean_keyword(keyword), "%ni\,tr'ate%")
+
+    def test_oracle_search_binds_quote(self):
+        results = OracleKeywordSearch().search("Hach's")
+        self.assertEqual(results.params, ["%Hach's%", "%Hach's%"])
 
 
 class MethodSummaryFactory(DjangoModelFactory):
@@ -188,3 +213,407 @@ class MethodSummaryRestViewSetTestCase(TestCase):
 
         self.assertEqual(result.count(), 0)
 
+
+class MethodRestApiTestCase(TestCase):
+
+    def setUp(self):
+        for method_id in range(1, 6):
+            MethodSummaryFactory(method_id=method_id, method_category='A', method_subcategory='A1',
+                                 source_method_identifier='M%d' % method_id)
+
+    def test_cursor_pagination(self):
+        resp = self.client.get('/api/methods.json', {'page_size' : 2})
+        data = json.loads(resp.content.decode('utf-8'))
+        self.assertEqual([row['method_id'] for row in data['results']], [1, 2])
+
+        method_ids = [1, 2]
+        while data['next']:
+            data = json.loads(self.client.get(data['next']).content.decode('utf-8'))
+            method_ids.extend(row['method_id'] for row in data['results'])
+        self.assertEqual(method_ids, [1, 2, 3, 4, 5])
+
+        self.assertEqual(self.client.get('/api/methods.json', {'cursor' : 'bad'}).status_code, 404)
+
+    def test_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get('/api/methods/1.json', {'fields' : 'source_method_identifier,author'})
+
+        self.assertEqual(json.loads(resp.content.decode('utf-8')),
+                         {'method_id' : 1, 'source_method_identifier' : 'M1', 'author' : 'A'})
+        self.assertNotIn('brief_method_summary', queries[0]['sql'])
+
+        resp = self.client.get('/api/methods.json')
+        self.assertIn('brief_method_summary', json.loads(resp.content.decode('utf-8'))['results'][0])
+
+        self.assertEqual(self.client.get('/api/methods.json', {'fields' : 'password'}).status_code, 400)
+
+    def test_etag(self):
+        resp = self.client.get('/api/methods.json')
+        etag = resp['ETag']
+
+        self.assertEqual(self.client.get('/api/methods.json', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        bump_data_version()
+        resp = self.client.get('/api/methods.json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp['ETag'], etag)
+
+
+class MethodSummaryViewGetObjectTestCase(TestCase):
+
+    def setUp(self):
+        today = datetime.date.today()
+        MethodSummaryVW.objects.create(method_id=1,
+                                       revision_id=10,
+                                       method_source_id=1,
+                                       source_citation_id=1,
+                                       method_subcategory_id=1)
+        RevisionSummaryVw.objects.create(revision_id=10,
+                                         method_id=1,
+                                         insert_date=today,
+                                         last_update_date=today,
+                                         pdf_insert_date=today,
+                                         date_loaded=today,
+                                         revision_flag=1)
+
+        self.view = MethodSummaryView(kwargs={'method_id' : 1})
+
+    def _create_analytes(self, start, stop):
+        for i in range(start, stop):
+            AnalyteSummaryVW.objects.create(method_id=1,
+                                            preferred=-1,
+                                            analyte_name='Analyte %03d' % i,
+                                            analyte_code='C%03d' % i)
+            AnalyteCodeVW.objects.create(analyte_analyte_id=2 * i,
+                                         analyte_analyte_code='C%03d' % i,
+                                         ac_analyte_name='ANALYTE %03d' % i)
+            AnalyteCodeVW.objects.create(analyte_analyte_id=2 * i + 1,
+                                         analyte_analyte_code='C%03d' % i,
+                                         ac_analyte_name='Synonym %03d' % i)
+
+    def test_synonyms(self):
+        self._create_analytes(0, 2)
+        AnalyteCodeVW.objects.create(analyte_analyte_id=100,
+                                     analyte_analyte_code='OTHER',
+                                     ac_analyte_name='Other analyte')
+
+        result = self.view.get_object()
+
+        self.assertEqual([a['r']['analyte_name'] for a in result['analytes']], ['Analyte 000', 'Analyte 001'])
+        self.assertEqual(result['analytes'][0]['syn'], ['ANALYTE 000', 'Synonym 000'])
+        self.assertEqual(result['analytes'][1]['syn'], ['ANALYTE 001', 'Synonym 001'])
+
+    def test_synonyms_matched_by_name(self):
+        AnalyteSummaryVW.objects.create(method_id=1, preferred=-1, analyte_name='Nitrate', analyte_code='NO3')
+        AnalyteCodeVW.objects.create(analyte_analyte_id=1, analyte_analyte_code='14797-55-8', ac_analyte_name='NITRATE')
+        AnalyteCodeVW.objects.create(analyte_analyte_id=2, analyte_analyte_code='14797-55-8', ac_analyte_name='Nitrate-N')
+
+        result = self.view.get_object()
+
+        self.assertEqual(result['analytes'][0]['syn'], ['NITRATE', 'Nitrate-N'])
+
+    def test_query_count_independent_of_analyte_count(self):
+        self._create_analytes(0, 3)
+        with self.assertNumQueries(4):
+            result = self.view.get_object()
+        self.assertEqual(len(result['analytes']), 3)
+
+        self._create_analytes(3, 50)
+        with self.assertNumQueries(4):
+            result = self.view.get_object()
+        self.assertEqual(len(result['analytes']), 50)
+
+
+class ExportMethodAnalyteTestCase(TestCase):
+
+    def setUp(self):
+        AnalyteSummaryVW.objects.create(method_id=1, preferred=-1, analyte_name='Nitrate', analyte_code='NO3',
+                                        dl_value=0.5, dl_units='mg/L', accuracy=95, accuracy_units='%',
+                                        precision=2.5, precision_units='%RSD', prec_acc_conc_used=1)
+        AnalyteSummaryVW.objects.create(method_id=1, preferred=-1, analyte_name='Zinc', analyte_code='Zn',
+                                        dl_value=999, accuracy=-999, precision=999,
+                                        false_positive_value=5, false_negative_value=6)
+
+    def test_export(self):
+        response = ExportMethodAnalyte().get(None, method_id=1)
+
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename=1_analytes.tsv')
+        lines = b''.join(response.streaming_content).decode('utf-8').split('\n')
+        self.assertEqual(lines[0], 'Analyte\tDetection Level\tBias\tPrecision\tPct False Positive\tPct False Negative\tSpiking Level')
+        self.assertEqual(lines[1], 'Nitrate\t0.50 mg/L\t95 %\t2.50 %RSD\t\t\t1.00 mg/L\t')
+        self.assertEqual(lines[2], 'Zinc\tN/A\tN/A\tN/A\t5\t6\t\t')
+
+
+class ExportMethodResultsAsyncTestCase(TestCase):
+
+    def setUp(self):
+        for method_id in range(1, 4):
+            MethodSummaryFactory(method_id=method_id, source_method_identifier='M%d' % method_id, method_category='A')
+        self.export_dir = tempfile.mkdtemp()
+        self.settings_override = self.settings(JOBS_RUN_EAGERLY=True, EXPORT_DIR=self.export_dir)
+        self.settings_override.enable()
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.export_dir)
+
+    def _post(self, query, data):
+        request = self.factory.post('/methods/export_results/?' + query, data)
+        return ExportMethodResultsView.as_view()(request)
+
+    def test_async_export(self):
+        response = self._post('category=A', {'method_id' : ['1', '3'], 'export' : 'tsv', 'async' : '1'})
+        self.assertEqual(response.status_code, 202)
+        job = json.loads(response.content.decode('utf-8'))
+
+        status = self.client.get(job['status_url']).json()
+        self.assertEqual(status['status'], 'FINISHED')
+        self.assertEqual(status['completed'], 2)
+
+        response = self.client.get(status['download'])
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename=method_results.tsv')
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        response.close()
+        self.assertEqual(lines[0].split('\t')[:2], ['Method Id', 'Source Method Identifier'])
+        self.assertEqual(sorted(line.split('\t')[1] for line in lines[1:]), ['M1', 'M3'])
+
+    def test_async_export_all_results(self):
+        response = self._post('category=A', {'export' : 'tsv', 'async' : '1'})
+        job = json.loads(response.content.decode('utf-8'))
+
+        self.assertEqual(self.client.get(job['status_url']).json()['completed'], 3)
+
+    def test_identical_exports_reused(self):
+        data = {'method_id' : ['1', '2'], 'export' : 'xlsx', 'async' : '1'}
+        job_id = json.loads(self._post('category=A', data).content.decode('utf-8'))['job_id']
+
+        self.assertEqual(json.loads(self._post('category=A', data).content.decode('utf-8'))['job_id'], job_id)
+        self.assertNotEqual(json.loads(self._post('category=B', data).content.decode('utf-8'))['job_id'], job_id)
+
+        # A change to the data makes a new export
+        bump_data_version()
+        self.assertNotEqual(json.loads(self._post('category=A', data).content.decode('utf-8'))['job_id'], job_id)
+
+    def test_stale_export_not_reused(self):
+        data = {'method_id' : ['1', '2'], 'export' : 'tsv', 'async' : '1'}
+        job_id = json.loads(self._post('category=A', data).content.decode('utf-8'))['job_id']
+
+        # A running job which has stopped advancing was lost with its process
+        updated = timezone.now() - datetime.timedelta(seconds=301)
+        BackgroundJob.objects.filter(job_id=job_id).update(status=BackgroundJob.RUNNING, updated=updated)
+        self.assertNotEqual(json.loads(self._post('category=A', data).content.decode('utf-8'))['job_id'], job_id)
+        self.assertEqual(BackgroundJob.objects.get(job_id=job_id).status, BackgroundJob.FAILED)
+
+    def test_invalid_export_type(self):
+        with self.assertRaises(Http404):
+            self._post('', {'method_id' : '1', 'export' : 'pdf', 'async' : '1'})
+
+
+class MethodResultsViewTestCase(TestCase):
+
+    def setUp(self):
+        for method_id in range(1, 8):
+            MethodSummaryFactory(method_id=method_id,
+                                 source_method_identifier='M%d' % (method_id % 3),
+                                 method_category='A',
+                                 method_subcategory='A1')
+        self.factory = RequestFactory()
+
+    def _get_json(self, params):
+        request = self.factory.get('/methods/method_results/', dict(params, format='json'))
+        response = MethodResultsView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode('utf-8'))
+
+    def test_json_pages_follow_cursor(self):
+        content = self._get_json({'category' : 'A', 'page_size' : 3})
+        self.assertEqual([r['method_id'] for r in content['results']], [3, 6, 1])
+
+        rows = content['results']
+        while content['next']:
+            query = content['next'].split('?', 1)[1]
+            request = self.factory.get('/methods/method_results/?' + query)
+            content = json.loads(MethodResultsView.as_view()(request).content.decode('utf-8'))
+            rows += content['results']
+
+        self.assertEqual([(r['source_method_identifier'], r['method_id']) for r in rows],
+                         [('M0', 3), ('M0', 6), ('M1', 1), ('M1', 4), ('M1', 7), ('M2', 2), ('M2', 5)])
+
+    def test_json_last_page(self):
+        content = self._get_json({'page_size' : 7})
+
+        self.assertEqual(len(content['results']), 7)
+        self.assertIsNone(content['next'])
+
+    def test_invalid_cursor(self):
+        request = self.factory.get('/methods/method_results/', {'format' : 'json', 'cursor' : 'bad'})
+        response = MethodResultsView.as_view()(request)
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_html_pages(self):
+        request = self.factory.get('/methods/method_results/', {'category' : 'A', 'page' : 2})
+        view = MethodResultsView.as_view(paginate_by=3)
+        response = view(request)
+
+        self.assertEqual(response.context_data['paginator'].count, 7)
+        self.assertEqual([m.method_id for m in response.context_data['data']], [4, 7, 2])
+        self.assertEqual(response.context_data['current_url'], '/methods/method_results/?category=A')
+        self.assertContains(response, 'Your search returned 7 results.')
+        self.assertContains(response, 'href="/methods/method_results/?category=A&page=3"')
+
+    def test_async_export_threshold(self):
+        request = self.factory.get('/methods/method_results/', {'category' : 'A'})
+        with self.settings(EXPORT_ASYNC_ROWS=5):
+            response = MethodResultsView.as_view(paginate_by=3)(request)
+
+        self.assertContains(response, 'var resultCount = 7;')
+        self.assertContains(response, 'var exportAsyncRows = 5;')
+
+    def _export_method_ids(self, query, data):
+        request = self.factory.post('/methods/export_results/?' + query, dict(data, export='tsv'))
+        response = ExportMethodResultsView.as_view()(request)
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        return sorted(int(line.split('\t')[0]) for line in lines[1:])
+
+    def test_export_all_results(self):
+        # Without a selection every result of the search is exported, not only those of the page shown
+        self.assertEqual(self._export_method_ids('category=A', {}), [1, 2, 3, 4, 5, 6, 7])
+        self.assertEqual(self._export_method_ids('category=B', {}), [])
+
+    def test_export_selected_results(self):
+        self.assertEqual(self._export_method_ids('category=A', {'method_id' : ['2', '5']}), [2, 5])
+
+    def test_xls_export_over_limit(self):
+        # The 7 results and their headings do not fit in an xls sheet of 7 rows, so an xlsx file is sent
+        view = ExportMethodResultsView.as_view(xls_max_rows=7)
+        # The download form of the results page only posts its csrf token when no results are checked
+        response = view(self.factory.post('/methods/export_results/?category=A', {'csrfmiddlewaretoken' : 'token'}))
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename=method_results.xlsx')
+        response.close()
+
+        response = view(self.factory.post('/methods/export_results/?category=A', {'method_id' : ['2', '5']}))
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename=method_results.xls')
+
+
+class AnalyteSelectViewTestCase(TestCase):
+
+    def setUp(self):
+        get_data_cache().clear()
+        _create_analyte_code('Total "nitrogen"', 'N')
+        _create_analyte_code('Nitrate', '14797-55-8')
+        AnalyteCodeVW.objects.create(analyte_analyte_id=1, analyte_analyte_code='14797-55-8', ac_analyte_name='Nitrate')
+        AnalyteCodeVW.objects.create(analyte_analyte_id=2, analyte_analyte_code='7727-37-9', ac_analyte_name='Nitrogen')
+        self.factory = RequestFactory()
+
+    def _get_values(self, params):
+        response = AnalyteSelectView.as_view()(self.factory.get('/methods/analyte_select/', params))
+        self.assertEqual(response['Content-Type'], 'application/json')
+        return json.loads(response.content.decode('utf-8'))['values_list']
+
+    def test_name_selection(self):
+        self.assertEqual(self._get_values({'kind' : 'name', 'selection' : 'nit'}),
+                         [['Nitrate', '14797-55-8'], ['Total "nitrogen"', 'N']])
+        self.assertEqual(self._get_values({'kind' : 'name', 'selection' : 'nit', 'limit' : 1}),
+                         [['Nitrate', '14797-55-8']])
+
+    def test_code_selection(self):
+        self.assertEqual(self._get_values({'kind' : 'code', 'selection' : '7'}), ['7727-37-9', '14797-55-8'])
+        self.assertEqual(self._get_values({'kind' : 'code', 'selection' : '-55'}), ['14797-55-8'])
+        self.assertEqual(self._get_values({'kind' : 'code', 'selection' : ''}), '')
+
+    def test_category_selection(self):
+        MethodAnalyteAllVW.objects.create(analyte_method_id=1, method_id=1, method_source_id=1, source_citation_id=1,
+                                          method_subcategory_id=1, analyte_id=1, method_category='PHYSICAL',
+                                          method_subcategory='A', analyte_name='Turbidity', analyte_code='TURB')
+
+        self.assertEqual(self._get_values({'kind' : 'name', 'category' : 'Physical'}), [['Turbidity', 'TURB']])
+
+
+@override_settings(ANALYTE_SELECT_INDEX=True)
+class AnalyteSelectViewIndexTestCase(AnalyteSelectViewTestCase):
+    '''Runs the AnalyteSelectView tests with the selections matched by the in-process indexes.'''
+
+
+class MethodSummaryViewPageCacheTestCase(TestCase):
+
+    def setUp(self):
+        get_data_cache().clear()
+        self.updated = datetime.date(2020, 3, 4)
+        MethodSummaryVW.objects.create(method_id=1,
+                                       revision_id=10,
+                                       method_source_id=1,
+                                       source_citation_id=1,
+                                       method_subcategory_id=1,
+                                       source_method_identifier='EPA 300.0')
+        RevisionSummaryVw.objects.create(revision_id=10,
+                                         method_id=1,
+                                         insert_date=self.updated,
+                                         last_update_date=self.updated,
+                                         pdf_insert_date=self.updated,
+                                         date_loaded=self.updated,
+                                         revision_flag=1)
+        self.factory = RequestFactory()
+
+    def _get(self, user=None, **headers):
+        request = self.factory.get('/methods/method_summary/1/', **headers)
+        request.user = user or AnonymousUser()
+        response = MethodSummaryView.as_view()(request, method_id=1)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    def test_cached_page(self):
+        response = self._get()
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'EPA 300.0')
+        self.assertEqual(response['Last-Modified'], 'Wed, 04 Mar 2020 00:00:00 GMT')
+
+        with self.assertNumQueries(2):
+            cached_response = self._get()
+        self.assertEqual(cached_response.content, response.content)
+        self.assertEqual(cached_response['ETag'], response['ETag'])
+
+    def test_not_modified(self):
+        etag = self._get()['ETag']
+
+        response = self._get(HTTP_IF_MODIFIED_SINCE='Thu, 05 Mar 2020 00:00:00 GMT')
+        self.assertEqual(response.status_code, 304)
+        response = self._get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self._get(HTTP_IF_MODIFIED_SINCE='Tue, 03 Mar 2020 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalidated(self):
+        etag = self._get()['ETag']
+
+        RevisionSummaryVw.objects.filter(revision_id=10).update(last_update_date=datetime.date(2020, 4, 1))
+        self.assertNotEqual(self._get()['ETag'], etag)
+
+        etag = self._get()['ETag']
+        bump_data_version()
+        self.assertNotEqual(self._get()['ETag'], etag)
+
+    def test_invalidated_by_method_update(self):
+        etag = self._get()['ETag']
+
+        Method.objects.create(method_id=1,
+                              source_method_identifier='EPA 300.0',
+                              method_official_name='name',
+                              brief_method_summary='summary',
+                              method_type=MethodTypeRef.objects.create(method_type_id=1, method_type_desc='type'),
+                              instrumentation=InstrumentationRef.objects.create(instrumentation_id=1,
+                                                                                instrumentation='instrumentation'),
+                              source_citation=SourceCitationRef.objects.create(source_citation_id=1),
+                              last_update_date=datetime.date(2020, 5, 6))
+        response = self._get()
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response['Last-Modified'], 'Wed, 06 May 2020 00:00:00 GMT')
+
+    def test_not_cached_for_authenticated_users(self):
+        user = User.objects.create_user('editor')
+        self._get()
+
+        response = self._get(user=user)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertContains(response, 'Edit Method')
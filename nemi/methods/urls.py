@@ -73,6 +73,9 @@ urlpatterns = [
     url(r'^method_count/$',
         views.MethodCountView.as_view(),
         name='methods-method_count'),
+    url(r'^facet_counts/$',
+        views.FacetCountsView.as_view(),
+        name='methods-facet_counts'),
     url(r'^media_name/$',
         views.MediaNameView.as_view(),
         name='methods-media_name'),
@@ -110,6 +113,9 @@ urlpatterns = [
         views.StatSpecialTopicsView.as_view(),
         name='methods-stat_special_topics'),
 
+    url(r'^wqp_batch/$',
+        views.WQPBatchProxyView.as_view(),
+        name='wqp_batch_proxy'),
     url(r'^wqp/(?P<op>[A-Za-z0-9-_/]*)/$',
         views.WQPWebProxyView.as_view(),
         name='wqp_proxy'),
@@ -118,4 +124,10 @@ urlpatterns = [
 router = routers.SimpleRouter()
 router.register(r'api/methods', views.MethodRestViewSet, 'method')
 
-api_urlpatterns = format_suffix_patterns(router.urls, allowed=['json', 'html'])
+# The dump url comes first so that it is not taken for a method id by the router.
+api_urlpatterns = [
+    url(r'^api/methods/dump/$',
+        views.MethodDumpView.as_view(),
+        name='methods-dump'),
+]
+api_urlpatterns += format_suffix_patterns(router.urls, allowed=['json', 'html'])
@@ -2,33 +2,56 @@
 NEMI methods pages.
 '''
 
+from collections import defaultdict
 from functools import cmp_to_key
+import hashlib
+import os
 import re
 
 from django.conf import settings
 from django.contrib.sites.shortcuts import get_current_site
 from django.core.paginator import Paginator, InvalidPage, EmptyPage
 from django.db import connection
-from django.db.models import Q
-from django.http import HttpResponse, Http404
-from django.urls import reverse_lazy
+from django.db.models import Count, Max, Q
+from django.db.models.functions import Upper
+from django.http import FileResponse, HttpRequest, HttpResponse, HttpResponseBadRequest, Http404, JsonResponse, \
+    QueryDict, StreamingHttpResponse
+from django.urls import reverse, reverse_lazy
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from django.views.generic import View, ListView, DetailView
 from django.views.generic.list import MultipleObjectMixin
 from django.views.generic.edit import TemplateResponseMixin
 
+from rest_framework.exceptions import ValidationError
 from rest_framework.viewsets import ReadOnlyModelViewSet
 
 # project specific packages
 from common.models import InstrumentationRef, StatisticalDesignObjective, StatisticalItemType, AnalyteSummaryVW
 from common.models import StatisticalAnalysisType, StatisticalSourceType, MediaNameDOM, StatisticalTopics
 from common.models import StatAnalysisRel, SourceCitationRef, StatDesignRel, StatMediaRel, StatTopicRel, Method
-from common.utils.view_utils import dictfetchall, xls_response, tsv_response
-from common.views import PdfView, ChoiceJsonView, SimpleWebProxyView
+from common.models import MethodAnalyteSearch
+from common.utils.cache import get_data_cache, versioned_key
+from common.utils.exports import EXPORT_CONTENT_TYPES, EXPORT_JOB_KIND, export_key, find_export_job, remove_old_exports, \
+    write_export
+from common.utils.jobs import submit_job
+from common.utils.pdf_cache import pdf_version
+from common.utils.view_utils import XLS_MAX_ROWS, dictfetchall, decode_cursor, encode_cursor, iter_rows, \
+    keyset_filter, xls_response, xlsx_response, tsv_response
+from common.views import BatchWebProxyView, CachedPageMixin, PdfView, ChoiceJsonView, SimpleWebProxyView
 
 from domhelp.views import FieldHelpMixin
 
-from .models import MethodVW, MethodSummaryVW, AnalyteCodeRel, MethodAnalyteAllVW, AnalyteCodeVW, RevisionSummaryVw, RegQueryVW
+from .analyte_index import get_analyte_index, query_analytes
+from .analyte_search import filter_analytes
+from .dump import dump_files, get_dump_files, iter_methods, ndjson_content, parse_since
+from .facets import get_facet_index
+from .keyword_search import get_keyword_search
+from .models import MethodVW, MethodSummaryVW, MethodAnalyteAllVW, AnalyteCodeVW, RevisionSummaryVw, RegQueryVW
+from .pagination import KeysetPagination
+from .results_index import IndexedResults, method_results
 from .serializers import MethodVWSerializer
+from .stat_matrix import get_stat_matrix
 
 
 def _analyte_value_qs(method_id):
@@ -51,6 +74,47 @@ def _analyte_value_qs(method_id):
                                'prec_acc_conc_used').distinct()
 
 
+def _analyte_synonyms(analyte_values):
+    ''' Returns a list of dictionaries, one for each row in analyte_values, with keys 'r' (the row)
+    and 'syn' (the list of synonym names for the row's analyte). An analyte's synonyms are all of the names in
+    AnalyteCodeVW which share an analyte code with a name or code matching the analyte, ignoring case.
+    The synonyms for every analyte are retrieved with a single query and grouped here.
+    '''
+    analyte_values = list(analyte_values)
+    if not analyte_values:
+        return []
+
+    names = set(r['analyte_name'].upper() for r in analyte_values)
+    codes = set(r['analyte_code'].upper() for r in analyte_values)
+
+    matching_codes = AnalyteCodeVW.objects.annotate(
+        upper_name=Upper('ac_analyte_name'),
+        upper_code=Upper('analyte_analyte_code')
+    ).filter(Q(upper_name__in=names) | Q(upper_code__in=codes)).values('analyte_analyte_code')
+    synonym_rows = list(AnalyteCodeVW.objects.filter(
+        analyte_analyte_code__in=matching_codes).order_by('ac_analyte_name').values_list('analyte_analyte_code', 'ac_analyte_name'))
+
+    # Map each upper cased name and each upper cased code to the analyte codes which it identifies and
+    # each analyte code to the positions of its rows, so that synonyms keep the query's name order.
+    codes_by_name = defaultdict(set)
+    codes_by_code = defaultdict(set)
+    positions_by_code = defaultdict(list)
+    for (position, (code, name)) in enumerate(synonym_rows):
+        if name:
+            codes_by_name[name.upper()].add(code)
+        codes_by_code[code.upper()].add(code)
+        positions_by_code[code].append(position)
+
+    result = []
+    for r in analyte_values:
+        analyte_codes = codes_by_name.get(r['analyte_name'].upper(), set()) | codes_by_code.get(r['analyte_code'].upper(), set())
+        positions = sorted(p for code in analyte_codes for p in positions_by_code[code])
+        result.append({'r' : r,
+                       'syn' : [synonym_rows[p][1] for p in positions]})
+
+    return result
+
+
 def _clean_name(name):
     ''' Returns name with characters removed or substituted to produce a name suitable
     to be saved as a file with an extension.
@@ -64,53 +128,67 @@ def _clean_name(name):
     return result
 
 
-def _clean_keyword(k):
-    ''' Returns keyword with quotes properly escaped and the keyword surrounded by brackets. T
+class AnalyteSelectView(View):
+    ''' Extends the standard view to implement a view which returns json data containing
+    a list of the matching analyte values in values_list key. At most limit values are returned, with
+    values starting with the selection first. Selections are matched using the in-process analyte indexes
+    when the ANALYTE_SELECT_INDEX setting is True and by querying the database otherwise.
     '''
-    double_pattern = re.compile(r'(?P<double>[\'\"])')
-    special_char_pattern = re.compile(r'(?P<special>[^a-zA-Z0-9\'\"])')
-    result = re.sub(special_char_pattern, r'\\\g<special>', k)
-    result = re.sub(double_pattern, r'\g<double>\g<double>', result)
 
-    return '%' + result + '%'
+    default_limit = 100
+    max_limit = 1000
 
+    def get_limit(self):
+        try:
+            limit = int(self.request.GET.get('limit', self.default_limit))
+        except ValueError:
+            limit = self.default_limit
+        return max(1, min(limit, self.max_limit))
 
-class AnalyteSelectView(View):
-    ''' Extends the standard view to implement a view which returns json data containing
-    a list of the matching analyte values in values_list key.
-    '''
+    def search(self, kind, selection):
+        '''Returns the list of values of kind, 'code' or 'name', which contain selection.'''
+        if settings.ANALYTE_SELECT_INDEX:
+            return get_analyte_index(kind).search(selection, self.get_limit())
+        return query_analytes(kind, selection, self.get_limit())
 
     def get(self, request, *args, **kwargs):
         if request.GET:
-            if request.GET['kind'] == 'code':
+            if request.GET.get('kind') == 'code':
                 if request.GET.get('selection', ''):
-                    qs = AnalyteCodeVW.objects.filter(
-                        analyte_analyte_code__icontains=request.GET['selection']).order_by('analyte_analyte_code').values_list('analyte_analyte_code',
-                                                                                                                               flat=True).distinct()
-                    qs_str = '[' + ', '.join('"%s"' % v for v in qs) + ']'
+                    values = self.search('code', request.GET['selection'])
                 else:
-                    return HttpResponse('{"values_list" : ""}', content_type="application/json")
+                    return JsonResponse({'values_list' : ''})
 
             else:
                 category = request.GET.get('category', '')
                 subcategory = request.GET.get('subcategory', '')
                 if category != '' and category != 'regulatory':
-                    qs = MethodAnalyteAllVW.objects.all().filter(method_category__iexact=category)
-                    if subcategory != '':
-                        qs = qs.filter(method_subcategory__iexact=subcategory)
+                    values = self.get_category_analytes(category, subcategory)
 
                 elif 'selection' in request.GET:
-                    qs = AnalyteCodeRel.objects.filter(analyte_name__icontains=request.GET['selection'])
+                    values = self.search('name', request.GET['selection'])
 
                 else:
-                    return HttpResponse('{"values_list" : ""}', content_type="application/json")
+                    return JsonResponse({'values_list' : ''})
 
-                qs = qs.values_list('analyte_name', 'analyte_code').distinct().order_by('analyte_name')
-                qs_str = '[' + ', '.join('["%s","%s"]' % (n, c) for (n, c) in qs) + ']'
+            return JsonResponse({'values_list' : values})
 
-            return HttpResponse('{"values_list" : ' + qs_str + '}', content_type="application/json")
+        return JsonResponse({'values_list' : ''})
 
-        return HttpResponse('{"values_list" : ""}', content_type="application/json")
+    def get_category_analytes(self, category, subcategory):
+        '''Returns a list of the [analyte name, analyte code] of the methods in category and subcategory.
+        The list is cached until the data version changes.
+        '''
+        cache = get_data_cache()
+        key = versioned_key('analyte_select', category.upper(), subcategory.upper())
+        values = cache.get(key)
+        if values is None:
+            qs = MethodAnalyteAllVW.objects.all().filter(method_category__iexact=category)
+            if subcategory != '':
+                qs = qs.filter(method_subcategory__iexact=subcategory)
+            values = [list(row) for row in qs.values_list('analyte_name', 'analyte_code').distinct().order_by('analyte_name')]
+            cache.set(key, values)
+        return values
 
 
 class MethodCountView(View):
@@ -122,10 +200,28 @@ class MethodCountView(View):
         return HttpResponse('{"method_count" : "' + str(MethodVW.objects.count()) + '"}', content_type="application/json")
 
 
+class FacetCountsView(View):
+    '''
+    Extends the standard View to return as a json object the number of methods matched by the method results
+    filters in the request and, for each filter, the number of methods each of its choices would give with
+    the other filters kept. The counts come from the in-process facet index, see methods.facets.
+    '''
+
+    def get(self, request, *args, **kwargs):
+        count, facet_counts = get_facet_index().counts(request.GET)
+        return JsonResponse({
+            'count' : count,
+            'facets' : dict((name, [{'value' : value, 'count' : choice_count} for value, choice_count in counts])
+                            for name, counts in facet_counts.items())
+        })
+
+
 class MediaNameView(ChoiceJsonView):
     '''
     Extends the ChoiceJsonView to retrieve the media names as a json object
     '''
+    cache_choices = True
+
     def get_choices(self, request, *args, **kwargs):
         return [(m[0], m[0].capitalize()) for m in MethodVW.objects.filter(media_name__isnull=False).values_list('media_name').distinct().order_by('media_name')]
 
@@ -134,6 +230,8 @@ class SourceView(ChoiceJsonView):
     '''
     Extends the standard view to retrieve the sources as a json object.
     '''
+    cache_choices = True
+
     def get_choices(self, request, *args, **kwargs):
 
         def _choice_cmp(a, b):
@@ -167,6 +265,8 @@ class InstrumentationView(ChoiceJsonView):
     '''
     Extends the ChoiceJsonView to retrieve the instrumentation choices as a json object.
     '''
+    cache_choices = True
+
     def get_choices(self, request, *args, **kwargs):
         qs = MethodVW.objects.values_list('instrumentation_id', 'instrumentation_description').distinct().order_by('instrumentation_description')
         return [(str(i_id), descr) for (i_id, descr) in qs]
@@ -176,6 +276,9 @@ class MethodTypeView(ChoiceJsonView):
     '''
     Extends the ChoiceJsonView to retrieve the method type choices as a json object.
     '''
+    cache_choices = True
+    cache_params = ('category',)
+
     def get_choices(self, request, *args, **kwargs):
         qs = MethodVW.objects.all()
         if 'category' in request.GET:
@@ -189,6 +292,9 @@ class SubcategoryView(ChoiceJsonView):
     Extends the ChoiceJsonView to retrieve the subcategory choices as a json object.
     The subcategory choices can be filtered by specifying a get parameter, 'category'.
     '''
+    cache_choices = True
+    cache_params = ('category',)
+
     def get_choices(self, request, *args, **kwargs):
         qs = MethodVW.objects.all()
         if 'category' in request.GET:
@@ -202,6 +308,8 @@ class GearTypeView(ChoiceJsonView):
     '''
     Extends the ChoiceJsonView to retrieve the gear type choices as a json object
     '''
+    cache_choices = True
+
     def get_choices(self, request, *args, **kwargs):
         qs = InstrumentationRef.objects.filter(instrumentation_id__range=(112, 121)).order_by('instrumentation_description').values_list('instrumentation_id', 'instrumentation_description')
         return [(str(i_id), i_descr) for (i_id, i_descr) in qs]
@@ -211,6 +319,7 @@ class StatObjectiveView(ChoiceJsonView):
     '''
     Extends the ChoiceJsonView to retrieve the statistical design objects as a json object.
     '''
+    cache_choices = True
 
     def get_choices(self, request, *args, **kwargs):
         return [(str(m.stat_design_index), m.objective) for m in StatisticalDesignObjective.objects.exclude(objective='Revisit')]
@@ -220,6 +329,8 @@ class StatItemTypeView(ChoiceJsonView):
     '''
     Extends the ChoiceJsonView to retrieve the statistical item type choices as a json object.
     '''
+    cache_choices = True
+
     def get_choices(self, request, *args, **kwargs):
         return [(str(m.stat_item_index), m.item) for m in StatisticalItemType.objects.all()]
 
@@ -228,6 +339,8 @@ class StatAnalysisTypeView(ChoiceJsonView):
     '''
     Extends the ChoiceJsonView to retrieve the statistical analysistype choices as a json object.
     '''
+    cache_choices = True
+
     def get_choices(self, request, *args, **kwargs):
         return [(str(m.stat_analysis_index), m.analysis_type) for m in StatisticalAnalysisType.objects.all()]
 
@@ -236,6 +349,8 @@ class ItemTypeView(ChoiceJsonView):
     '''
     Extends the ChoiceJsonView to retrieve the statistical item type choices as a json object.
     '''
+    cache_choices = True
+
     def get_choices(self, request, *args, **kwargs):
         return [(str(m.stat_item_index), m.item) for m in StatisticalItemType.objects.all()]
 
@@ -244,6 +359,8 @@ class StatSourceTypeView(ChoiceJsonView):
     '''
     Extends the ChoiceJsonView to retrieve the statistical source type choices as a json object.
     '''
+    cache_choices = True
+
     def get_choices(self, request, *args, **kwargs):
         return [(str(m.stat_source_index), m.source) for m in StatisticalSourceType.objects.all()]
 
@@ -252,6 +369,8 @@ class StatMediaNameView(ChoiceJsonView):
     '''
     Extends the ChoiceJsonView to retrieve the media name choices for statistical methodsas a json object.
     '''
+    cache_choices = True
+
     def get_choices(self, request, *args, **kwargs):
         return [(m.media_name, m.media_name.lower().title()) for m in MediaNameDOM.stat_media.all()]
 
@@ -260,6 +379,8 @@ class StatSpecialTopicsView(ChoiceJsonView):
     '''
     Extends the ChoiceJsonView to retrieve the statistical special topic choices as a json object.
     '''
+    cache_choices = True
+
     def get_choices(self, request, *args, **kwargs):
         return [(str(m.stat_topic_index), m.stat_special_topic) for m in StatisticalTopics.objects.all()]
 
@@ -272,6 +393,7 @@ class ResultsMixin(MultipleObjectMixin):
     '''
 
     context_object_name = 'data'
+    paginate_by = 200
 
     def get_queryset(self):
         data = self.queryset
@@ -300,62 +422,185 @@ class ResultsMixin(MultipleObjectMixin):
 class BaseResultsView(TemplateResponseMixin, View):
     '''
     Extends the standard View and TemplateResponse to implement the view which will return method
-    results while adding a context variable to be used to specify the page's export_url.
+    results while adding a context variable to be used to specify the page's export_url. Downloads of more
+    than export_async_rows rows are written by a background job.
     The view can be mixed with a child of ResultsMixin to implement method result page views or any
     mixin containing a get_queryset method and a get_context_data method.
+
+    Results are ordered by keyset_fields. When keyset_fields is specified, a request with format=json
+    returns a page of results as json. Pages are selected using the cursor parameter, which contains
+    the keyset_fields values of the last row of the previous page, rather than an offset.
     '''
 
     export_url = None  # # Optional - url which will be used to download the contents of the results page.
+    keyset_fields = ()  # Fields used to order the results. These should not be null and together should identify a row.
+    json_fields = None  # Fields returned in json pages. If None, get_queryset must return a values query set.
+    json_page_size = 100
+    json_max_page_size = 1000
 
     def get(self, request, *args, **kwargs):
-        self.object_list = self.get_queryset()
+        queryset = self.get_queryset()
+        if self.keyset_fields:
+            queryset = queryset.order_by(*self.keyset_fields)
+            if request.GET.get('format') == 'json':
+                return self.render_to_json_response(queryset)
+
+        self.object_list = queryset
         context = self.get_context_data(object_list=self.object_list)
         if self.export_url:
             context['export_url'] = self.export_url
+            context['export_async_rows'] = settings.EXPORT_ASYNC_ROWS
+        page_query = request.GET.copy()
+        page_query.pop(self.page_kwarg, None)
+        context['current_url'] = '%s?%s' % (request.path, page_query.urlencode())
         return self.render_to_response(context)
 
+    def get_json_page_size(self):
+        try:
+            page_size = int(self.request.GET.get('page_size', self.json_page_size))
+        except ValueError:
+            page_size = self.json_page_size
+        return max(1, min(page_size, self.json_max_page_size))
+
+    def seek(self, queryset, values):
+        '''Returns the rows of queryset which follow the row whose keyset_fields have values.'''
+        return queryset.filter(keyset_filter(self.keyset_fields, values))
+
+    def render_to_json_response(self, queryset):
+        '''Returns a json response containing the page of queryset following the row in the cursor parameter
+        and the url of the next page, which is null on the last page.
+        '''
+        if self.json_fields:
+            queryset = queryset.values(*self.json_fields)
+
+        cursor = self.request.GET.get('cursor')
+        if cursor:
+            try:
+                values = decode_cursor(cursor, len(self.keyset_fields))
+            except ValueError:
+                return HttpResponseBadRequest('Invalid cursor')
+            queryset = self.seek(queryset, values)
+
+        page_size = self.get_json_page_size()
+        rows = list(queryset[:page_size + 1])
+
+        next_url = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_query = self.request.GET.copy()
+            next_query['cursor'] = encode_cursor([rows[-1][field] for field in self.keyset_fields])
+            next_url = '%s?%s' % (self.request.path, next_query.urlencode())
+
+        return JsonResponse({'results' : rows, 'next' : next_url})
+
+
+def _export_job(progress, view_class, query_string, method_ids, summary_url, key, export_type):
+    '''A common.utils.jobs job function which writes the export of view_class for a request with query_string.'''
+    view = view_class()
+    view.request = HttpRequest()
+    view.request.GET = QueryDict(query_string)
+    fields, rows = view.get_export_rows(method_ids, summary_url)
+    headings = [name.replace('_', ' ').title() for name in fields]
+    numeric_columns = [fields.index(name) for name in view.numeric_fields]
+    return write_export(progress, key, export_type, view.filename, headings, rows, numeric_columns=numeric_columns)
+
 
 class ExportBaseResultsView(View):
     '''
     Extends the standard View to implement a view which returns downloads method results. The view
     can be mixed with a child of ResultsMixin to implement method result page download results or any
     mixin containing a get_queryset method.
+
+    The export contains the methods whose ids are posted in method_id. If no method_id is posted, it contains
+    all of the results of the search in the query string, not just those on the page shown. The export type is
+    posted in export and defaults to xls. An xls export with more rows than an xls sheet can hold is written as xlsx.
+
+    If the request contains async=1, the export is written by a background job and the response is the
+    json status of the job, which includes the url to poll for the job's status. Identical exports made
+    since the data last changed reuse the same job.
     '''
 
     export_fields = ()  # Note that both method id and link_to_method_summary (which is not in the model object) will get automatically added to the result set
     filename = None  # Download field name string.
     method_summary_url = ''  # Counldn't get reverse to work so passing it in as an attribute
+    numeric_fields = ()  # Fields in export_fields which hold numbers as strings. These are written as numeric cells in xlsx files.
+    xls_max_rows = XLS_MAX_ROWS  # Larger xls exports are written as xlsx files
+
+    def get_export_queryset(self, method_ids):
+        '''Returns the query set of the methods with method_ids, or of all of the results of the search if
+        method_ids is None.
+        '''
+        qs = self.get_queryset()
+        if method_ids is not None:
+            qs = qs.filter(method_id__in=method_ids)
+        return qs
+
+    def get_export_rows(self, method_ids, summary_url):
+        '''Returns the list of fields exported and an iterator over the export rows of the methods with
+        method_ids, or of all of the results of the search if method_ids is None. Each row ends with the link
+        to its method summary page.
+        '''
+        # Check to see if method id is in export_fields and add link_to_method_summary
+        fields = list(self.export_fields)
+        fields.insert(0, 'method_id')
+
+        vl_qs = self.get_export_queryset(method_ids).values_list(*fields)
+
+        # Generate the rows with the method summary url appended as they are read from the values query set
+        result_set = (list(obj) + [summary_url + str(obj[0]) + '/'] for obj in iter_rows(vl_qs))
+
+        fields.append('link_to_method_summary')
+        return fields, result_set
+
+    def async_export_response(self, export_type, method_ids, summary_url):
+        '''Returns the json status of the job which writes the export.'''
+        view_name = '%s.%s' % (self.__class__.__module__, self.__class__.__name__)
+        query_string = self.request.GET.urlencode()
+        key = export_key(view_name, export_type, summary_url, sorted(self.request.GET.lists()),
+                         sorted(set(method_ids)) if method_ids is not None else None)
+
+        job = find_export_job(key)
+        if job is None:
+            remove_old_exports()
+            job = submit_job(EXPORT_JOB_KIND, _export_job, self.__class__, query_string, method_ids, summary_url,
+                             key, export_type, key=key)
+
+        return JsonResponse({'job_id' : job.job_id,
+                             'status' : job.status,
+                             'status_url' : reverse('job_status', args=[job.job_id])},
+                            status=202)
 
     def post(self, request, *args, **kwargs):
         if request.POST:
-            # Check to see if method id is in export_fields and add link_to_method_summary
-            fields = list(self.export_fields)
-            fields.insert(0, 'method_id')
-
-            method_ids = self.request.POST.getlist('method_id', [])
-            vl_qs = self.get_queryset().filter(method_id__in=method_ids).values_list(*fields)
-
-            # Get list of method summary urls in same order as values query set
-            result_set = []
-            for obj in vl_qs:
-                this_list = list(obj)
-                # This is not the "right way to get the url". However reverse is causing wsgi/nemi to be added on deployment.
-                # For now I am using an attribute to set the method_summary url this.
-                this_list.append('https://' + get_current_site(request).domain + self.method_summary_url + str(this_list[0]) + '/')
-                result_set.append(this_list)
-
-            fields.append('link_to_method_summary')
+            # The methods selected on the results page. If none are selected, all of the results are exported.
+            method_ids = self.request.POST.getlist('method_id') or None
+
+            # This is not the "right way to get the url". However reverse is causing wsgi/nemi to be added on deployment.
+            # For now I am using an attribute to set the method_summary url this.
+            summary_url = 'https://' + get_current_site(request).domain + self.method_summary_url
+
+            export_type = kwargs.get('export', self.request.POST.get('export', 'xls'))
+            if export_type not in EXPORT_CONTENT_TYPES:
+                raise Http404
+            # An xls sheet can not hold more rows, which a download of all of the results can easily exceed
+            if export_type == 'xls' and self.get_export_queryset(method_ids).count() >= self.xls_max_rows:
+                export_type = 'xlsx'
+
+            if self.request.POST.get('async') == '1':
+                return self.async_export_response(export_type, method_ids, summary_url)
+
+            fields, result_set = self.get_export_rows(method_ids, summary_url)
             HEADINGS = [name.replace('_', ' ').title() for name in fields]
 
-            export_type = kwargs.get('export', 'xls')
             if export_type == 'tsv':
                 return tsv_response(HEADINGS, result_set, self.filename)
 
-            elif export_type == 'xls':
-                return xls_response(HEADINGS, result_set, self.filename)
+            elif export_type == 'xlsx':
+                numeric_columns = [fields.index(name) for name in self.numeric_fields]
+                return xlsx_response(HEADINGS, result_set, self.filename, numeric_columns=numeric_columns)
 
             else:
-                raise Http404
+                return xls_response(HEADINGS, result_set, self.filename)
         else:
             raise Http404
 
@@ -381,11 +626,25 @@ class MethodResultsMixin(ResultsMixin):
 
 class MethodResultsView(MethodResultsMixin, FieldHelpMixin, BaseResultsView):
     '''
-    Extends MethodResultsMixin and BaseResultsView to implement the method results page.
+    Extends MethodResultsMixin and BaseResultsView to implement the method results page. If the
+    METHOD_RESULTS_INDEX setting is True, the results are found with the in-process index in
+    methods.results_index and only the rows of the page shown are retrieved from the database.
     '''
 
     template_name = 'methods/method_results.html'
     export_url = reverse_lazy('methods-export_results')
+    keyset_fields = ('source_method_identifier', 'method_id')
+    json_fields = ('method_id',
+                   'source_method_identifier',
+                   'method_source',
+                   'method_descriptive_name',
+                   'method_subcategory',
+                   'instrumentation_description',
+                   'media_name',
+                   'method_category',
+                   'method_type_desc',
+                   'matrix',
+                   'relative_cost_symbol')
     field_names = ['source_method_identifier',
                    'method_source',
                    'method_descriptive_name',
@@ -397,6 +656,16 @@ class MethodResultsView(MethodResultsMixin, FieldHelpMixin, BaseResultsView):
                    'matrix',
                    'relative_cost_symbol']
 
+    def get_queryset(self):
+        if settings.METHOD_RESULTS_INDEX:
+            return method_results(self.request.GET, self.queryset)
+        return super(MethodResultsView, self).get_queryset()
+
+    def seek(self, queryset, values):
+        if isinstance(queryset, IndexedResults):
+            return queryset.after(values)
+        return super(MethodResultsView, self).seek(queryset, values)
+
 
 class ExportMethodResultsView(MethodResultsMixin, ExportBaseResultsView):
     '''
@@ -426,17 +695,20 @@ class AnalyteResultsMixin(ResultsMixin):
     '''
 
     queryset = MethodAnalyteAllVW.objects.all()
+    search_queryset = MethodAnalyteSearch.objects.all()  # Used instead of queryset when ANALYTE_SEARCH_TABLE is True
 
     def get_queryset(self):
+        use_search_table = settings.ANALYTE_SEARCH_TABLE
+        if use_search_table:
+            self.queryset = self.search_queryset
         data = super(AnalyteResultsMixin, self).get_queryset()
 
+        # Names and codes are matched exactly, ignoring case and differences in whitespace
         if 'analyte_name' in self.request.GET and self.request.GET.get('analyte_name'):
-            names = self.request.GET.getlist('analyte_name')
-            data = data.filter(analyte_name__iregex=r'(' + '|'.join(['^' + re.escape(n) + '$' for n in names]) + ')')
+            data = filter_analytes(data, 'analyte_name', self.request.GET.getlist('analyte_name'), use_search_table)
 
         elif 'analyte_code' in self.request.GET and self.request.GET.get('analyte_code'):
-            codes = self.request.GET.getlist('analyte_code')
-            data = data.filter(analyte_code__iregex=r'(' + '|'.join(['^' + re.escape(c) + '$' for c in codes]) + '$)')
+            data = filter_analytes(data, 'analyte_code', self.request.GET.getlist('analyte_code'), use_search_table)
 
         else:
             data = data.filter(preferred__exact=-1)  # Only get the method for the preferred analyte
@@ -492,6 +764,7 @@ class AnalyteResultsMixin(ResultsMixin):
             'assumptions_comments',
             'analyte_name',
             'analyte_code',
+            'analyte_method_id',
         ).distinct()
 
 
@@ -502,6 +775,8 @@ class AnalyteResultsView(AnalyteResultsMixin, FieldHelpMixin, BaseResultsView):
 
     template_name = 'methods/analyte_results.html'
     export_url = reverse_lazy('methods-export_analyte_results')
+    # The analyte columns can be null, so rows are ordered by the method and the view's key
+    keyset_fields = ('method_id', 'analyte_method_id')
 
     field_names = ['source_method_identifier',
                    'method_source',
@@ -554,6 +829,7 @@ class ExportAnalyteResultsView(AnalyteResultsMixin, ExportBaseResultsView):
                      'precision_descriptor_notes',
                      'relative_cost',
                      'relative_cost_symbol')
+    numeric_fields = ('sub_dl_value', 'sub_accuracy', 'sub_precision')
     method_summary_url = 'methods/method_summary/'
 
     filename = 'analyte_results'
@@ -569,6 +845,14 @@ class StatisticalResultsMixin(ResultsMixin):
     def get_queryset(self):
         data = super(StatisticalResultsMixin, self).get_queryset()
 
+        # The item_type, complexity, analysis_type, publication_source_type, study_objective, media_emphasized
+        # and special_topic filters are answered by the statistical method attribute matrix if it is enabled
+        if settings.STAT_MATRIX:
+            method_ids = get_stat_matrix().method_ids(self.request.GET)
+            if method_ids is not None:
+                data = data.filter(method_id__in=method_ids)
+            return data
+
         item_type = self.request.GET.get('item_type', '')
         complexity = self.request.GET.get('complexity', '')
         analysis_type = self.request.GET.get('analysis_type', '')
@@ -602,6 +886,14 @@ class StatisticalResultsView(StatisticalResultsMixin, FieldHelpMixin, BaseResult
 
     template_name = 'methods/statistical_results.html'
     export_url = reverse_lazy('methods-export_statistical_results')
+    keyset_fields = ('source_method_identifier', 'method_id')
+    json_fields = ('method_id',
+                   'source_method_identifier',
+                   'author',
+                   'method_official_name',
+                   'publication_year',
+                   'method_source',
+                   'link_to_full_method')
 
     field_names = ['author',
                    'title',
@@ -653,6 +945,7 @@ class RegulatoryResultsView(RegulatoryResultsMixin, FieldHelpMixin, BaseResultsV
 
     template_name = 'methods/regulatory_results.html'
     export_url = reverse_lazy('methods-export_regulatory_results')
+    paginate_by = None  # The page's download button exports the rows shown, so all of them are shown.
 
     field_names = ['regulation',
                    'reg_location',
@@ -698,8 +991,8 @@ class KeywordResultsView(TemplateResponseMixin, View):
 
     def get(self, request, *args, **kwargs):
         '''Returns the http response for the keyword search form. If the form is bound
-        validate the form and the execute a raw SQL query to return matching methods. The resulting
-        query set will be shown using pagination and in score order.
+        validate the form and then search for matching methods using the keyword search backend. The results
+        will be shown using pagination and in score order.
         '''
         if request.GET:
             # Form has been submitted.
@@ -712,23 +1005,8 @@ class KeywordResultsView(TemplateResponseMixin, View):
                 # Render a blank form
                 return self.render_to_response({'error' : True})
 
-            clean_keyword = _clean_keyword(keyword)
-
-            query = "SELECT DISTINCT MAX(score(1)) method_summary_score, mf.method_id, mf.source_method_identifier method_number, \
-mf.link_to_full_method, mf.mimetype, mf.method_official_name, mf.method_descriptive_name, mf.method_source, mf.method_category \
-FROM nemi_data.method_fact mf, nemi_data.revision_join rj \
-WHERE mf.revision_id = rj.revision_id (+) AND \
-(CONTAINS(mf.source_method_identifier, '" + clean_keyword + "', 1) > 0 \
-OR CONTAINS(rj.method_pdf, '" + clean_keyword + "', 2) > 0) \
-GROUP BY mf.method_id, mf.source_method_identifier, mf.link_to_full_method, mf.mimetype, mf.revision_id, mf.method_official_name, \
-mf.method_descriptive_name, mf.method_source, mf.method_category \
-ORDER BY method_summary_score desc;"
-
-            # Execute as raw query since  it uses a CONTAINS clause and context grammer.
-            cursor = connection.cursor()  # @UndefinedVariable
-            cursor.execute(query)
-            results_list = dictfetchall(cursor)
-            cursor.close()
+            # The backend returns a lazy sequence, so only the requested page is retrieved
+            results_list = get_keyword_search().search(keyword)
             paginator = Paginator(results_list, 20)
 
             try:
@@ -748,7 +1026,7 @@ ORDER BY method_summary_score desc;"
             return self.render_to_response({'keyword': keyword,
                                             'current_url' : current_url,
                                             'results' : results,
-                                            'total_found' : len(results_list)})
+                                            'total_found' : paginator.count})
 
         # Render a blank form
         return self.render_to_response({})
@@ -764,9 +1042,10 @@ class BrowseMethodsView(ListView):
     queryset = MethodVW.objects.order_by('method_category', 'method_subcategory', 'source_method_identifier')
 
 
-class MethodSummaryView(FieldHelpMixin, DetailView):
+class MethodSummaryView(CachedPageMixin, FieldHelpMixin, DetailView):
     '''
-    Extends the DetailView to provide the method summary view.
+    Extends the DetailView to provide the method summary view. The page is cached until one of the
+    method's revisions changes or the data version is bumped.
     '''
 
     template_name = 'methods/method_summary.html'
@@ -790,6 +1069,20 @@ class MethodSummaryView(FieldHelpMixin, DetailView):
                    'sample_prep_methods',
                    'archive_note']
 
+    def get_page_version(self):
+        revisions = RevisionSummaryVw.objects.filter(method_id=self.kwargs['method_id']).aggregate(
+            Max('revision_id'), Max('last_update_date'), Max('date_loaded'), Count('revision_id'))
+        if not revisions['revision_id__count']:
+            return None
+        # The method's own fields can be changed and published without a new revision
+        method_updated = Method.objects.filter(pk=self.kwargs['method_id']).values_list(
+            'last_update_date', flat=True).first()
+
+        dates = [d for d in (revisions['last_update_date__max'], revisions['date_loaded__max'], method_updated) if d]
+        return (max(dates) if dates else None,
+                '%s:%s:%s:%s' % (revisions['revision_id__count'], revisions['revision_id__max'],
+                                 revisions['last_update_date__max'], method_updated))
+
     def get_object(self):
         ''' Override get_object to return the method details, method analytes, and method notes.
         The returned object is a dictionary.
@@ -802,20 +1095,8 @@ class MethodSummaryView(FieldHelpMixin, DetailView):
             except MethodSummaryVW.DoesNotExist:
                 result['details'] = None
 
-            # Get associated analyted data
-            result['analytes'] = []
-
-            analyte_qs = _analyte_value_qs(self.kwargs['method_id'])
-            for r in analyte_qs:
-                name = r['analyte_name'].lower()
-                code = r['analyte_code'].lower()
-                inner_qs = AnalyteCodeVW.objects.filter(Q(ac_analyte_name__iexact=name) | Q(analyte_analyte_code__iexact=code)).values_list('analyte_analyte_code', flat=True).distinct()
-                qs = AnalyteCodeVW.objects.all().filter(analyte_analyte_code__in=inner_qs).order_by('ac_analyte_name').values('ac_analyte_name')
-                syn = []
-                for a in qs:
-                    syn.append(a['ac_analyte_name'])
-
-                result['analytes'].append({'r' : r, 'syn' : syn})
+            # Get associated analyted data along with each analyte's synonyms
+            result['analytes'] = _analyte_synonyms(_analyte_value_qs(self.kwargs['method_id']))
 
             # Get description notes
             result['notes'] = AnalyteSummaryVW.objects.filter(method_id__exact=self.kwargs['method_id']).values('precision_descriptor_notes', 'dl_note').distinct()
@@ -835,8 +1116,10 @@ class MethodSummaryView(FieldHelpMixin, DetailView):
         return context
 
 
-class StatisticalMethodSummaryView(FieldHelpMixin, DetailView):
-    ''' Extends DetailView to implement the Statistical Source Summary view'''
+class StatisticalMethodSummaryView(CachedPageMixin, FieldHelpMixin, DetailView):
+    ''' Extends DetailView to implement the Statistical Source Summary view. The page is cached until the
+    method changes or the data version is bumped.
+    '''
 
     template_name = 'methods/statistical_method_summary.html'
     model = Method
@@ -860,6 +1143,14 @@ class StatisticalMethodSummaryView(FieldHelpMixin, DetailView):
                    'media_subcategory',
                    'special_topics']
 
+    def get_page_version(self):
+        method = Method.objects.filter(pk=self.kwargs['pk']).values('last_update_date', 'approved_date').first()
+        if method is None:
+            return None
+
+        dates = [d for d in (method['last_update_date'], method['approved_date']) if d]
+        return (max(dates) if dates else None, '%s:%s' % (method['last_update_date'], method['approved_date']))
+
 
 class ExportMethodAnalyte(View):
     ''' Extends the standard view. This view creates a
@@ -883,50 +1174,44 @@ class ExportMethodAnalyte(View):
                         'Spiking Level')
             qs = _analyte_value_qs(kwargs['method_id'])
 
-            response = HttpResponse(content_type='text/tab-separated-values')
-            response['Content-Disposition'] = 'attachment; filename=%s_analytes.tsv' % kwargs['method_id']
-
-            response.write('\t'.join(HEADINGS))
-            response.write('\n')
-
-            for row in qs:
-                response.write('%s\t' % row['analyte_name'])
-
-                if row['dl_value'] == 999:
-                    response.write('N/A\t')
-                else:
-                    response.write('%.2f %s\t' % (row['dl_value'], row['dl_units']))
-
-                if row['accuracy'] == -999:
-                    response.write('N/A\t')
-                else:
-                    response.write('%d %s\t' % (row['accuracy'], row['accuracy_units']))
+            return tsv_response(HEADINGS, (self._export_row(row) for row in iter_rows(qs)), '%s_analytes' % kwargs['method_id'])
 
-                if row['precision'] == 999:
-                    response.write('N/A\t')
-                else:
-                    response.write('%.2f %s\t' % (row['precision'], row['precision_units']))
+    @staticmethod
+    def _export_row(row):
+        '''Returns the list of formatted column values written to the file for the analyte values row.'''
+        result = [row['analyte_name']]
 
-                if row['false_positive_value'] is None:
-                    response.write('\t')
+        if row['dl_value'] == 999:
+            result.append('N/A')
+        else:
+            result.append('%.2f %s' % (row['dl_value'], row['dl_units']))
 
-                else:
-                    response.write('%s\t' % row['false_positive_value'])
+        if row['accuracy'] == -999:
+            result.append('N/A')
+        else:
+            result.append('%d %s' % (row['accuracy'], row['accuracy_units']))
 
-                if row['false_negative_value'] is None:
-                    response.write('\t')
-                else:
-                    response.write('%s\t' % row['false_negative_value'])
+        if row['precision'] == 999:
+            result.append('N/A')
+        else:
+            result.append('%.2f %s' % (row['precision'], row['precision_units']))
 
+        if row['false_positive_value'] is None:
+            result.append('')
+        else:
+            result.append(row['false_positive_value'])
 
-                if row['prec_acc_conc_used']:
-                    response.write('%.2f %s\t' % (row['prec_acc_conc_used'], row['dl_units']))
-                else:
-                    response.write('\t')
+        if row['false_negative_value'] is None:
+            result.append('')
+        else:
+            result.append(row['false_negative_value'])
 
-                response.write('\n')
+        if row['prec_acc_conc_used']:
+            result.append('%.2f %s' % (row['prec_acc_conc_used'], row['dl_units']))
+        else:
+            result.append('')
 
-            return response
+        return result
 
 
 class MethodPdfView(PdfView):
@@ -936,13 +1221,20 @@ class MethodPdfView(PdfView):
 
     def get_pdf_info(self):
         cursor = connection.cursor()
-        cursor.execute('SELECT mimetype, method_pdf, source_method_identifier from nemi_data.method_summary_vw where method_id=%s',
+        cursor.execute('SELECT ms.mimetype, ms.method_pdf, ms.source_method_identifier, ms.revision_id, rs.pdf_insert_date, \
+rs.last_update_date, rs.date_loaded from nemi_data.method_summary_vw ms, nemi_data.revision_summary_vw rs \
+where ms.revision_id = rs.revision_id (+) and ms.method_id=%s',
                        [self.kwargs['method_id']])
         results_list = dictfetchall(cursor)
         if results_list:
             self.mimetype = results_list[0]['MIMETYPE']
-            self.pdf = results_list[0]['METHOD_PDF'].read()
+            self.pdf = results_list[0]['METHOD_PDF']
             self.filename = _clean_name(results_list[0]['SOURCE_METHOD_IDENTIFIER'])
+            # The method pdf is the pdf of its revision so they share a cache entry
+            if results_list[0]['REVISION_ID'] is not None:
+                self.cache_key = ('live', results_list[0]['REVISION_ID'])
+                self.cache_version = pdf_version(results_list[0]['PDF_INSERT_DATE'],
+                                                 results_list[0]['LAST_UPDATE_DATE'], results_list[0]['DATE_LOADED'])
 
         cursor.close()
 
@@ -953,13 +1245,17 @@ class RevisionPdfView(PdfView):
     '''
     def get_pdf_info(self):
         cursor = connection.cursor()
-        cursor.execute('SELECT mimetype, method_pdf, revision_information from nemi_data.revision_summary_vw where revision_id=%s', [self.kwargs['revision_id']])
+        cursor.execute('SELECT mimetype, method_pdf, revision_information, pdf_insert_date, last_update_date, date_loaded \
+from nemi_data.revision_summary_vw where revision_id=%s', [self.kwargs['revision_id']])
         results_list = dictfetchall(cursor)
 
         if results_list:
             self.mimetype = results_list[0]['MIMETYPE']
-            self.pdf = results_list[0]['METHOD_PDF'].read()
+            self.pdf = results_list[0]['METHOD_PDF']
             self.filename = self.kwargs['revision_id']
+            self.cache_key = ('live', int(self.kwargs['revision_id']))
+            self.cache_version = pdf_version(results_list[0]['PDF_INSERT_DATE'], results_list[0]['LAST_UPDATE_DATE'],
+                                             results_list[0]['DATE_LOADED'])
 
         cursor.close()
 
@@ -970,13 +1266,16 @@ class RevisionPdfOnlineView(PdfView):
     '''
     def get_pdf_info(self):
         cursor = connection.cursor()
-        cursor.execute('SELECT mimetype, method_pdf, revision_information from nemi_data.revision_join_online where revision_id=%s', [self.kwargs['revision_id']])
+        cursor.execute('SELECT mimetype, method_pdf, revision_information, pdf_insert_date, last_update_date \
+from nemi_data.revision_join_online where revision_id=%s', [self.kwargs['revision_id']])
         results_list = dictfetchall(cursor)
 
         if results_list:
             self.mimetype = results_list[0]['MIMETYPE']
-            self.pdf = results_list[0]['METHOD_PDF'].read()
+            self.pdf = results_list[0]['METHOD_PDF']
             self.filename = self.kwargs['revision_id']
+            self.cache_key = ('online', int(self.kwargs['revision_id']))
+            self.cache_version = pdf_version(results_list[0]['PDF_INSERT_DATE'], results_list[0]['LAST_UPDATE_DATE'])
 
         cursor.close()
 
@@ -987,25 +1286,77 @@ class RevisionPdfStagingView(PdfView):
     '''
     def get_pdf_info(self):
         cursor = connection.cursor()
-        cursor.execute('SELECT mimetype, method_pdf, revision_information from nemi_data.revision_join_stg where revision_id=%s', [self.kwargs['revision_id']])
+        cursor.execute('SELECT mimetype, method_pdf, revision_information, pdf_insert_date, last_update_date \
+from nemi_data.revision_join_stg where revision_id=%s', [self.kwargs['revision_id']])
         results_list = dictfetchall(cursor)
 
         if results_list:
             self.mimetype = results_list[0]['MIMETYPE']
-            self.pdf = results_list[0]['METHOD_PDF'].read()
+            self.pdf = results_list[0]['METHOD_PDF']
             self.filename = self.kwargs['revision_id']
+            self.cache_key = ('stg', int(self.kwargs['revision_id']))
+            self.cache_version = pdf_version(results_list[0]['PDF_INSERT_DATE'], results_list[0]['LAST_UPDATE_DATE'])
 
         cursor.close()
 
 
 class WQPWebProxyView(SimpleWebProxyView):
     service_url = settings.WQP_URL
+    cache_timeout = settings.WQP_CACHE_TIMEOUT
     http_method_names = ['head', 'get']
 
 
+class WQPBatchProxyView(BatchWebProxyView):
+    '''
+    Runs several WQP proxy operations in one request, for clients which need the counts of many searches. The
+    method summary page only makes one count request, a HEAD of Result/search which returns both the result and
+    site counts, so it uses WQPWebProxyView directly.
+    '''
+    proxy_view_class = WQPWebProxyView
+
+
 class MethodRestViewSet(ReadOnlyModelViewSet):
+    '''
+    Read only api for the methods. Lists are paginated by method_id with a cursor. The fields parameter, a comma
+    separated list of field names, selects the fields returned and only those columns are read. method_id is
+    always returned. Responses have an ETag which changes when the data version is bumped.
+    '''
     lookup_field = 'method_id'
     serializer_class = MethodVWSerializer
+    pagination_class = KeysetPagination
+
+    def get_fields(self):
+        '''Returns the list of fields requested by the fields parameter. Raises ValidationError for unknown fields.'''
+        names = [name.strip() for value in self.request.query_params.getlist('fields') for name in value.split(',') if name.strip()]
+        if not names:
+            return list(self.serializer_class.default_fields)
+
+        unknown = [name for name in names if name not in self.serializer_class.default_fields]
+        if unknown:
+            raise ValidationError({'fields' : 'Unknown fields: %s' % ', '.join(unknown)})
+        return ['method_id'] + [name for name in names if name != 'method_id']
+
+    def filter_queryset(self, queryset):
+        return queryset.values(*self.get_fields())
+
+    def get_etag(self, request):
+        key = versioned_key('api', request.get_full_path(), request.accepted_renderer.format)
+        return '"%s"' % hashlib.md5(key.encode('utf-8')).hexdigest()
+
+    def _conditional(self, handler, request, *args, **kwargs):
+        etag = self.get_etag(request)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code == 200:
+                response['ETag'] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(super(MethodRestViewSet, self).list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional(super(MethodRestViewSet, self).retrieve, request, *args, **kwargs)
 
     def get_queryset(self):
         qs = MethodVW.objects.all()
@@ -1019,3 +1370,56 @@ class MethodRestViewSet(ReadOnlyModelViewSet):
             qs = qs.filter(method_subcategory__in=subcategories)
 
         return qs
+
+
+class MethodDumpView(View):
+    '''
+    Serves the method catalogue as newline-delimited JSON, one method with its analytes and revisions per line,
+    see methods.dump. The full dump is sent from the files kept by methods.dump.dump_files. The since parameter,
+    a YYYY-MM-DD date, limits the dump to the methods loaded or revised on or after that date, which is streamed
+    from the database. If the gzip parameter is true the dump is gzipped.
+    '''
+
+    def get(self, request, *args, **kwargs):
+        since = request.GET.get('since')
+        if since:
+            try:
+                since = parse_since(since)
+            except ValueError:
+                return HttpResponseBadRequest('since must be a date formatted as YYYY-MM-DD')
+        else:
+            since = None
+        compress = request.GET.get('gzip', '').lower() in ('1', 'true', 'yes')
+
+        if since is None:
+            return self.dump_file_response(request, compress)
+
+        etag = '"%s"' % hashlib.md5(versioned_key('dump', request.get_full_path()).encode('utf-8')).hexdigest()
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            return response
+
+        if compress:
+            response = StreamingHttpResponse(ndjson_content(iter_methods(since), compress=True),
+                                             content_type='application/gzip')
+            response['Content-Disposition'] = 'attachment; filename=nemi_methods.ndjson.gz'
+        else:
+            response = StreamingHttpResponse(ndjson_content(iter_methods(since)),
+                                             content_type='application/x-ndjson')
+            response['Content-Disposition'] = 'attachment; filename=nemi_methods.ndjson'
+        response['ETag'] = etag
+        return response
+
+    def dump_file_response(self, request, compress):
+        manifest = get_dump_files()
+        etag = '"%s%s"' % (manifest['etag'], '-gzip' if compress else '')
+        last_modified = int(manifest['built'])
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            path = dump_files.dump_path(compress)
+            response = FileResponse(open(path, 'rb'),
+                                    content_type='application/gzip' if compress else 'application/x-ndjson')
+            response['Content-Disposition'] = 'attachment; filename=%s' % os.path.basename(path)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
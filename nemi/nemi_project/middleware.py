@@ -1,8 +1,15 @@
+from contextlib import ExitStack
+import os
 import re
+import time
 
 from django import http
+from django.conf import settings
+from django.db import connections
 from django.utils.deprecation import MiddlewareMixin
 
+from common.utils.metrics import request_metrics
+
 
 ACCESS_CONTROL_ALLOW_ORIGIN = 'Access-Control-Allow-Origin'
 ACCESS_CONTROL_EXPOSE_HEADERS = 'Access-Control-Expose-Headers'
@@ -62,3 +69,119 @@ class CorsMiddleware(MiddlewareMixin):
 
     def is_enabled(self, request):
             return re.match(CORS_URLS_REGEX, request.path_info)
+
+
+class _QueryTimer(object):
+    '''A database execute wrapper which counts the queries run and their total time.'''
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.time += time.perf_counter() - start
+
+
+class _CountedContent(object):
+    '''
+    Iterates over the chunks of a streaming response's content, counting its size. When the response is closed,
+    which the server does once the content is sent or the client goes away, on_close is called with the size.
+    '''
+
+    def __init__(self, content, on_close):
+        self.content = content
+        self.on_close = on_close
+        self.size = 0
+
+    def __iter__(self):
+        for chunk in self.content:
+            self.size += len(chunk)
+            yield chunk
+
+    def close(self):
+        if self.on_close is not None:
+            on_close, self.on_close = self.on_close, None
+            on_close(self.size)
+
+
+def _file_size(response):
+    '''Returns the size of a FileResponse's file from its Content-Length header or the file itself, or 0 if
+    neither is known.
+    '''
+    if response.has_header('Content-Length'):
+        return int(response['Content-Length'])
+    try:
+        return os.fstat(response.file_to_stream.fileno()).st_size
+    except (AttributeError, OSError, ValueError):
+        return 0
+
+
+class InstrumentationMiddleware(object):
+    '''
+    Records the number of database queries, the time spent in them, the template rendering time, the remaining
+    Python time and the response size of each request in common.utils.metrics.request_metrics, tagged with the
+    name of the url's view. Template rendering is timed for TemplateResponses. The queries of a streaming response,
+    such as a tsv export, run while its content is sent, so its metrics are recorded once the stream is closed.
+    If the INSTRUMENTATION_SERVER_TIMING setting is True, the times are also sent in a Server-Timing header, which
+    only covers the time before a streaming response's content is sent.
+    Place this first in MIDDLEWARE so that the time taken by the other middleware is included.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request._template_time = 0.0
+        timer = _QueryTimer()
+        start = time.perf_counter()
+        stack = ExitStack()
+        try:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        except BaseException:
+            stack.close()
+            raise
+        duration = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match is not None else '<unresolved>'
+
+        def record(response_bytes):
+            stack.close()
+            request_metrics.record(view_name, time.perf_counter() - start, timer.count, timer.time,
+                                   request._template_time)
+            request_metrics.add_response_bytes(view_name, response_bytes)
+
+        if getattr(response, 'file_to_stream', None) is not None:
+            # Wrapping a FileResponse's content would stop the server sending the file with wsgi.file_wrapper
+            record(_file_size(response))
+        elif response.streaming:
+            # The queries are counted until the stream is closed
+            response.streaming_content = _CountedContent(response.streaming_content, record)
+        else:
+            record(len(response.content))
+
+        if settings.INSTRUMENTATION_SERVER_TIMING:
+            response['Server-Timing'] = ', '.join([
+                'db;dur=%.1f;desc="%d queries"' % (timer.time * 1000, timer.count),
+                'tpl;dur=%.1f' % (request._template_time * 1000),
+                'app;dur=%.1f' % (max(duration - timer.time - request._template_time, 0) * 1000),
+                'total;dur=%.1f' % (duration * 1000),
+            ])
+        return response
+
+    def process_template_response(self, request, response):
+        # The response is rendered once the middleware's template response hooks have run
+        start = time.perf_counter()
+
+        def rendered(response):
+            request._template_time += time.perf_counter() - start
+
+        response.add_post_render_callback(rendered)
+        return response
@@ -1,5 +1,6 @@
 import os
 import sys
+import tempfile
 
 import dj_database_url
 
@@ -95,6 +96,7 @@ STATICFILES_FINDERS = (
 )
 
 MIDDLEWARE = (
+    'nemi_project.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'nemi_project.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -196,11 +198,113 @@ LOGGING = {
 
 SESSION_COOKIE_AGE = 28800  # In seconds, this is eight hours
 
+# The nemi_data cache holds data derived from the method catalogue, such as the search form choices.
+# Entries are invalidated by bumping the data version (see common.utils.cache) when methods are
+# published, archived, or approved. The version token expires after TIMEOUT seconds, so every
+# process picks up a new version, and rebuilds its in-process indexes, at least that often. This is
+# the only way a process sees a bump made by another process when the cache is not shared, as with
+# the per-process local-memory backend, or sees data loaded outside of the site. Set
+# NEMI_DATA_CACHE_DIR to share the cache, and so the version, between processes using the
+# file-based backend. NEMI_DATA_CACHE_TIMEOUT sets TIMEOUT.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'nemi_data': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'nemi_data',
+        'TIMEOUT': int(os.getenv('NEMI_DATA_CACHE_TIMEOUT', 3600)),
+    },
+}
+if os.getenv('NEMI_DATA_CACHE_DIR'):
+    CACHES['nemi_data'].update({
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('NEMI_DATA_CACHE_DIR'),
+    })
+DATA_CACHE_ALIAS = 'nemi_data'
+
+# Keyword search backend used by the keyword search page. The default uses the Oracle Text indexes.
+# To use the local BM25 index, set this to 'methods.keyword_search.LocalKeywordSearch' and build
+# the index at KEYWORD_INDEX_PATH with the build_keyword_index management command.
+KEYWORD_SEARCH_BACKEND = 'methods.keyword_search.OracleKeywordSearch'
+KEYWORD_INDEX_PATH = os.getenv('NEMI_KEYWORD_INDEX_PATH', os.path.join(SITE_HOME, 'keyword_index.seg'))
+
+# If True, the analyte name and code autocomplete requests are answered from the in-process indexes in
+# methods.analyte_index, which are rebuilt when the data version changes, rather than by querying the database.
+# As the version token expires after the nemi_data cache TIMEOUT, edits to the analyte tables made outside of
+# NEMI can take that long to appear in the autocomplete lists.
+ANALYTE_SELECT_INDEX = os.getenv('NEMI_ANALYTE_SELECT_INDEX', '').lower() in ('1', 'true')
+
+# If True, the default, the analyte results views query the denormalized analyte search table, whose indexed
+# analyte name and code keys are matched with IN, rather than method_analyte_all_vw, whose columns are matched with
+# a regular expression. The rows of methods published, archived or approved in NEMI are refreshed when they
+# change. Run the refresh_analyte_search management command after migrating and after loading data by other
+# means, such as a scheduled job following the nightly load.
+ANALYTE_SEARCH_TABLE = os.getenv('NEMI_ANALYTE_SEARCH_TABLE', 'true').lower() in ('1', 'true')
+
+# If True, the method results page finds the matching methods with the in-process index in
+# methods.results_index, which is rebuilt when the data version changes, and only retrieves the rows
+# of the page shown from the database.
+METHOD_RESULTS_INDEX = os.getenv('NEMI_METHOD_RESULTS_INDEX', '').lower() in ('1', 'true')
+
+# If True, the statistical results filters are answered by the in-process attribute matrix in
+# methods.stat_matrix, which is rebuilt when the data version changes, rather than by subqueries.
+STAT_MATRIX = os.getenv('NEMI_STAT_MATRIX', '').lower() in ('1', 'true')
+
+# Directory of the on-disk pdf cache (see common.utils.pdf_cache). The cache is disabled if this is not set.
+# PDF_CACHE_MAX_SIZE is the number of bytes of pdfs kept in the cache.
+PDF_CACHE_DIR = os.getenv('NEMI_PDF_CACHE_DIR')
+PDF_CACHE_MAX_SIZE = int(os.getenv('NEMI_PDF_CACHE_MAX_SIZE', 2 * 1024 * 1024 * 1024))
+
+# Long jobs, such as archiving methods from the admin, run on JOB_WORKERS threads of the process which
+# started them (see common.utils.jobs). If JOBS_RUN_EAGERLY is True, jobs run before the request returns.
+JOB_WORKERS = int(os.getenv('NEMI_JOB_WORKERS', 2))
+JOBS_RUN_EAGERLY = False
+
+# Exports requested with async=1 are written to EXPORT_DIR by a background job (see common.utils.exports).
+# Identical exports reuse a finished file for EXPORT_REUSE_TIMEOUT seconds. Files are removed after
+# EXPORT_KEEP_TIME seconds.
+EXPORT_DIR = os.getenv('NEMI_EXPORT_DIR', os.path.join(tempfile.gettempdir(), 'nemi_exports'))
+EXPORT_REUSE_TIMEOUT = int(os.getenv('NEMI_EXPORT_REUSE_TIMEOUT', 3600))
+# A pending or running export whose job has not been updated for this many seconds is taken to have been lost
+# with the process running it, and is not reused.
+EXPORT_STALE_TIMEOUT = int(os.getenv('NEMI_EXPORT_STALE_TIMEOUT', 300))
+EXPORT_KEEP_TIME = 24 * 60 * 60
+# The results pages request an async export when the download has more than this many rows.
+EXPORT_ASYNC_ROWS = int(os.getenv('NEMI_EXPORT_ASYNC_ROWS', 2000))
+
+# Directory of the static, gzipped sitemap files (see common.utils.sitemap_files). The files are rebuilt when
+# methods are published, archived or approved in NEMI, or when they are SITEMAP_MAX_AGE seconds old. Run the
+# build_sitemaps management command after loading data by other means to rebuild them at once.
+SITEMAP_DIR = os.getenv('NEMI_SITEMAP_DIR', os.path.join(tempfile.gettempdir(), 'nemi_sitemaps'))
+SITEMAP_MAX_AGE = int(os.getenv('NEMI_SITEMAP_MAX_AGE', 60 * 60))
+
+# Directory of the full method dump files served at api/methods/dump/ (see methods.dump). Once methods are
+# published, archived or approved in NEMI, or the files are DUMP_MAX_AGE seconds old, a background job rebuilds
+# them while the old files are still served. Run the dump_methods management command with --refresh after loading
+# data by other means, for example from the scheduled job following the nightly load.
+DUMP_DIR = os.getenv('NEMI_DUMP_DIR', os.path.join(tempfile.gettempdir(), 'nemi_dump'))
+DUMP_MAX_AGE = int(os.getenv('NEMI_DUMP_MAX_AGE', 60 * 60))
+
+# The request metrics recorded by nemi_project.middleware.InstrumentationMiddleware are served at /metrics
+# to the addresses in METRICS_ALLOWED_IPS. If INSTRUMENTATION_SERVER_TIMING is True, each response's
+# database, template and Python times are sent in a Server-Timing header.
+METRICS_ALLOWED_IPS = tuple(ip for ip in os.getenv('NEMI_METRICS_ALLOWED_IPS', '127.0.0.1').split(',') if ip)
+INSTRUMENTATION_SERVER_TIMING = os.getenv('NEMI_SERVER_TIMING', '').lower() in ('1', 'true')
+
 # NEMI specific setting. List of emails to send new account notifications to.
 NEW_ACCOUNT_NOTIFICATIONS = ADMINS
 
 # Water Quality Portal URL
 WQP_URL = "http://www.waterqualitydata.us"
+# Number of seconds the WQP proxy caches HEAD and count responses. Set to 0 to disable the cache.
+WQP_CACHE_TIMEOUT = int(os.getenv('NEMI_WQP_CACHE_TIMEOUT', 300))
+
+# Requests made to other services, such as the WQP, share a pool of connections (see common.utils.http).
+# HTTP_POOL_SIZE is the number of connections kept for each host. The timeouts are in seconds.
+HTTP_POOL_SIZE = 10
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_READ_TIMEOUT = 60
 
 # Code to be used for google analytics. If tracking is desired for a server,
 # set to the track code in local.py.
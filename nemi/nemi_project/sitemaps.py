@@ -1,33 +1,39 @@
-
-from django.contrib.sitemaps import Sitemap;
+from django.contrib.flatpages.sitemaps import FlatPageSitemap
+from django.contrib.sitemaps import Sitemap
+from django.urls import reverse
 
 from common.models import Method, SourceCitationRef
+from common.utils.sitemap_files import SitemapFiles
+
+# Items are (id, last update date) tuples so that only those columns are read
 
 class MethodSitemap(Sitemap):
 
     changefreq = 'monthly'
 
     def items(self):
-        return Method.objects.all().exclude(method_subcategory_id__in=[16, 17]).exclude(regs_only='Y')
+        return Method.objects.exclude(method_subcategory_id__in=[16, 17]).exclude(regs_only='Y').order_by(
+            'method_id').values_list('method_id', 'last_update_date')
 
     def location(self, obj):
-        return '/methods/method_summary/' + str(obj.method_id) + '/'
+        return '/methods/method_summary/' + str(obj[0]) + '/'
 
     def lastmod(self, obj):
-        return obj.last_update_date
+        return obj[1]
 
 
 class ProtocolSitemap(Sitemap):
     changefreq = 'monthly'
 
     def items(self):
-        return SourceCitationRef.protocol_objects.all()
+        return SourceCitationRef.protocol_objects.order_by('source_citation_id').values_list(
+            'source_citation_id', 'update_date')
 
     def location(self, obj):
-        return '/protocols/protocol_summary/' + str(obj.source_citation_id) + '/'
+        return '/protocols/protocol_summary/' + str(obj[0]) + '/'
 
     def lastmod(self, obj):
-        return obj.update_date
+        return obj[1]
 
 
 class StatisticalMethodSitemap(Sitemap):
@@ -35,13 +41,14 @@ class StatisticalMethodSitemap(Sitemap):
     changefreq = 'monthly'
 
     def items(self):
-        return Method.objects.all().filter(method_subcategory_id__in=[16, 17])
+        return Method.objects.filter(method_subcategory_id__in=[16, 17]).order_by('method_id').values_list(
+            'method_id', 'last_update_date')
 
     def location(self, obj):
-        return '/methods/sams_method_summary/' + str(obj.method_id) + '/'
+        return '/methods/sams_method_summary/' + str(obj[0]) + '/'
 
     def lastmod(self, obj):
-        return obj.last_update_date
+        return obj[1]
 
 class StaticSitemap(Sitemap):
 
@@ -51,3 +58,18 @@ class StaticSitemap(Sitemap):
     def location(self, item):
         return item
 
+
+SITEMAPS = {
+    'flatpages' : FlatPageSitemap,
+    'staticpages' : StaticSitemap,
+    'methods' : MethodSitemap,
+    'protocols' : ProtocolSitemap,
+    'statisticalmethods' : StatisticalMethodSitemap
+}
+
+sitemap_files = SitemapFiles(None, SITEMAPS, lambda name: reverse('sitemap_page', kwargs={'name' : name}))
+
+
+def expire_sitemaps(sender, **kwargs):
+    '''Receiver of common.signals.methods_changed which has the sitemap files rebuilt on their next request.'''
+    sitemap_files.expire()
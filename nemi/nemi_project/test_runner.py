@@ -22,6 +22,24 @@ def field_count(model_class):
     ])
 
 
+def table_models():
+    """
+    Returns a dictionary mapping each table to the model which is used to create
+    it. When more than one model shares a table, the model with more fields is
+    used.
+    """
+    models_by_table = defaultdict(list)
+    for model in apps.get_models(include_auto_created=True):
+        if model._meta.proxy:
+            continue
+        models_by_table[model._meta.db_table].append(model)
+
+    return dict(
+        (table, max(models, key=field_count))
+        for table, models in models_by_table.items()
+    )
+
+
 def get_test_runner(base_class):
     # I got this snippet from http://www.caktusgroup.com/blog/2010/09/24/simplifying-the-testing-of-unmanaged-database-models-in-django/
     class TestRunner(base_class):
@@ -34,17 +52,7 @@ def get_test_runner(base_class):
             # To handle the case where we have more than one unmanaged model per
             # table, treat the model with more fields as the "managed" version.
 
-            models_by_table = defaultdict(list)
-            for model in apps.get_models(include_auto_created=True):
-                if model._meta.proxy:
-                    continue
-                lst = models_by_table.setdefault(model._meta.db_table, [])
-                lst.append(model)
-
-            self.unmanaged_models = [
-                max(models, key=field_count)
-                for models in models_by_table.values()
-            ]
+            self.unmanaged_models = list(table_models().values())
             for m in self.unmanaged_models:
                 m._meta.managed = True
 
@@ -3,11 +3,10 @@
 from django.conf.urls import include, url
 from django.contrib import admin
 import django.contrib.auth.views
-from django.contrib.flatpages.sitemaps import FlatPageSitemap
 from django.contrib.flatpages.views import flatpage as flatpage_view
-from django.contrib.sitemaps.views import sitemap
 from django.views.generic import TemplateView
 
+import common.views
 import domhelp
 import methods.urls
 import protocols.urls
@@ -20,20 +19,18 @@ from . import views
 
 admin.autodiscover()
 
-sitemaps = {
-    'flatpages' : FlatPageSitemap,
-    'staticpages' : sitemaps.StaticSitemap,
-    'methods' : sitemaps.MethodSitemap,
-    'protocols' : sitemaps.ProtocolSitemap,
-    'statisticalmethods' : sitemaps.StatisticalMethodSitemap
-}
-
 urlpatterns = [
     url(r'^version/', views.version, {}, name='nemi_version'),
+    url(r'^metrics$', views.metrics, name='nemi_metrics'),
     url(r'^admin/', admin.site.urls),
     url(r'^method-submission/', method_admin.urls),
 
-    url(r'^sitemap\.xml$', sitemap, {'sitemaps': sitemaps}, name='django.contrib.sitemaps.views.sitemap'),
+    url(r'^sitemap\.xml$',
+        common.views.SitemapView.as_view(sitemap_files=sitemaps.sitemap_files),
+        name='sitemap_index'),
+    url(r'^sitemap-(?P<name>\w+-\d+)\.xml$',
+        common.views.SitemapView.as_view(sitemap_files=sitemaps.sitemap_files),
+        name='sitemap_page'),
     url(r'^robots\.txt$',
         TemplateView.as_view(template_name='robots.txt', content_type='text/plain')),
     url(r'^ie8_error/$',
@@ -66,6 +63,13 @@ urlpatterns = [
     url(r'^sams/', include(sams.urls)),
     # url(r'^memo/', include(memo.urls)),
 
+    url(r'^jobs/(?P<job_id>[0-9a-f]{32})/$',
+        common.views.JobStatusView.as_view(),
+        name='job_status'),
+    url(r'^jobs/(?P<job_id>[0-9a-f]{32})/download/$',
+        common.views.JobDownloadView.as_view(),
+        name='job_download'),
+
     url(r'^home/',
         views.HomeView.as_view(),
         name='home'),
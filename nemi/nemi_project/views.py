@@ -11,11 +11,12 @@ from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.models import User
 from django.core.mail import send_mail
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import Http404, HttpResponse, HttpResponseRedirect
 from django.urls import reverse
 from django.views.generic import TemplateView
 from django.views.generic.edit import CreateView, FormView
 
+from common.utils.metrics import request_metrics
 from domhelp.views import FieldHelpMixin
 from newsfeed.views import RecentNewsMixin
 
@@ -99,3 +100,12 @@ def version(request):
     return HttpResponse(json.dumps({
         'version': __version__
     }), content_type='application/json')
+
+
+def metrics(request):
+    '''Returns the request metrics in the Prometheus text format. Only clients whose address is in
+    METRICS_ALLOWED_IPS may read them.
+    '''
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    return HttpResponse(request_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
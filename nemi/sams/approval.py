@@ -0,0 +1,108 @@
+'''
+Approves statistical methods by copying them, along with their source citations and related rows, from the
+staging tables to the published tables. Any number of methods are approved in one transaction with a number of
+queries which does not grow with the number of methods.
+'''
+import datetime
+
+from django.db import transaction
+
+from common.models import SourceCitationRef, SourceCitationStgRef, PublicationSourceRel, PublicationSourceRelStg
+from common.models import Method, MethodStg
+from common.models import StatAnalysisRelStg, StatDesignRelStg, StatTopicRelStg, StatMediaRelStg
+from common.models import StatAnalysisRel, StatDesignRel, StatTopicRel, StatMediaRel
+from common.signals import methods_changed
+from common.utils.cache import bump_data_version
+
+# The source citation fields copied from staging. Other columns of an existing published citation are kept.
+SOURCE_CITATION_FIELDS = (
+    'source_citation', 'title', 'country', 'author', 'table_of_contents', 'publication_year',
+    'source_citation_name', 'link', 'item_type_id', 'item_type_note', 'sponser_type_note', 'insert_person_name',
+)
+
+# The method fields copied from staging
+METHOD_FIELDS = (
+    'method_subcategory_id', 'method_source_id', 'source_method_identifier', 'method_descriptive_name',
+    'method_official_name', 'brief_method_summary', 'link_to_full_method', 'insert_date', 'insert_person_name',
+    'method_type_id', 'notes', 'sam_complexity', 'level_of_training', 'media_emphasized_note', 'media_subcategory',
+    'instrumentation_id',
+)
+
+# The (published model, staging model, field) of each table related to a method, where field is copied
+METHOD_RELATIONS = (
+    (StatAnalysisRel, StatAnalysisRelStg, 'analysis_type_id'),
+    (StatDesignRel, StatDesignRelStg, 'design_objective_id'),
+    (StatTopicRel, StatTopicRelStg, 'topic_id'),
+    (StatMediaRel, StatMediaRelStg, 'media_name_id'),
+)
+
+
+def _upsert(model, objs, fields):
+    '''Inserts the objs which are not in model's table and updates fields of the ones which are.'''
+    existing = set(model.objects.filter(pk__in=[obj.pk for obj in objs]).values_list('pk', flat=True))
+    model.objects.bulk_create([obj for obj in objs if obj.pk not in existing])
+    updates = [obj for obj in objs if obj.pk in existing]
+    if updates:
+        model.objects.bulk_update(updates, fields)
+
+
+def approve_stat_methods(method_ids, username):
+    '''Approves the staged methods with method_ids, replacing any published copies, and returns the list of
+    approved Method objects. The methods' approved flags are set in the staging table, which is otherwise
+    unchanged. Raises SourceCitationStgRef.DoesNotExist if a method's source citation is not staged.
+    '''
+    today = datetime.date.today()
+    methods_stg = list(MethodStg.objects.filter(method_id__in=method_ids))
+    if not methods_stg:
+        return []
+
+    citation_ids = set(method_stg.source_citation_id for method_stg in methods_stg)
+    citations_stg = SourceCitationStgRef.objects.in_bulk(citation_ids)
+    if len(citations_stg) != len(citation_ids):
+        raise SourceCitationStgRef.DoesNotExist(
+            'Source citations %s are not staged' % sorted(citation_ids - set(citations_stg)))
+
+    citations = []
+    for citation_stg in citations_stg.values():
+        citation = SourceCitationRef(source_citation_id=citation_stg.source_citation_id, update_date=today,
+                                     **dict((field, getattr(citation_stg, field)) for field in SOURCE_CITATION_FIELDS))
+        citations.append(citation)
+
+    methods = []
+    for method_stg in methods_stg:
+        method = Method(method_id=method_stg.method_id,
+                        last_update_person_name=username,
+                        last_update_date=today,
+                        date_loaded=today,
+                        approved='Y',
+                        approved_date=today,
+                        source_citation_id=method_stg.source_citation_id,
+                        **dict((field, getattr(method_stg, field)) for field in METHOD_FIELDS))
+        methods.append(method)
+    approved_ids = [method.method_id for method in methods]
+
+    with transaction.atomic():
+        MethodStg.objects.filter(method_id__in=approved_ids).update(approved='Y', approved_date=today)
+
+        _upsert(SourceCitationRef, citations, SOURCE_CITATION_FIELDS + ('update_date',))
+        PublicationSourceRel.objects.filter(source_citation_ref_id__in=citation_ids).delete()
+        PublicationSourceRel.objects.bulk_create(
+            [PublicationSourceRel(source_citation_ref_id=citation_id, source_id=source_id)
+             for citation_id, source_id in PublicationSourceRelStg.objects.filter(
+                 source_citation_ref_id__in=citation_ids).order_by().values_list('source_citation_ref_id', 'source_id')])
+
+        _upsert(Method, methods, METHOD_FIELDS + ('last_update_person_name', 'last_update_date', 'date_loaded',
+                                                  'approved', 'approved_date', 'source_citation_id'))
+
+        # Replace the published related rows with the staged ones
+        for model, stg_model, field in METHOD_RELATIONS:
+            model.objects.filter(method_id__in=approved_ids).delete()
+            model.objects.bulk_create(
+                [model(method_id=method_id, **{field : value})
+                 for method_id, value in stg_model.objects.filter(
+                     method_id__in=approved_ids).order_by().values_list('method_id', field)])
+
+        transaction.on_commit(bump_data_version)
+        transaction.on_commit(lambda: methods_changed.send(sender=Method, method_ids=approved_ids))
+
+    return methods
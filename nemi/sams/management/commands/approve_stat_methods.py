@@ -0,0 +1,43 @@
+"""
+This command approves staged statistical methods, copying them to the
+published tables in a single transaction. Pass the method ids to approve or
+--all-pending to approve every statistical method which has not been approved.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from common.models import MethodStg, SourceCitationStgRef
+
+from ...approval import approve_stat_methods
+
+
+class Command(BaseCommand):
+    help = 'Copies staged statistical methods to the published tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('method_ids', nargs='*', type=int)
+        parser.add_argument(
+            '--all-pending', action='store_true',
+            help='Approve every statistical method whose approved flag is not Y.')
+        parser.add_argument(
+            '--username', default='approve_stat_methods',
+            help='The name recorded as the last person to update the methods.')
+
+    def handle(self, *args, **options):
+        methods = MethodStg.stat_methods.all()
+        if options['all_pending']:
+            methods = methods.exclude(approved='Y')
+        elif options['method_ids']:
+            methods = methods.filter(method_id__in=options['method_ids'])
+        else:
+            raise CommandError('Give the method ids to approve or --all-pending.')
+
+        method_ids = list(methods.values_list('method_id', flat=True))
+        missing = set(options['method_ids']) - set(method_ids)
+        if missing:
+            raise CommandError('%s are not staged statistical methods.' % ', '.join(str(i) for i in sorted(missing)))
+
+        try:
+            approved = approve_stat_methods(method_ids, options['username'])
+        except SourceCitationStgRef.DoesNotExist as e:
+            raise CommandError(str(e))
+        self.stdout.write('Approved %d statistical methods' % len(approved))
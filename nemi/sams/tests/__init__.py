@@ -1,12 +1,13 @@
 import unittest
 
-from . import test_views
+from . import test_views, test_approval
 
 
 def suite():
     suite1 = unittest.TestLoader().loadTestsFromModule(test_views)
+    suite2 = unittest.TestLoader().loadTestsFromModule(test_approval)
 
-    alltests = unittest.TestSuite([suite1])
+    alltests = unittest.TestSuite([suite1, suite2])
 
     return alltests
 
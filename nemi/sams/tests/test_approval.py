@@ -0,0 +1,147 @@
+import datetime
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from common.models import SourceCitationRef, SourceCitationStgRef, PublicationSourceRel, PublicationSourceRelStg
+from common.models import Method, MethodStg, StatisticalItemType
+from common.models import StatAnalysisRelStg, StatDesignRelStg, StatTopicRelStg, StatMediaRelStg
+from common.models import StatAnalysisRel, StatDesignRel, StatTopicRel, StatMediaRel
+from sams.approval import approve_stat_methods
+
+# The most queries which approving any number of methods may take
+APPROVAL_QUERY_BUDGET = 26
+
+
+class ApproveStatMethodsTestCase(TestCase):
+
+    fixtures = ['static_data.json',
+                'method_subcategory_ref.json',
+                'method_type_ref.json',
+                'method_source_ref.json',
+                'instrumentation_ref.json']
+
+    def setUp(self):
+        self.item_type = StatisticalItemType.objects.create(stat_item_index=100)
+
+    def _stage_method(self, method_id, citation_id):
+        citation = SourceCitationStgRef.objects.create(source_citation_id=citation_id,
+                                                       source_citation='SAMS-%d' % citation_id,
+                                                       source_citation_name='SAMS-%d' % citation_id,
+                                                       title='Title %d' % citation_id,
+                                                       item_type=self.item_type)
+        # The staged method's citation must also be published, as method_stg references source_citation_ref
+        SourceCitationRef.objects.get_or_create(source_citation_id=citation_id,
+                                                defaults={'source_citation' : 'Old', 'item_type' : self.item_type,
+                                                          'abstract_summary' : 'Kept'})
+        PublicationSourceRelStg.objects.create(source_citation_ref_id=citation_id, source_id=6)
+
+        method = MethodStg.objects.create(method_id=method_id,
+                                          source_method_identifier='SAMS M%d' % method_id,
+                                          method_official_name='SAMS Method %d' % method_id,
+                                          brief_method_summary='Summary %d' % method_id,
+                                          method_subcategory_id=16,
+                                          method_type_id=1,
+                                          method_source_id=91,
+                                          instrumentation_id=125,
+                                          source_citation_id=citation.source_citation_id,
+                                          date_loaded=datetime.date(2012, 1, 1))
+        StatAnalysisRelStg.objects.create(method_id=method_id, analysis_type_id=2)
+        StatDesignRelStg.objects.create(method_id=method_id, design_objective_id=4)
+        StatTopicRelStg.objects.create(method_id=method_id, topic_id=4)
+        StatMediaRelStg.objects.create(method_id=method_id, media_name_id='AGRICULTURAL PRODUCTS')
+        return method
+
+    def test_approve(self):
+        self._stage_method(1, 10)
+
+        methods = approve_stat_methods([1], 'user1')
+
+        self.assertEqual([method.method_id for method in methods], [1])
+        method = Method.objects.get(method_id=1)
+        self.assertEqual(method.method_official_name, 'SAMS Method 1')
+        self.assertEqual(method.approved, 'Y')
+        self.assertEqual(method.last_update_person_name, 'user1')
+        self.assertEqual(MethodStg.objects.get(method_id=1).approved, 'Y')
+
+        citation = SourceCitationRef.objects.get(source_citation_id=10)
+        self.assertEqual(citation.source_citation, 'SAMS-10')
+        self.assertEqual(citation.title, 'Title 10')
+        # Columns which are not staged are kept
+        self.assertEqual(citation.abstract_summary, 'Kept')
+
+        self.assertEqual(list(PublicationSourceRel.objects.filter(source_citation_ref_id=10).values_list('source_id', flat=True)), [6])
+        self.assertEqual(list(StatAnalysisRel.objects.filter(method_id=1).values_list('analysis_type_id', flat=True)), [2])
+        self.assertEqual(list(StatDesignRel.objects.filter(method_id=1).values_list('design_objective_id', flat=True)), [4])
+        self.assertEqual(list(StatTopicRel.objects.filter(method_id=1).values_list('topic_id', flat=True)), [4])
+        self.assertEqual(list(StatMediaRel.objects.filter(method_id=1).values_list('media_name_id', flat=True)),
+                         ['AGRICULTURAL PRODUCTS'])
+
+    def test_approve_replaces_published(self):
+        self._stage_method(1, 10)
+        approve_stat_methods([1], 'user1')
+
+        MethodStg.objects.filter(method_id=1).update(method_official_name='Renamed')
+        StatDesignRelStg.objects.filter(method_id=1).delete()
+        StatDesignRelStg.objects.create(method_id=1, design_objective_id=5)
+        StatDesignRelStg.objects.create(method_id=1, design_objective_id=6)
+        StatTopicRelStg.objects.filter(method_id=1).delete()
+
+        approve_stat_methods([1], 'user2')
+
+        method = Method.objects.get(method_id=1)
+        self.assertEqual(method.method_official_name, 'Renamed')
+        self.assertEqual(method.last_update_person_name, 'user2')
+        self.assertEqual(sorted(StatDesignRel.objects.filter(method_id=1).values_list('design_objective_id', flat=True)),
+                         [5, 6])
+        self.assertFalse(StatTopicRel.objects.filter(method_id=1).exists())
+        self.assertEqual(PublicationSourceRel.objects.filter(source_citation_ref_id=10).count(), 1)
+
+    def _assert_within_budget(self, method_ids):
+        with CaptureQueriesContext(connection) as queries:
+            methods = approve_stat_methods(method_ids, 'user1')
+        self.assertLessEqual(len(queries), APPROVAL_QUERY_BUDGET)
+        return methods
+
+    def test_query_budget(self):
+        self._stage_method(1, 10)
+        self._assert_within_budget([1])
+
+        # Approving more methods, both new and previously published, stays within the budget
+        for i in range(2, 7):
+            self._stage_method(i, 10 + i)
+        methods = self._assert_within_budget(range(1, 7))
+
+        self.assertEqual(len(methods), 6)
+        self.assertEqual(Method.objects.count(), 6)
+        self.assertEqual(StatAnalysisRel.objects.count(), 6)
+
+    def test_missing_citation(self):
+        self._stage_method(1, 10)
+        self._stage_method(2, 11)
+        SourceCitationStgRef.objects.filter(source_citation_id=11).delete()
+
+        with self.assertRaises(SourceCitationStgRef.DoesNotExist):
+            approve_stat_methods([1, 2], 'user1')
+
+        # Nothing is approved
+        self.assertFalse(Method.objects.exists())
+        self.assertFalse(MethodStg.objects.filter(approved='Y').exists())
+
+    def test_command(self):
+        self._stage_method(1, 10)
+        self._stage_method(2, 11)
+        MethodStg.objects.filter(method_id=2).update(approved='Y')
+
+        call_command('approve_stat_methods', all_pending=True, stdout=StringIO())
+        self.assertEqual(list(Method.objects.values_list('method_id', flat=True)), [1])
+
+        call_command('approve_stat_methods', 2, stdout=StringIO())
+        self.assertEqual(sorted(Method.objects.values_list('method_id', flat=True)), [1, 2])
+
+        with self.assertRaises(CommandError):
+            call_command('approve_stat_methods', 3, stdout=StringIO())
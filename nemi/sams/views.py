@@ -3,17 +3,17 @@ import datetime
 
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.db.models import Model
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
 from django.views.generic import ListView, DetailView, FormView, View, RedirectView
 from django.views.generic.edit import TemplateResponseMixin
 
-from common.models import SourceCitationRef, SourceCitationOnlineRef, SourceCitationStgRef, PublicationSourceRel, PublicationSourceRelStg
-from common.models import Method, MethodOnline, MethodSubcategoryRef, MethodTypeRef, MethodStg, InstrumentationRef
+from common.models import SourceCitationOnlineRef, SourceCitationStgRef, PublicationSourceRel, PublicationSourceRelStg
+from common.models import MethodOnline, MethodSubcategoryRef, MethodTypeRef, MethodStg, InstrumentationRef
 from common.models import StatAnalysisRelStg,  StatDesignRelStg, StatTopicRelStg, StatMediaRelStg
-from common.models import StatAnalysisRel, StatDesignRel, StatTopicRel, StatMediaRel
 
+from .approval import approve_stat_methods
 from .forms import StatMethodEditForm
 
 class StaffuserRequiredMixin(UserPassesTestMixin):
@@ -278,87 +278,17 @@ class ReviewStatMethodStgListView(StaffuserRequiredMixin, ListView):
 
 class ApproveStatMethod(StaffuserRequiredMixin, TemplateResponseMixin, View):
     ''' Extends the standard View to implement copying a method from MethodStg to the Method table.
-    Methods are not removed from MethodStg, but it's approved flag is set to 'Y'.
+    Methods are not removed from MethodStg, but it's approved flag is set to 'Y'. See sams.approval.
     '''
 
     template_name="sams/approve_method.html"
 
     def get(self, request, *args, **kwargs):
         method_stg = get_object_or_404(MethodStg, method_id=self.kwargs['pk'])
-        sc_stg = get_object_or_404(SourceCitationStgRef, source_citation_id=method_stg.source_citation_id)
-        today = datetime.date.today()
-
-        # Set approved flag to 'Y' and approved_date using update so that only those columns are updated
-        MethodStg.objects.filter(method_id=method_stg.method_id).update(approved='Y', approved_date=today)
-
-        # Copy method from SourceCitationStgRef/MethodStg to SourceCitationRef/Method
-        sc = SourceCitationRef(source_citation_id = sc_stg.source_citation_id,
-                               source_citation=sc_stg.source_citation,
-                               title=sc_stg.title,
-                               country=sc_stg.country,
-                               author=sc_stg.author,
-                               table_of_contents=sc_stg.table_of_contents,
-                               publication_year=sc_stg.publication_year,
-                               source_citation_name=sc_stg.source_citation_name,
-                               link=sc_stg.link,
-                               item_type=sc_stg.item_type,
-                               item_type_note=sc_stg.item_type_note,
-                               sponser_type_note=sc_stg.sponser_type_note,
-                               insert_person_name=sc_stg.insert_person_name)
-        sc.save()
-
-        #Update source citation relational table by clearing the table and then copy instances from *Stg table
-        PublicationSourceRel.objects.filter(source_citation_ref=sc).delete()
-        for t in PublicationSourceRelStg.objects.filter(source_citation_ref_id=sc_stg.source_citation_id):
-            PublicationSourceRel.objects.create(source_citation_ref=sc, source=t.source)
-
-        method = Method(method_id=method_stg.method_id,
-                        last_update_person_name=request.user.username,
-                        last_update_date=datetime.date.today(),
-                        date_loaded=today,
-                        approved='Y',
-                        approved_date=today,
-                        method_subcategory=method_stg.method_subcategory,
-                        method_source=method_stg.method_source,
-                        source_citation=sc,
-                        source_method_identifier=method_stg.source_method_identifier,
-                        method_descriptive_name=method_stg.method_descriptive_name,
-                        method_official_name=method_stg.method_official_name,
-                        brief_method_summary=method_stg.brief_method_summary,
-                        link_to_full_method=method_stg.link_to_full_method,
-                        insert_date=method_stg.insert_date,
-                        insert_person_name=method_stg.insert_person_name,
-                        method_type=method_stg.method_type,
-                        notes=method_stg.notes,
-                        sam_complexity=method_stg.sam_complexity,
-                        level_of_training=method_stg.level_of_training,
-                        media_emphasized_note=method_stg.media_emphasized_note,
-                        media_subcategory=method_stg.media_subcategory,
-                        instrumentation=method_stg.instrumentation
-                        )
-        method.save()
-
-        # First delete any instances that  currently exist in relational tables.
-        # Then copy instances for the method from the relational tables from *Stg to * tables.
-        StatAnalysisRel.objects.filter(method=method).delete()
-        for t in StatAnalysisRelStg.objects.filter(method_id=method_stg.method_id):
-            StatAnalysisRel.objects.create(method=method,
-                                           analysis_type=t.analysis_type)
-
-        StatDesignRel.objects.filter(method=method).delete()
-        for t in StatDesignRelStg.objects.filter(method_id=method_stg.method_id):
-            StatDesignRel.objects.create(method=method,
-                                         design_objective=t.design_objective)
-
-        StatTopicRel.objects.filter(method=method).delete()
-        for t in StatTopicRelStg.objects.filter(method_id=method_stg.method_id):
-            StatTopicRel.objects.create(method=method,
-                                        topic=t.topic)
-
-        StatMediaRel.objects.filter(method=method).delete()
-        for t in StatMediaRelStg.objects.filter(method_id=method_stg.method_id):
-            StatMediaRel.objects.create(method=method,
-                                        media_name=t.media_name)
+        try:
+            method = approve_stat_methods([method_stg.method_id], request.user.username)[0]
+        except SourceCitationStgRef.DoesNotExist:
+            raise Http404
 
         return self.render_to_response({'source_method_id' : method.source_method_identifier})
 